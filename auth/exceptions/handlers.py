@@ -1,10 +1,13 @@
 from rest_framework.views import exception_handler
 from rest_framework.response import Response
+from helpers.deadlines import deadline_error
 from .auth_exceptions import AccountLockedException, LoginFailedException
 
 
 def custom_auth_exception_handler(exc, context):
     """Custom exception handler for authentication exceptions"""
+    # Services wrap unexpected errors in their own 500s; a spent time budget stays a 504
+    exc = deadline_error(exc) or exc
     response = exception_handler(exc, context)
 
     if isinstance(exc, AccountLockedException):
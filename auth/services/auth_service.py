@@ -1,11 +1,11 @@
 from typing import Dict, Any, Optional, Union
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
-from django.core.cache import cache
 from django.http import HttpRequest
 
 from helpers.abstract import AbstractService
 from helpers.constants import MAX_LOGIN_ATTEMPTS, LOCKOUT_DURATION_SECONDS, LOCKOUT_DURATION_MINUTES
+from helpers.shared_store import get_shared_store
 from .email_service import send_alert_email
 from ..exceptions.auth_exceptions import (
     LoginValidationError, AccountLockedException, LoginFailedException,
@@ -19,8 +19,11 @@ logger = logging.getLogger(__name__)
 
 
 class AuthService(AbstractService):
-    
-    
+
+    def __init__(self):
+        # Shared across worker processes, unlike the default LocMem cache
+        self.store = get_shared_store()
+
     def get_client_ip(self,request: HttpRequest) -> str:
         """Get the client IP address from the request."""
         x_forwarded_for: Optional[str] = request.META.get('HTTP_X_FORWARDED_FOR')
@@ -41,12 +44,12 @@ class AuthService(AbstractService):
     def is_account_locked(self,username: str, ip_address: str) -> bool:
         """Check if account is locked due to too many failed attempts."""
         lockout_key: str = self.get_lockout_key(username, ip_address)
-        return cache.get(lockout_key) is not None
+        return self.store.get(lockout_key) is not None
 
     def get_remaining_lockout_time(self,username: str, ip_address: str) -> int:
         """Get remaining lockout time in seconds."""
         lockout_key: str = self.get_lockout_key(username, ip_address)
-        ttl: Optional[int] = cache.ttl(lockout_key)
+        ttl: Optional[int] = self.store.ttl(lockout_key)
         return max(0, ttl) if ttl else 0
 
     def increment_failed_attempts(self,username: str, ip_address: str) -> bool:
@@ -54,16 +57,12 @@ class AuthService(AbstractService):
         attempts_key: str = self.get_failed_attempts_key(username, ip_address)
         lockout_key: str = self.get_lockout_key(username, ip_address)
 
-        # Get current attempts count
-        attempts: int = cache.get(attempts_key, 0)
-        attempts += 1
-
-        # Store attempts count with expiration
-        cache.set(attempts_key, attempts, timeout=LOCKOUT_DURATION_SECONDS)
+        # Atomically increment attempts count and refresh its expiration
+        attempts: int = self.store.incr(attempts_key, ttl=LOCKOUT_DURATION_SECONDS)
 
         # If threshold reached, lock the account
         if attempts >= MAX_LOGIN_ATTEMPTS:
-            cache.set(lockout_key, True, timeout=LOCKOUT_DURATION_SECONDS)
+            self.store.set(lockout_key, 1, ttl=LOCKOUT_DURATION_SECONDS)
             return True  # Account is now locked
 
         return False  # Account not locked yet
@@ -72,13 +71,12 @@ class AuthService(AbstractService):
         """Reset failed login attempts on successful login."""
         attempts_key: str = self.get_failed_attempts_key(username, ip_address)
         lockout_key: str = self.get_lockout_key(username, ip_address)
-        cache.delete(attempts_key)
-        cache.delete(lockout_key)
+        self.store.delete(attempts_key, lockout_key)
 
     def get_failed_attempts_count(self,username: str, ip_address: str) -> int:
         """Get current failed login attempts count."""
         attempts_key: str = self.get_failed_attempts_key(username, ip_address)
-        return cache.get(attempts_key, 0)
+        return self.store.get(attempts_key) or 0
 
     def validate_login_data(self,username: Optional[str], password: Optional[str]) -> None:
         """Validate login credentials - raises exception if invalid."""
@@ -169,7 +167,8 @@ class AuthService(AbstractService):
 
     def perform_registration_login(self,request: HttpRequest, user: User) -> None:
         """Log in user after successful registration."""
-        login(request, user)
+        # Not authenticated through a backend, so name the one the session should use
+        login(request, user, backend='auth.backends.ProfileModelBackend')
         request.session.set_expiry(1800)
 
     def validate_alert_email_data(self,data: Dict[str, Any]) -> Dict[str, Union[str, float]]:
@@ -1,22 +1,47 @@
-import requests
 import logging
+from helpers import upstream
 
 logger = logging.getLogger(__name__)
 
 
-def send_alert_email(user_email, crypto_name, symbol, condition, target_price, current_price):
+def describe_condition(condition, target_price, period=None, observed=None):
+    """
+    (condition line, observed value line or None) for an alert email. For
+    indicator alerts `target_price` is the threshold (percent or RSI level)
+    and `observed` the indicator value that met it.
+    """
+    direction = "над" if "above" in condition else "под"
+    period = period or 1
+
+    if condition in ('pct_above', 'pct_below'):
+        movement = "Раст" if condition == 'pct_above' else "Пад"
+        text = f"{movement} од {abs(target_price):,.2f}% за {period} свеќи"
+        value = f"Промена: {observed:+,.2f}%" if observed is not None else None
+    elif condition in ('ma_cross_above', 'ma_cross_below'):
+        text = f"Цената преминува {direction} MA({period})"
+        value = f"MA({period}): ${observed:,.2f}" if observed is not None else None
+    elif condition in ('rsi_above', 'rsi_below'):
+        text = f"RSI({period}) {direction} {target_price:,.2f}"
+        value = f"RSI({period}): {observed:,.2f}" if observed is not None else None
+    else:
+        text = f"Цена {direction} ${target_price:,.2f}"
+        value = None
+    return text, value
+
+
+def send_alert_email(user_email, crypto_name, symbol, condition, target_price, current_price, period=None, observed=None):
     """
     Send an email notification via the Notification Microservice.
+    `period` and `observed` describe indicator alerts (see describe_condition).
     """
     if not user_email or not user_email.strip():
         logger.error(f"Cannot send alert email: user email is empty or None")
         return False
 
-    # Notification Service URL
-    SERVICE_URL = "http://localhost:8004/send-email"
-
     try:
-        condition_text = "над" if condition == "above" else "под"
+        condition_text, observed_text = describe_condition(condition, target_price, period, observed)
+        observed_line = f"{observed_text}\n" if observed_text else ""
+        observed_html = f'<p style="margin: 5px 0;"><strong>{observed_text}</strong></p>' if observed_text else ""
         subject = f'🔔 Предупредување за цена: {crypto_name} ({symbol})'
 
         message = f'''Здраво,
@@ -24,8 +49,8 @@ def send_alert_email(user_email, crypto_name, symbol, condition, target_price, c
 Вашето предупредување за цена е активирано!
 
 Криптовалута: {crypto_name} ({symbol})
-Услов: Цена {condition_text} ${target_price:,.2f}
-Тековна цена: ${current_price:,.2f}
+Услов: {condition_text}
+{observed_line}Тековна цена: ${current_price:,.2f}
 
 Ова е автоматска нотификација од вашата Crypto Dashboard апликација.
 
@@ -46,7 +71,8 @@ Crypto Dashboard Тим
                     
                     <div style="background-color: #f0f9ff; border-left: 4px solid #3b82f6; padding: 15px; margin: 20px 0;">
                         <p style="margin: 5px 0;"><strong>Криптовалута:</strong> {crypto_name} ({symbol})</p>
-                        <p style="margin: 5px 0;"><strong>Услов:</strong> Цена {condition_text} ${target_price:,.2f}</p>
+                        <p style="margin: 5px 0;"><strong>Услов:</strong> {condition_text}</p>
+                        {observed_html}
                         <p style="margin: 5px 0;"><strong>Тековна цена:</strong> <span style="color: #3b82f6; font-size: 18px; font-weight: bold;">${current_price:,.2f}</span></p>
                     </div>
                     
@@ -66,7 +92,7 @@ Crypto Dashboard Тим
             "is_html": True
         }
 
-        response = requests.post(SERVICE_URL, json=payload)
+        response = upstream.post("notification", "/send-email", json=payload)
 
         if response.status_code == 200:
             logger.info(f"Alert email sent successfully via microservice to {user_email}")
@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+
+from django.contrib.auth.models import User
+from django.http import HttpRequest
+
+from auth.serializers import UserSerializer
+from helpers.metrics import CACHE_REQUESTS
+from helpers.shared_store import get_shared_store
+
+# Local entries must expire well before the shared version counter can,
+# otherwise a counter that expired and restarted could revalidate stale data
+LOCAL_TTL_SECONDS = 300
+VERSION_TTL_SECONDS = 24 * 60 * 60
+MAX_ENTRIES = 10000
+
+
+class UserPayloadCache:
+    """
+    Per-process cache of serialized user payloads (UserSerializer output).
+
+    Each user has a version counter in the shared store; invalidating bumps it,
+    which makes every worker process re-serialize on its next read. A hit costs
+    one shared-store lookup and no ORM queries.
+
+    An entry is only ever built from a user row loaded after its version was
+    read, so a change committed in between is always followed by a newer
+    version. The user passed in (request.user, loaded during authentication)
+    may predate that read, so a miss loads the row again.
+    """
+
+    def __init__(self):
+        self.store = get_shared_store()
+        self._entries: "OrderedDict[Tuple[int, str], Tuple[float, int, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _version_key(self, user_id: int) -> str:
+        return f'user_payload_version_{user_id}'
+
+    def get(self, user: User, request: HttpRequest) -> Dict[str, Any]:
+        """Get the serialized payload for a user, serializing on a miss"""
+        # avatar_url is absolute, so the payload depends on the host it was built for
+        key = (user.pk, request.build_absolute_uri('/'))
+        version = self.store.get(self._version_key(user.pk)) or 0
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] == version and now - entry[0] < LOCAL_TTL_SECONDS:
+                self._entries.move_to_end(key)
+                CACHE_REQUESTS.labels('user_payload', 'hit').inc()
+                return entry[2]
+
+        CACHE_REQUESTS.labels('user_payload', 'miss').inc()
+        fresh = User.objects.select_related("profile").filter(pk=user.pk).first() or user
+        payload = UserSerializer(fresh, context={'request': request}).data
+        with self._lock:
+            self._entries[key] = (now, version, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > MAX_ENTRIES:
+                self._entries.popitem(last=False)
+        return payload
+
+    def invalidate(self, user_id: int) -> None:
+        """Drop a user's payload in every process"""
+        self.store.incr(self._version_key(user_id), ttl=VERSION_TTL_SECONDS)
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == user_id]:
+                del self._entries[key]
+
+
+user_payload_cache = UserPayloadCache()
+
+
+def get_user_payload_cache() -> UserPayloadCache:
+    """Return the process-wide UserPayloadCache instance."""
+    return user_payload_cache
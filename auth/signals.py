@@ -1,12 +1,24 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 from auth.models import UserProfile
+from auth.services.user_payload_cache import get_user_payload_cache
 
 
 @receiver(post_save, sender=User)
 def create_or_update_user_profile(sender, instance, created, **kwargs):
     if created:
         UserProfile.objects.create(user=instance)
-    else:
-        UserProfile.objects.get_or_create(user=instance)
+    invalidate_on_commit(instance.pk)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def invalidate_user_payload(sender, instance, **kwargs):
+    invalidate_on_commit(instance.user_id)
+
+
+def invalidate_on_commit(user_id):
+    # Invalidating before the commit would let a concurrent reader cache the old rows again
+    transaction.on_commit(lambda: get_user_payload_cache().invalidate(user_id))
@@ -1,3 +1,101 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from dataclasses import replace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from auth.services.user_payload_cache import UserPayloadCache
+from auth.urls import urlpatterns
+from helpers.testing import EndpointCase, QueryBudgetMixin, TEST_PASSWORD
+from helpers.throttling import SharedScopedRateThrottle
+
+# 1x1 transparent GIF
+AVATAR_BYTES = b"GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04\x01\x00\x00\x00\x00,\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;"
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class AuthQueryBudgetTests(QueryBudgetMixin, TestCase):
+    urlpatterns = urlpatterns
+    cases = [
+        EndpointCase("register", "POST", "/api/auth/register/", max_queries=13, max_scans=1, authenticated=False,
+                     status=201,
+                     data={"username": "newuser", "email": "new@example.com",
+                           "password": TEST_PASSWORD, "password_confirm": TEST_PASSWORD}),
+        EndpointCase("login", "POST", "/api/auth/login/", max_queries=10, authenticated=False,
+                     data={"username": "budget", "password": TEST_PASSWORD}),
+        EndpointCase("logout", "POST", "/api/auth/logout/", max_queries=4),
+        EndpointCase("session", "GET", "/api/auth/session/", max_queries=2),
+        EndpointCase("csrf", "GET", "/api/auth/csrf/", max_queries=0, authenticated=False),
+        # The notification microservice is offline in tests
+        EndpointCase("send_alert_email", "POST", "/api/send-alert-email/", max_queries=0,
+                     authenticated=False, status=500,
+                     data={"email": "budget@example.com", "crypto": "Bitcoin", "symbol": "BTC",
+                           "condition": "above", "target_price": 1, "current_price": 2}),
+        EndpointCase("upload-avatar", "POST", "/api/profile/upload-avatar/", max_queries=4,
+                     format="multipart", data={}),
+        EndpointCase("profile_me", "GET", "/api/profile/me/", max_queries=2),
+        EndpointCase("profile_me", "PUT", "/api/profile/me/", max_queries=3,
+                     data={"first_name": "Budget"}),
+    ]
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def request(self, client, case):
+        if case.url_name == "upload-avatar":
+            case = replace(case, data={"avatar": SimpleUploadedFile("avatar.gif", AVATAR_BYTES, content_type="image/gif")})
+        return super().request(client, case)
+
+
+class AuthThrottleTests(TestCase):
+    # Its own client address, so other tests' logins don't count against it
+    REMOTE_ADDR = "198.51.100.7"
+
+    def post(self, path, data):
+        return APIClient().post(path, data, format="json", secure=True, REMOTE_ADDR=self.REMOTE_ADDR)
+
+    def test_login_and_register_share_the_auth_limit(self):
+        with mock.patch.object(SharedScopedRateThrottle, "THROTTLE_RATES", {"auth": "2/min"}):
+            login = {"username": "nobody", "password": TEST_PASSWORD}
+            self.assertEqual(self.post("/api/auth/login/", login).status_code, 401)
+            self.assertEqual(self.post("/api/auth/register/", {"username": "throttled"}).status_code, 400)
+
+            for path, data in (("/api/auth/login/", login), ("/api/auth/register/", {})):
+                with self.subTest(path=path):
+                    response = self.post(path, data)
+                    self.assertEqual(response.status_code, 429)
+                    self.assertTrue(0 < int(response["Retry-After"]) <= 60)
+
+
+class UserPayloadCacheTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("cached", first_name="Old")
+        self.request = RequestFactory().get("/")
+        self.cache = UserPayloadCache()
+
+    def rename(self, first_name):
+        User.objects.filter(pk=self.user.pk).update(first_name=first_name)
+        # What the post_save signal does once the change commits
+        self.cache.invalidate(self.user.pk)
+
+    def test_hit_costs_no_queries(self):
+        self.assertEqual(self.cache.get(self.user, self.request)["first_name"], "Old")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.cache.get(self.user, self.request)["first_name"], "Old")
+
+    def test_change_after_the_user_was_loaded_is_not_cached_as_current(self):
+        # request.user is loaded before the change commits and the version is bumped
+        stale = User.objects.get(pk=self.user.pk)
+        self.rename("New")
+        self.assertEqual(self.cache.get(stale, self.request)["first_name"], "New")
+
+        self.rename("Newer")
+        self.assertEqual(self.cache.get(stale, self.request)["first_name"], "Newer")
@@ -6,13 +6,16 @@ from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .serializers import UserSerializer
+from helpers.throttling import SharedScopedRateThrottle
 from .services.auth_service import get_auth_service
+from .services.user_payload_cache import get_user_payload_cache
 
 
 class LoginView(APIView):
     authentication_classes = []
     permission_classes = []
+    throttle_classes = [SharedScopedRateThrottle]
+    throttle_scope = 'auth'
 
     def __init__(self, **kwargs: Any):
         super().__init__(**kwargs)
@@ -32,7 +35,7 @@ class LoginView(APIView):
 
         if login_result['success']:
             self.auth_service.reset_failed_attempts(username, ip_address)
-            user_data = UserSerializer(login_result['user'], context={'request': request}).data
+            user_data = get_user_payload_cache().get(login_result['user'], request)
 
             return Response({
                 'success': True,
@@ -62,10 +65,11 @@ class SessionCheckView(APIView):
     def __init__(self, **kwargs: Any):
         super().__init__(**kwargs)
         self.auth_service = get_auth_service()
+        self.user_payload_cache = get_user_payload_cache()
 
     def get(self, request):
         if request.user.is_authenticated:
-            user_data = UserSerializer(request.user, context={'request': request}).data
+            user_data = self.user_payload_cache.get(request.user, request)
             return Response({
                 'authenticated': True,
                 'user': user_data
@@ -102,6 +106,8 @@ class GetCSRFTokenView(APIView):
 class RegisterView(APIView):
     authentication_classes = []
     permission_classes = []
+    throttle_classes = [SharedScopedRateThrottle]
+    throttle_scope = 'auth'
 
     def __init__(self, **kwargs: Any):
         super().__init__(**kwargs)
@@ -120,7 +126,7 @@ class RegisterView(APIView):
 
         self.auth_service.perform_registration_login(request, user)
 
-        user_data = UserSerializer(user, context={'request': request}).data
+        user_data = get_user_payload_cache().get(user, request)
 
         return Response({
             'success': True,
@@ -180,10 +186,10 @@ class MeView(APIView):
     def __init__(self, **kwargs: Any):
         super().__init__(**kwargs)
         self.auth_service = get_auth_service()
+        self.user_payload_cache = get_user_payload_cache()
 
     def get(self, request):
-        serializer = UserSerializer(request.user, context={"request": request})
-        return Response(serializer.data)
+        return Response(self.user_payload_cache.get(request.user, request))
 
     def put(self, request):
         """Update user profile (email, first_name, last_name)"""
@@ -191,5 +197,4 @@ class MeView(APIView):
 
         updated_user = self.auth_service.update_user_profile(request.user, request.data)
 
-        serializer = UserSerializer(updated_user, context={"request": request})
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(self.user_payload_cache.get(updated_user, request), status=status.HTTP_200_OK)
@@ -1 +1,37 @@
+"""
+Example usage of the watchlist observer event bus.
 
+Observers are registered per action on the WatchlistService and are called
+asynchronously by the event bus worker threads after the change is committed.
+Run inside `python manage.py shell`.
+"""
+
+import time
+
+from django.contrib.auth.models import User
+
+from marketdata.services.watchlist_service import get_watchlist_service
+
+watchlist_service = get_watchlist_service()
+
+
+def log_subscription(event_type, payload):
+    print(f"{event_type}: user {payload['user_id']} -> {payload['symbol']}")
+
+
+# Example 1: Register observers per action
+watchlist_service.add_observer('subscribed', log_subscription)
+watchlist_service.add_observer('unsubscribed', log_subscription)
+
+# Example 2: Changes return immediately; observers run in the background
+user = User.objects.first()
+watchlist_service.subscribe(user, 'BTC')
+watchlist_service.unsubscribe(user, 'BTC')
+
+time.sleep(0.1)
+
+# Example 3: Queue depth and handler latency
+print(watchlist_service.event_bus.metrics())
+
+watchlist_service.remove_observer('subscribed', log_subscription)
+watchlist_service.remove_observer('unsubscribed', log_subscription)
@@ -1,7 +1,21 @@
+import inspect
 from abc import ABC
 
+from helpers.tracing import traced
+
 
 class AbstractService(ABC):
     """
     Abstract base service class.
-    """
\ No newline at end of file
+
+    Public methods of subclasses run in a tracing span named after the class and
+    method while a request is being traced (see helpers.tracing).
+    """
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name, attribute in list(vars(cls).items()):
+            # Generators would only be traced until they return their iterator
+            if name.startswith("_") or not inspect.isfunction(attribute) or inspect.isgeneratorfunction(attribute):
+                continue
+            setattr(cls, name, traced(f"{cls.__name__}.{name}")(attribute))
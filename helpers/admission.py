@@ -0,0 +1,254 @@
+"""
+Cost-based admission control for expensive endpoints.
+
+Views opt in with AdmissionControlMixin, naming an `admission_scope` (a key of
+ADMISSION_BUDGETS) and pricing each request in get_admission_cost(): an LSTM
+prediction costs epochs x lookback, a technical analysis one unit per
+timeframe. Before the handler runs, the cost is taken from two token buckets
+in helpers.shared_store, so the budgets hold across worker processes:
+
+- the client's bucket (user id, or the connecting address when anonymous), so
+  one client can't spend everybody's capacity;
+- the scope's global bucket, which bounds what all clients together send to
+  the microservice.
+
+Each bucket holds one minute of its budget and refills continuously. A request
+costing more than a whole client bucket could never run and is refused with a
+400. A client over its own budget is refused at once with a 429. When only the
+global budget is short, the request waits for it to refill if that takes at
+most ADMISSION_MAX_QUEUE_SECONDS (and fits its deadline), else gets a 503.
+Both carry Retry-After.
+
+Cost alone doesn't stop a handful of slow predictions from holding every
+worker thread, so each process also admits at most ADMISSION_MAX_IN_FLIGHT
+requests per scope at a time. Requests that have their budget wait (within
+the same queue time) for a slot; at most ADMISSION_MAX_QUEUED requests per
+scope wait at once, for budget or for a slot. Everything past that is turned
+away immediately, with its tokens given back, which keeps the other threads
+free for cheap endpoints.
+"""
+import logging
+import math
+import threading
+import time
+from typing import Dict, Optional
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException, Throttled
+
+from helpers import deadlines
+from helpers.metrics import ADMISSION_COST, ADMISSION_DECISIONS, ADMISSION_QUEUE_SECONDS
+from helpers.shared_store import get_shared_store
+
+logger = logging.getLogger(__name__)
+
+
+class RequestTooExpensive(APIException):
+    """The request costs more than a client's whole budget"""
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = 'This request is too expensive to run.'
+    default_code = 'request_too_expensive'
+
+
+class Overloaded(APIException):
+    """The endpoint is at capacity for everyone; try again after `wait` seconds"""
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'The service is at capacity, please try again later.'
+    default_code = 'overloaded'
+
+    def __init__(self, detail=None, wait: Optional[float] = None):
+        super().__init__(detail)
+        # Picked up by DRF's exception handler as the Retry-After header
+        self.wait = math.ceil(wait) if wait is not None else None
+
+
+class _Gate:
+    """Bounded concurrency for one scope in this process, with a bounded number of waiters"""
+
+    def __init__(self, limit: int, max_waiting: int):
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.in_flight = 0
+        self.waiting = 0
+        self._condition = threading.Condition()
+
+    def enter(self, timeout: float) -> bool:
+        """Take a slot, waiting up to `timeout` seconds; False if none came free or the queue is full"""
+        with self._condition:
+            if self.in_flight < self.limit:
+                self.in_flight += 1
+                return True
+            if timeout <= 0 or self.waiting >= self.max_waiting:
+                return False
+            self.waiting += 1
+            try:
+                if not self._condition.wait_for(lambda: self.in_flight < self.limit, timeout):
+                    return False
+                self.in_flight += 1
+                return True
+            finally:
+                self.waiting -= 1
+
+    def start_waiting(self) -> bool:
+        """Count a request waiting for something other than a slot; False if the queue is full"""
+        with self._condition:
+            if self.waiting >= self.max_waiting:
+                return False
+            self.waiting += 1
+            return True
+
+    def stop_waiting(self) -> None:
+        with self._condition:
+            self.waiting -= 1
+
+    def leave(self) -> None:
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+
+class Ticket:
+    """An admitted request's hold on its scope's in-flight slot; release() when the response is done"""
+
+    def __init__(self, gate: _Gate):
+        self._gate: Optional[_Gate] = gate
+
+    def release(self) -> None:
+        if self._gate is not None:
+            self._gate.leave()
+            self._gate = None
+
+
+class AdmissionController:
+    """Admits or refuses requests against per-client and global cost budgets"""
+
+    def __init__(self):
+        self._gates: Dict[str, _Gate] = {}
+        self._lock = threading.Lock()
+
+    def _gate(self, scope: str) -> _Gate:
+        gate = self._gates.get(scope)
+        if gate is None:
+            with self._lock:
+                gate = self._gates.setdefault(
+                    scope, _Gate(settings.ADMISSION_MAX_IN_FLIGHT, settings.ADMISSION_MAX_QUEUED)
+                )
+        return gate
+
+    def admit(self, scope: str, client: str, cost: float) -> Ticket:
+        """
+        Wait (briefly) for capacity and take `cost` from the scope's budgets.
+        Raises RequestTooExpensive, Throttled (client over budget) or
+        Overloaded (scope over budget, or too many requests in flight).
+        """
+        budget = settings.ADMISSION_BUDGETS[scope]
+        if cost > budget["client"] or cost > budget["global"]:
+            ADMISSION_DECISIONS.labels(scope, "too_expensive").inc()
+            raise RequestTooExpensive(
+                f"This request costs {cost:g} units, more than the budget of {min(budget['client'], budget['global']):g} "
+                f"units per minute"
+            )
+
+        started = time.monotonic()
+        max_wait = settings.ADMISSION_MAX_QUEUE_SECONDS
+        left = deadlines.remaining()
+        if left is not None:
+            max_wait = min(max_wait, left)
+
+        gate = self._gate(scope)
+        client_key = f"admission:{scope}:{client}"
+        buckets = [
+            # (key, capacity, refill per second): one minute's budget, refilled continuously.
+            # The client's comes first, so it is the one reported when both are short
+            (client_key, budget["client"], budget["client"] / 60),
+            (f"admission:{scope}:*", budget["global"], budget["global"] / 60),
+        ]
+        queued = False
+        while True:
+            taken, retry_after, limiting = get_shared_store().take_tokens(buckets, cost)
+            if taken:
+                break
+            # A client over its own budget never waits: it would only hold a thread others could use
+            if limiting == client_key:
+                raise self._rejection(scope, True, retry_after)
+            if time.monotonic() - started + retry_after > max_wait:
+                raise self._rejection(scope, False, retry_after)
+            if not gate.start_waiting():
+                raise self._busy(scope, gate)
+            queued = True
+            try:
+                time.sleep(retry_after)
+            finally:
+                gate.stop_waiting()
+
+        queued = queued or gate.in_flight >= gate.limit
+        if not gate.enter(max_wait - (time.monotonic() - started)):
+            get_shared_store().return_tokens([key for key, _, _ in buckets], cost)
+            raise self._busy(scope, gate)
+
+        ADMISSION_DECISIONS.labels(scope, "queued" if queued else "admitted").inc()
+        ADMISSION_COST.labels(scope).inc(cost)
+        ADMISSION_QUEUE_SECONDS.labels(scope).observe(time.monotonic() - started)
+        return Ticket(gate)
+
+    @staticmethod
+    def _busy(scope: str, gate: _Gate) -> APIException:
+        ADMISSION_DECISIONS.labels(scope, "rejected_busy").inc()
+        logger.warning(f"Refused {scope} request: {gate.in_flight} in flight and {gate.waiting} waiting")
+        return Overloaded(wait=max(settings.ADMISSION_MAX_QUEUE_SECONDS, 1))
+
+    @staticmethod
+    def _rejection(scope: str, by_client: bool, retry_after: float) -> APIException:
+        if by_client:
+            ADMISSION_DECISIONS.labels(scope, "rejected_client").inc()
+            return Throttled(wait=retry_after, detail="You have used up your budget for this endpoint.")
+        ADMISSION_DECISIONS.labels(scope, "rejected_global").inc()
+        logger.warning(f"Refused {scope} request: global budget exhausted for the next {retry_after:.1f}s")
+        return Overloaded(wait=retry_after)
+
+
+controller = AdmissionController()
+
+
+def get_admission_controller() -> AdmissionController:
+    """Return the process-wide AdmissionController instance."""
+    return controller
+
+
+def client_ident(request) -> str:
+    """
+    Budget key of the client: the user id when authenticated, otherwise the
+    connecting address. X-Forwarded-For is ignored: anyone can send it, and a
+    new value per request would mean a fresh budget per request.
+    """
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    return f"ip:{request.META.get('REMOTE_ADDR', '')}"
+
+
+class AdmissionControlMixin:
+    """
+    APIView mixin: admit each request against the budgets of `admission_scope`
+    once authentication, permissions and throttles have passed, and free its
+    in-flight slot when the response is finalized.
+    """
+    admission_scope: Optional[str] = None
+
+    def get_admission_cost(self, request) -> float:
+        """Cost of the request in the scope's units; may raise a 400 for unusable parameters"""
+        return 1
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if not settings.ADMISSION_CONTROL_ENABLED or self.admission_scope is None:
+            return
+        cost = self.get_admission_cost(request)
+        self._admission_ticket = get_admission_controller().admit(self.admission_scope, client_ident(request), cost)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        ticket = getattr(self, "_admission_ticket", None)
+        if ticket is not None:
+            ticket.release()
+        return super().finalize_response(request, response, *args, **kwargs)
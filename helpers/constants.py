@@ -2,4 +2,7 @@
 
 MAX_LOGIN_ATTEMPTS = 5
 LOCKOUT_DURATION_MINUTES = 15
-LOCKOUT_DURATION_SECONDS = LOCKOUT_DURATION_MINUTES * 60
\ No newline at end of file
+LOCKOUT_DURATION_SECONDS = LOCKOUT_DURATION_MINUTES * 60
+
+# Maximum number of items accepted by a single bulk request
+MAX_BULK_ITEMS = 1000
@@ -52,3 +52,18 @@ def verify_database_integrity():
     except Exception as e:
         logger.error(f"Error checking database integrity: {e}")
         return False
+
+
+def init_worker_process():
+    """
+    Process-pool initializer for workers that talk to the database.
+
+    Makes sure Django is configured in the child (needed for the "spawn" start
+    method) and drops any connection inherited from the parent, so every worker
+    opens its own SQLite connection.
+    """
+    import django
+    from django.db import connections
+
+    django.setup()
+    connections.close_all()
@@ -0,0 +1,207 @@
+"""
+Per-request time budgets.
+
+DeadlineMiddleware gives each request a Deadline when it arrives: the budget of
+its route class (REQUEST_DEADLINES / REQUEST_DEADLINE_ROUTES), shortened to the
+client's own timeout if it sent one in X-Request-Deadline-Ms. Everything the
+request does then spends from that one budget instead of carrying its own
+timeout:
+
+- helpers.upstream caps each microservice call's timeout at the time left,
+  refuses to start a call once it is spent, and forwards the time left in
+  X-Request-Deadline-Ms so the microservice can give up at the same moment;
+- DB queries issued after the budget is spent raise DeadlineExceeded (see
+  `db_wrapper`) instead of adding more work to a response nobody will read;
+- a query still running when the budget runs out is aborted by SQLite itself:
+  every connection gets a progress handler (DB_PROGRESS_HANDLER_OPS) that
+  interrupts the statement once the current request's deadline has passed.
+  The abort surfaces as QueryCancelled and the query is recorded in the slow
+  query log as cancelled.
+
+DeadlineExceeded is a 504 APIException. Views that fan out to several calls
+catch it to return what they already have. Outside a request (management
+commands, background threads) there is no deadline and callers' own
+timeouts apply.
+"""
+import logging
+import time
+import traceback
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Optional
+
+from django.conf import settings
+from django.db import OperationalError
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+logger = logging.getLogger(__name__)
+
+_THIS_FILE = str(Path(__file__).resolve())
+
+DEADLINE_HEADER = "X-Request-Deadline-Ms"
+
+_current: "ContextVar[Optional[Deadline]]" = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(APIException):
+    """The request's time budget ran out before the work was done"""
+    status_code = status.HTTP_504_GATEWAY_TIMEOUT
+    default_detail = 'The request took too long and was abandoned.'
+    default_code = 'deadline_exceeded'
+
+
+class QueryCancelled(DeadlineExceeded):
+    """A database query was aborted because the request's time budget ran out"""
+    default_detail = 'A database query ran past the time budget and was cancelled.'
+    default_code = 'query_cancelled'
+
+
+class Deadline:
+    """A point in time (monotonic clock) by which the request should have answered"""
+
+    def __init__(self, budget: float, started: Optional[float] = None):
+        self.started = time.monotonic() if started is None else started
+        self.budget = budget
+        # (sql, params, many, connection, perf_counter at start) of the latest query, for reporting a cancellation
+        self.query = None
+
+    @property
+    def expires_at(self) -> float:
+        return self.started + self.budget
+
+    def shorten(self, budget: float) -> None:
+        """Lower the budget (measured from the request's start); never raises it"""
+        self.budget = min(self.budget, budget)
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self, what: str = "request") -> None:
+        if self.expired:
+            raise DeadlineExceeded(f"Time budget of {self.budget:g}s exhausted before {what}")
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current.get()
+
+
+def activate(deadline: Optional[Deadline]):
+    return _current.set(deadline)
+
+
+def deactivate(token) -> None:
+    _current.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left for the current request, or None outside one"""
+    deadline = _current.get()
+    return deadline.remaining() if deadline is not None else None
+
+
+def timeout(requested: Optional[float] = None, what: str = "request") -> Optional[float]:
+    """
+    Timeout for a blocking call: the requested one capped at the time left.
+    Raises DeadlineExceeded if there is no time left.
+    """
+    deadline = _current.get()
+    if deadline is None:
+        return requested
+    deadline.check(what)
+    left = deadline.remaining()
+    return left if requested is None else min(requested, left)
+
+
+def parse_header(value: Optional[str]) -> Optional[float]:
+    """Seconds from an X-Request-Deadline-Ms value, or None if absent or invalid"""
+    try:
+        milliseconds = float(value)
+    except (TypeError, ValueError):
+        return None
+    return milliseconds / 1000 if milliseconds > 0 else None
+
+
+def header_value(deadline: Deadline) -> str:
+    return str(max(int(deadline.remaining() * 1000), 0))
+
+
+def db_wrapper(execute, sql, params, many, context):
+    """Execute wrapper: don't start queries for a request whose budget is already spent"""
+    deadline = _current.get()
+    if deadline is None:
+        return execute(sql, params, many, context)
+    deadline.check("database query")
+    deadline.query = (sql, params, many, context["connection"], time.perf_counter())
+    try:
+        return execute(sql, params, many, context)
+    except OperationalError as e:
+        cancelled = deadline_error(e)
+        if cancelled is None:
+            raise
+        raise cancelled from e
+
+
+def _progress_handler() -> int:
+    # Called by SQLite every DB_PROGRESS_HANDLER_OPS VM instructions; non-zero aborts the statement
+    deadline = _current.get()
+    return 1 if deadline is not None and deadline.expired else 0
+
+
+def install(sender, connection, **kwargs) -> None:
+    """connection_created receiver: let SQLite abort statements that outlive the request's deadline"""
+    ops = getattr(settings, "DB_PROGRESS_HANDLER_OPS", 0)
+    if connection.vendor == "sqlite" and ops > 0:
+        connection.connection.set_progress_handler(_progress_handler, ops)
+
+
+def _interrupted(exc: BaseException) -> bool:
+    return isinstance(exc, OperationalError) and str(exc) == "interrupted"
+
+
+def deadline_error(exc: Optional[BaseException]) -> Optional[DeadlineExceeded]:
+    """
+    The DeadlineExceeded behind an exception, following its cause/context chain
+    (services re-raise errors as their own). A SQLite statement interrupted by
+    the progress handler becomes a QueryCancelled, and the query is recorded.
+    """
+    while exc is not None:
+        if isinstance(exc, DeadlineExceeded):
+            return exc
+        if _interrupted(exc):
+            return _cancel_query(exc)
+        exc = exc.__cause__ or exc.__context__
+    return None
+
+
+def _cancel_query(exc: BaseException) -> Optional[QueryCancelled]:
+    deadline = _current.get()
+    if deadline is None or not deadline.expired:
+        return None
+    if deadline.query is None:
+        return QueryCancelled()
+
+    sql, params, many, connection, started = deadline.query
+    # Report each cancelled query once, however many layers re-raise it
+    deadline.query = None
+    elapsed = time.perf_counter() - started
+    # An interrupt raised while fetching rows surfaces after the stack has unwound to
+    # whoever handles it, so the caller comes from the frames it was raised through
+    stack = traceback.extract_stack()[:-1] + traceback.extract_tb(exc.__traceback__)
+    # The plan lookup runs queries of its own, which must not be refused or interrupted too
+    token = activate(None)
+    try:
+        from helpers import slow_queries
+        caller = slow_queries.query_source(exclude=[_THIS_FILE], stack=stack)
+        slow_queries.record(sql, params, many, connection, elapsed, cancelled=True, caller=caller)
+    except Exception as e:
+        logger.error(f"Could not record cancelled query: {str(e)}")
+    finally:
+        deactivate(token)
+    return QueryCancelled(
+        f"Query cancelled after {elapsed * 1000:.0f} ms: time budget of {deadline.budget:g}s exhausted"
+    )
@@ -27,8 +27,118 @@ CSRF_TRUSTED_ORIGINS = os.environ.get('CSRF_TRUSTED_ORIGINS', 'http://localhost:
 TWITTER_BEARER_TOKEN = os.environ.get('TWITTER_BEARER_TOKEN', '')
 
 # Microservices Base URLs
-TECHNICAL_ANALYSIS_SERVICE_URL = os.environ.get('TECHNICAL_ANALYSIS_SERVICE_URL', 'http://localhost:8001')
-LSTM_SERVICE_URL = os.environ.get('LSTM_SERVICE_URL', 'http://localhost:8002')
-SENTIMENT_ANALYSIS_SERVICE_URL = os.environ.get('SENTIMENT_ANALYSIS_SERVICE_URL', 'http://localhost:8003')
-NOTIFICATION_SERVICE_URL = os.environ.get('NOTIFICATION_SERVICE_URL', 'http://localhost:8004')
+# Comma-separated to list several replicas; helpers.load_balancer spreads calls across them
+TECHNICAL_ANALYSIS_SERVICE_URLS = os.environ.get('TECHNICAL_ANALYSIS_SERVICE_URL', 'http://localhost:8001').split(',')
+LSTM_SERVICE_URLS = os.environ.get('LSTM_SERVICE_URL', 'http://localhost:8002').split(',')
+SENTIMENT_ANALYSIS_SERVICE_URLS = os.environ.get('SENTIMENT_ANALYSIS_SERVICE_URL', 'http://localhost:8003').split(',')
+NOTIFICATION_SERVICE_URLS = os.environ.get('NOTIFICATION_SERVICE_URL', 'http://localhost:8004').split(',')
+# First replica of each
+TECHNICAL_ANALYSIS_SERVICE_URL = TECHNICAL_ANALYSIS_SERVICE_URLS[0]
+LSTM_SERVICE_URL = LSTM_SERVICE_URLS[0]
+SENTIMENT_ANALYSIS_SERVICE_URL = SENTIMENT_ANALYSIS_SERVICE_URLS[0]
+NOTIFICATION_SERVICE_URL = NOTIFICATION_SERVICE_URLS[0]
 
+
+# Event Bus Configuration
+EVENT_BUS_WORKERS = int(os.environ.get('EVENT_BUS_WORKERS', '2'))
+EVENT_BUS_QUEUE_SIZE = int(os.environ.get('EVENT_BUS_QUEUE_SIZE', '1000'))
+
+# Watchlist Watchers Cache Configuration
+WATCHERS_CACHE_TTL_SECONDS = int(os.environ.get('WATCHERS_CACHE_TTL_SECONDS', '60'))
+WATCHERS_CACHE_MAX_SYMBOLS = int(os.environ.get('WATCHERS_CACHE_MAX_SYMBOLS', '1000'))
+
+# Session Configuration
+# django.contrib.sessions.backends.db, .cached_db, .cache or .signed_cookies
+# helpers.queued_db_session (default) is the db backend with saves routed through the write queue
+SESSION_ENGINE = os.environ.get('SESSION_ENGINE', 'helpers.queued_db_session')
+# Only persist last_activity when it has moved by more than this many seconds (0 = every request)
+SESSION_ACTIVITY_GRANULARITY_SECONDS = int(os.environ.get('SESSION_ACTIVITY_GRANULARITY_SECONDS', '60'))
+
+# Shared Store Configuration (process-safe counters for lockouts and rate limits)
+SHARED_STORE_PATH = os.environ.get('SHARED_STORE_PATH', 'shared_store.db')
+
+# Error Log Configuration
+ERROR_LOG_RETENTION_DAYS = int(os.environ.get('ERROR_LOG_RETENTION_DAYS', '30'))
+
+# SQLite Write Queue Configuration (single writer thread per process)
+WRITE_QUEUE_ENABLED = os.environ.get('WRITE_QUEUE_ENABLED', 'True').lower() == 'true'
+WRITE_QUEUE_MAX_BATCH = int(os.environ.get('WRITE_QUEUE_MAX_BATCH', '100'))
+WRITE_QUEUE_LINGER_MS = float(os.environ.get('WRITE_QUEUE_LINGER_MS', '0'))
+# Longest a request waits for its write to commit (less if its deadline is sooner)
+WRITE_QUEUE_TIMEOUT_SECONDS = float(os.environ.get('WRITE_QUEUE_TIMEOUT_SECONDS', '30'))
+
+# Request Timing Configuration (Server-Timing header and timing log line)
+# Fraction of requests to instrument, 0 disables
+SERVER_TIMING_SAMPLE_RATE = float(os.environ.get('SERVER_TIMING_SAMPLE_RATE', '1.0'))
+
+# Metrics Configuration (directory of per-process mmap metric files)
+METRICS_DIR = os.environ.get('METRICS_DIR', 'metrics_data')
+# /api/metrics/ answers only these client addresses, or requests sending "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_ALLOWED_IPS = os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Slow Query Log Configuration (queries at or over the threshold are logged with their plan)
+SLOW_QUERY_LOG_ENABLED = os.environ.get('SLOW_QUERY_LOG_ENABLED', 'True').lower() == 'true'
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', '100'))
+# Keep parameter values in the log (never for session/auth tables); off logs only their count
+SLOW_QUERY_LOG_PARAMS = os.environ.get('SLOW_QUERY_LOG_PARAMS', 'False').lower() == 'true'
+
+# Profiling Configuration (staff ?_profile= / X-Profile requests and continuous sampling)
+# Off removes the profiling middleware entirely
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'False').lower() == 'true'
+PROFILING_CONTINUOUS = os.environ.get('PROFILING_CONTINUOUS', 'False').lower() == 'true'
+PROFILING_SAMPLE_INTERVAL_MS = float(os.environ.get('PROFILING_SAMPLE_INTERVAL_MS', '1'))
+PROFILING_CONTINUOUS_INTERVAL_MS = float(os.environ.get('PROFILING_CONTINUOUS_INTERVAL_MS', '100'))
+PROFILING_FLUSH_SECONDS = float(os.environ.get('PROFILING_FLUSH_SECONDS', '30'))
+PROFILING_MAX_PROFILES = int(os.environ.get('PROFILING_MAX_PROFILES', '200'))
+PROFILES_DIR = os.environ.get('PROFILES_DIR', 'profiles_data')
+
+# Memory Profiling Configuration (tracemalloc snapshots at /api/memory/)
+# Trace from each worker's first request; staff can also start tracing on demand
+MEMORY_TRACING_ENABLED = os.environ.get('MEMORY_TRACING_ENABLED', 'False').lower() == 'true'
+MEMORY_TRACE_FRAMES = int(os.environ.get('MEMORY_TRACE_FRAMES', '5'))
+MEMORY_MAX_SNAPSHOTS = int(os.environ.get('MEMORY_MAX_SNAPSHOTS', '10'))
+# Seconds between background memory samples on the "memory" logger, 0 disables.
+# While tracing, each sample snapshots and diffs the whole heap, so use minutes rather than seconds
+MEMORY_SAMPLER_INTERVAL_SECONDS = float(os.environ.get('MEMORY_SAMPLER_INTERVAL_SECONDS', '0'))
+
+# Tracing Configuration (spans per request, exported to a local SQLite file, viewed at /api/traces/)
+TRACING_ENABLED = os.environ.get('TRACING_ENABLED', 'False').lower() == 'true'
+# Fraction of requests to trace
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '0.01'))
+# Let the sampled flag of an incoming traceparent decide instead; only when every caller is a trusted proxy
+TRACE_TRUST_PARENT_SAMPLING = os.environ.get('TRACE_TRUST_PARENT_SAMPLING', 'False').lower() == 'true'
+TRACES_PATH = os.environ.get('TRACES_PATH', 'traces.db')
+TRACE_RETENTION_HOURS = float(os.environ.get('TRACE_RETENTION_HOURS', '24'))
+
+# Request Deadline Configuration (one time budget per request, see helpers.deadlines)
+# Budgets per route class in seconds, 0 means no deadline for that class
+REQUEST_DEADLINE_DEFAULT_SECONDS = float(os.environ.get('REQUEST_DEADLINE_DEFAULT_SECONDS', '10'))
+REQUEST_DEADLINE_ANALYSIS_SECONDS = float(os.environ.get('REQUEST_DEADLINE_ANALYSIS_SECONDS', '60'))
+REQUEST_DEADLINE_PREDICTION_SECONDS = float(os.environ.get('REQUEST_DEADLINE_PREDICTION_SECONDS', '120'))
+# SQLite VM instructions between deadline checks of a running query (0 never aborts queries)
+DB_PROGRESS_HANDLER_OPS = int(os.environ.get('DB_PROGRESS_HANDLER_OPS', '10000'))
+# Timeout for microservice calls made outside a request (e.g. alert emails)
+UPSTREAM_TIMEOUT_SECONDS = float(os.environ.get('UPSTREAM_TIMEOUT_SECONDS', '30'))
+
+# Microservice Load Balancing Configuration (see helpers.load_balancer)
+# A replica failing this many calls in a row is left out of rotation for UPSTREAM_EJECT_SECONDS
+# (doubling on each repeat ejection)
+UPSTREAM_EJECT_AFTER_FAILURES = int(os.environ.get('UPSTREAM_EJECT_AFTER_FAILURES', '3'))
+UPSTREAM_EJECT_SECONDS = float(os.environ.get('UPSTREAM_EJECT_SECONDS', '30'))
+# Send a second attempt of idempotent calls once the first has taken longer than the service's p95
+UPSTREAM_HEDGING_ENABLED = os.environ.get('UPSTREAM_HEDGING_ENABLED', 'False').lower() == 'true'
+UPSTREAM_HEDGE_MIN_DELAY_MS = float(os.environ.get('UPSTREAM_HEDGE_MIN_DELAY_MS', '50'))
+
+# Admission Control Configuration (cost budgets for expensive endpoints, see helpers.admission)
+ADMISSION_CONTROL_ENABLED = os.environ.get('ADMISSION_CONTROL_ENABLED', 'True').lower() == 'true'
+# Cost units per minute: a prediction costs epochs x lookback (150 with the defaults), an analysis 1 per timeframe
+ADMISSION_PREDICTION_CLIENT_PER_MINUTE = float(os.environ.get('ADMISSION_PREDICTION_CLIENT_PER_MINUTE', '1500'))
+ADMISSION_PREDICTION_GLOBAL_PER_MINUTE = float(os.environ.get('ADMISSION_PREDICTION_GLOBAL_PER_MINUTE', '6000'))
+ADMISSION_ANALYSIS_CLIENT_PER_MINUTE = float(os.environ.get('ADMISSION_ANALYSIS_CLIENT_PER_MINUTE', '60'))
+ADMISSION_ANALYSIS_GLOBAL_PER_MINUTE = float(os.environ.get('ADMISSION_ANALYSIS_GLOBAL_PER_MINUTE', '600'))
+# Longest a request waits for budget or a free slot before it is rejected
+ADMISSION_MAX_QUEUE_SECONDS = float(os.environ.get('ADMISSION_MAX_QUEUE_SECONDS', '5'))
+# Per process and scope: requests running at once, and requests waiting for one of those slots
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get('ADMISSION_MAX_IN_FLIGHT', '4'))
+ADMISSION_MAX_QUEUED = int(os.environ.get('ADMISSION_MAX_QUEUED', '8'))
@@ -0,0 +1,163 @@
+"""
+In-process publish/subscribe event bus.
+
+Handlers are registered per event type. Publishing only enqueues the event on a
+bounded queue and returns immediately; a small pool of daemon worker threads
+dispatches it to the handlers, so the caller's latency does not depend on how
+many observers are attached or how slow they are.
+
+Queue depth, queued and dropped events and handler run times also go to
+helpers.metrics, so they show on /api/metrics/ for every worker process;
+metrics() gives this process's own view.
+"""
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List
+
+from helpers.env_variables import EVENT_BUS_QUEUE_SIZE, EVENT_BUS_WORKERS
+from helpers.metrics import EVENT_BUS_EVENTS, EVENT_BUS_HANDLER_SECONDS, EVENT_BUS_QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[str, Dict[str, Any]], None]
+
+
+class EventBus:
+    """Bounded-queue event bus with a worker thread pool"""
+
+    def __init__(self, workers: int = EVENT_BUS_WORKERS, queue_size: int = EVENT_BUS_QUEUE_SIZE):
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._handlers: Dict[str, List[Handler]] = defaultdict(list)
+        self._lock = threading.Lock()
+        self._workers = workers
+        self._threads: List[threading.Thread] = []
+
+        self._published = 0
+        self._dropped = 0
+        self._dispatched = 0
+        self._errors = 0
+        self._latency: Dict[str, Dict[str, float]] = defaultdict(
+            lambda: {"count": 0, "total_ms": 0.0, "max_ms": 0.0}
+        )
+
+    def subscribe(self, event_type: str, handler: Handler) -> None:
+        """Register a handler for an event type"""
+        with self._lock:
+            if handler not in self._handlers[event_type]:
+                self._handlers[event_type].append(handler)
+
+    def unsubscribe(self, event_type: str, handler: Handler) -> None:
+        """Remove a previously registered handler"""
+        with self._lock:
+            if handler in self._handlers[event_type]:
+                self._handlers[event_type].remove(handler)
+
+    def publish(self, event_type: str, payload: Dict[str, Any]) -> bool:
+        """
+        Queue an event for asynchronous dispatch.
+
+        Never blocks: if the queue is full the event is dropped and counted.
+        Returns True if the event was queued.
+        """
+        if not self._handlers.get(event_type):
+            return False
+
+        self._ensure_workers()
+        try:
+            self._queue.put_nowait((event_type, payload))
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+            EVENT_BUS_EVENTS.labels(event_type, "dropped").inc()
+            logger.warning(f"Event bus queue full, dropping '{event_type}' event")
+            return False
+
+        with self._lock:
+            self._published += 1
+            self._report_depth()
+        EVENT_BUS_EVENTS.labels(event_type, "queued").inc()
+        return True
+
+    def _report_depth(self) -> None:
+        # Called under the lock, so the last depth written is the latest one
+        EVENT_BUS_QUEUE_DEPTH.set(self._queue.qsize())
+
+    def metrics(self) -> Dict[str, Any]:
+        """Queue depth, throughput counters and per-handler latency"""
+        with self._lock:
+            handlers = {
+                name: {
+                    "count": int(stats["count"]),
+                    "avg_ms": stats["total_ms"] / stats["count"] if stats["count"] else 0.0,
+                    "max_ms": stats["max_ms"],
+                }
+                for name, stats in self._latency.items()
+            }
+            return {
+                "queue_depth": self._queue.qsize(),
+                "queue_capacity": self._queue.maxsize,
+                "workers": len(self._threads),
+                "published": self._published,
+                "dispatched": self._dispatched,
+                "dropped": self._dropped,
+                "errors": self._errors,
+                "handlers": handlers,
+            }
+
+    def _ensure_workers(self) -> None:
+        if len(self._threads) >= self._workers:
+            return
+        with self._lock:
+            while len(self._threads) < self._workers:
+                thread = threading.Thread(
+                    target=self._run, name=f"event-bus-{len(self._threads)}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def _run(self) -> None:
+        while True:
+            event_type, payload = self._queue.get()
+            with self._lock:
+                self._report_depth()
+            try:
+                self._dispatch(event_type, payload)
+            finally:
+                self._queue.task_done()
+
+    def _dispatch(self, event_type: str, payload: Dict[str, Any]) -> None:
+        with self._lock:
+            handlers = list(self._handlers.get(event_type, ()))
+
+        for handler in handlers:
+            name = getattr(handler, "__qualname__", repr(handler))
+            started = time.perf_counter()
+            failed = False
+            try:
+                handler(event_type, payload)
+            except Exception as e:
+                failed = True
+                logger.error(f"Event handler {name} failed for '{event_type}': {str(e)}")
+            elapsed = time.perf_counter() - started
+            EVENT_BUS_HANDLER_SECONDS.labels(name, "error" if failed else "ok").observe(elapsed)
+            elapsed_ms = elapsed * 1000
+
+            with self._lock:
+                stats = self._latency[name]
+                stats["count"] += 1
+                stats["total_ms"] += elapsed_ms
+                stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+                self._dispatched += 1
+                if failed:
+                    self._errors += 1
+
+
+event_bus = EventBus()
+
+
+def get_event_bus() -> EventBus:
+    """Return the process-wide EventBus instance."""
+    return event_bus
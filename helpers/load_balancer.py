@@ -0,0 +1,147 @@
+"""
+Client-side load balancing across microservice replicas.
+
+Each *_SERVICE_URL may list several replicas (comma-separated). A ServicePool
+per service hands out the replica with the fewest calls in flight from this
+process (ties broken at random), so a slow replica naturally gets less work.
+
+Health is tracked passively from real calls: a replica that fails
+UPSTREAM_EJECT_AFTER_FAILURES calls in a row (no response, or a 5xx) is left
+out of rotation for UPSTREAM_EJECT_SECONDS, doubling on each further ejection
+until it answers again. If every replica is ejected, the one due back soonest
+is still tried rather than failing outright.
+
+The pool also keeps a window of recent successful latencies; its p95 is the
+delay after which helpers.upstream sends a hedged second attempt of an
+idempotent call (UPSTREAM_HEDGING_ENABLED). At most HEDGE_BUDGET of calls are
+hedged, so a uniformly slow service isn't sent twice the load.
+
+State is per process, like the other in-process caches.
+"""
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from django.conf import settings
+
+from helpers.env_variables import (
+    LSTM_SERVICE_URLS, NOTIFICATION_SERVICE_URLS, SENTIMENT_ANALYSIS_SERVICE_URLS, TECHNICAL_ANALYSIS_SERVICE_URLS,
+)
+from helpers.metrics import UPSTREAM_EJECTIONS
+
+logger = logging.getLogger(__name__)
+
+SERVICE_URLS: Dict[str, List[str]] = {
+    "technical_analysis": TECHNICAL_ANALYSIS_SERVICE_URLS,
+    "lstm": LSTM_SERVICE_URLS,
+    "sentiment": SENTIMENT_ANALYSIS_SERVICE_URLS,
+    "notification": NOTIFICATION_SERVICE_URLS,
+}
+
+# Successful call latencies kept per service for the hedge delay
+LATENCY_WINDOW = 200
+# Fewer samples than this and the p95 means little; don't hedge yet
+MIN_LATENCY_SAMPLES = 20
+# Largest fraction of calls that may be hedged
+HEDGE_BUDGET = 0.1
+# Cap on the doubling of repeat ejections (2 ** 5 times UPSTREAM_EJECT_SECONDS)
+MAX_EJECTION_DOUBLINGS = 5
+
+
+class Endpoint:
+    """One replica and what this process knows about its health"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+
+    def available(self, now: float) -> bool:
+        return self.ejected_until <= now
+
+
+class ServicePool:
+    """Least-outstanding-requests selection with passive ejection for one service's replicas"""
+
+    def __init__(self, name: str, urls: List[str]):
+        self.name = name
+        self.endpoints = [Endpoint(url.strip().rstrip("/")) for url in urls if url.strip()]
+        if not self.endpoints:
+            raise ValueError(f"No URL configured for the {name} service")
+        self._lock = threading.Lock()
+        self._latencies: deque = deque(maxlen=LATENCY_WINDOW)
+        self.calls = 0
+        self.hedges = 0
+
+    def acquire(self, exclude: Optional[Endpoint] = None) -> Endpoint:
+        """Pick a replica for one attempt and count it as in flight; pair with release()"""
+        now = time.monotonic()
+        with self._lock:
+            candidates = [endpoint for endpoint in self.endpoints if endpoint is not exclude] or self.endpoints
+            healthy = [endpoint for endpoint in candidates if endpoint.available(now)]
+            if healthy:
+                fewest = min(endpoint.outstanding for endpoint in healthy)
+                endpoint = random.choice([endpoint for endpoint in healthy if endpoint.outstanding == fewest])
+            else:
+                endpoint = min(candidates, key=lambda candidate: candidate.ejected_until)
+            endpoint.outstanding += 1
+            return endpoint
+
+    def release(self, endpoint: Endpoint, ok: Optional[bool], elapsed: float) -> None:
+        """
+        Record an attempt's outcome: ok is a response below 500; None when the
+        outcome says nothing about the replica (the request's deadline ran out)
+        """
+        with self._lock:
+            endpoint.outstanding -= 1
+            if ok is None:
+                return
+            if ok:
+                endpoint.consecutive_failures = 0
+                endpoint.ejections = 0
+                self._latencies.append(elapsed)
+                return
+
+            endpoint.consecutive_failures += 1
+            if endpoint.consecutive_failures < settings.UPSTREAM_EJECT_AFTER_FAILURES:
+                return
+            seconds = settings.UPSTREAM_EJECT_SECONDS * 2 ** min(endpoint.ejections, MAX_EJECTION_DOUBLINGS)
+            endpoint.ejected_until = time.monotonic() + seconds
+            endpoint.ejections += 1
+            endpoint.consecutive_failures = 0
+        UPSTREAM_EJECTIONS.labels(self.name).inc()
+        logger.warning(f"Ejected {self.name} replica {endpoint.url} for {seconds:g}s after repeated failures")
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging a call (the recent p95), or None if too few samples"""
+        with self._lock:
+            if len(self._latencies) < MIN_LATENCY_SAMPLES:
+                return None
+            ordered = sorted(self._latencies)
+        p95 = ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)]
+        return max(p95, settings.UPSTREAM_HEDGE_MIN_DELAY_MS / 1000)
+
+    def start_call(self) -> None:
+        with self._lock:
+            self.calls += 1
+
+    def allow_hedge(self) -> bool:
+        """Take one hedge from the budget, if there is any left"""
+        with self._lock:
+            if self.hedges >= HEDGE_BUDGET * self.calls:
+                return False
+            self.hedges += 1
+            return True
+
+
+pools = {name: ServicePool(name, urls) for name, urls in SERVICE_URLS.items()}
+
+
+def get_pool(service: str) -> ServicePool:
+    """Return the process-wide ServicePool of a service (KeyError if unknown)."""
+    return pools[service]
@@ -0,0 +1,316 @@
+"""
+Memory visibility for long-running workers.
+
+MemoryProfiler wraps tracemalloc: staff start tracing, take labelled
+snapshots, and read the top allocation sites of a snapshot, or the growth
+between two snapshots, grouped by line, file, module or full traceback. It
+also counts live instances of the types we expect to pile up (Price and other
+model rows, serializer instances) and the size of the in-process caches.
+
+MemorySampler is an optional background thread that records the process's
+memory every MEMORY_SAMPLER_INTERVAL_SECONDS on the "memory" logger: current
+RSS, traced memory and, when tracing, the sites that grew most since the last
+sample. It warns when memory has grown over every sample in its window, which
+is what a leak looks like.
+
+Everything here is per process: snapshots and counts describe the worker that
+served the request (its pid is in every response).
+"""
+import gc
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, OrderedDict, deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger("memory")
+
+GROUPINGS = ("lineno", "filename", "module", "traceback")
+
+# Sites left out of reports: tracemalloc's own bookkeeping and the import system.
+# Dropped from the statistics rather than with Snapshot.filter_traces, which is pure
+# Python over every trace and takes seconds on a large heap.
+_IGNORED_FILES = frozenset({
+    tracemalloc.__file__, "<frozen importlib._bootstrap>", "<frozen importlib._bootstrap_external>", "<unknown>",
+})
+
+
+class TracingNotStartedError(RuntimeError):
+    pass
+
+
+class SnapshotNotFoundError(LookupError):
+    pass
+
+
+def rss_bytes() -> int:
+    """Current resident set size (peak RSS where /proc is not available)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is in KiB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _module_names() -> Dict[str, str]:
+    """Source file -> dotted module name, for every loaded module"""
+    names = {}
+    for name, module in list(sys.modules.items()):
+        filename = getattr(module, "__file__", None)
+        if filename:
+            names[os.path.abspath(filename)] = name
+    return names
+
+
+@dataclass
+class StoredSnapshot:
+    id: int
+    label: str
+    taken_at: str
+    traced_bytes: int
+    snapshot: tracemalloc.Snapshot
+
+    def describe(self) -> Dict[str, Any]:
+        return {"id": self.id, "label": self.label, "taken_at": self.taken_at, "traced_bytes": self.traced_bytes}
+
+
+class MemoryProfiler:
+    """tracemalloc snapshots, top allocation sites and diffs, plus live object counts"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshots: "OrderedDict[int, StoredSnapshot]" = OrderedDict()
+        self._next_id = 1
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: Optional[int] = None) -> None:
+        if not self.tracing:
+            tracemalloc.start(frames or settings.MEMORY_TRACE_FRAMES)
+            logger.info(f"tracemalloc started with {tracemalloc.get_traceback_limit()} frames")
+
+    def stop(self) -> None:
+        """Stop tracing and drop the stored snapshots (their traces are what costs memory)"""
+        tracemalloc.stop()
+        with self._lock:
+            self._snapshots.clear()
+        logger.info("tracemalloc stopped")
+
+    def _take(self) -> tracemalloc.Snapshot:
+        if not self.tracing:
+            raise TracingNotStartedError("Memory tracing is not running; start it first")
+        return tracemalloc.take_snapshot()
+
+    def snapshot(self, label: str = "") -> StoredSnapshot:
+        """Take and keep a snapshot (only the newest MEMORY_MAX_SNAPSHOTS are kept)"""
+        snapshot = self._take()
+        traced = tracemalloc.get_traced_memory()[0]
+        with self._lock:
+            stored = StoredSnapshot(self._next_id, label, datetime.now(timezone.utc).isoformat(), traced, snapshot)
+            self._snapshots[stored.id] = stored
+            self._next_id += 1
+            while len(self._snapshots) > settings.MEMORY_MAX_SNAPSHOTS:
+                self._snapshots.popitem(last=False)
+        return stored
+
+    def get(self, snapshot_id: int) -> StoredSnapshot:
+        with self._lock:
+            stored = self._snapshots.get(snapshot_id)
+        if stored is None:
+            raise SnapshotNotFoundError(f"No snapshot {snapshot_id} in process {os.getpid()}")
+        return stored
+
+    def snapshots(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            stored = list(self._snapshots.values())
+        return [snapshot.describe() for snapshot in stored]
+
+    def top(self, snapshot_id: int, group_by: str = "lineno", limit: int = 25) -> List[Dict[str, Any]]:
+        """Largest allocation sites in a snapshot"""
+        snapshot = self.get(snapshot_id).snapshot
+        if group_by == "module":
+            return self._by_module(snapshot.statistics("filename"), limit)
+        return [self._describe(stat) for stat in self._reported(snapshot.statistics(group_by), limit)]
+
+    def diff(self, from_id: int, to_id: Optional[int] = None, group_by: str = "lineno",
+             limit: int = 25) -> List[Dict[str, Any]]:
+        """Sites that grew most between two snapshots (to_id None compares against memory now)"""
+        old = self.get(from_id).snapshot
+        new = self.get(to_id).snapshot if to_id is not None else self._take()
+        if group_by == "module":
+            return self._by_module(new.compare_to(old, "filename"), limit)
+        return [self._describe(stat) for stat in self._reported(new.compare_to(old, group_by), limit)]
+
+    def _reported(self, stats, limit: Optional[int] = None) -> list:
+        reported = [stat for stat in stats if stat.traceback[0].filename not in _IGNORED_FILES]
+        return reported[:limit]
+
+    def _describe(self, stat) -> Dict[str, Any]:
+        frames = [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback]
+        entry = {
+            "site": frames[0] if len(frames) == 1 else frames,
+            "size_bytes": stat.size,
+            "count": stat.count,
+        }
+        if isinstance(stat, tracemalloc.StatisticDiff):
+            entry.update(size_diff_bytes=stat.size_diff, count_diff=stat.count_diff)
+        return entry
+
+    def _by_module(self, stats, limit: int) -> List[Dict[str, Any]]:
+        """Per-file statistics summed up per module"""
+        names = _module_names()
+        totals: Dict[str, Dict[str, int]] = {}
+        for stat in self._reported(stats):
+            filename = stat.traceback[0].filename
+            module = names.get(os.path.abspath(filename), filename)
+            total = totals.setdefault(module, Counter())
+            total.update(size_bytes=stat.size, count=stat.count)
+            if isinstance(stat, tracemalloc.StatisticDiff):
+                total.update(size_diff_bytes=stat.size_diff, count_diff=stat.count_diff)
+
+        key = "size_diff_bytes" if any("size_diff_bytes" in total for total in totals.values()) else "size_bytes"
+        ordered = sorted(totals.items(), key=lambda item: abs(item[1].get(key, 0)), reverse=True)
+        return [{"site": module, **total} for module, total in ordered[:limit]]
+
+    def object_counts(self) -> Dict[str, int]:
+        """Live instances of the tracked model and serializer types, by class name"""
+        from django.contrib.auth.models import User
+        from rest_framework.serializers import BaseSerializer
+        from marketdata.models import Price, PriceAlert, WatchlistItem
+
+        models = (Price, PriceAlert, WatchlistItem, User)
+        counts: Counter = Counter()
+        for obj in gc.get_objects():
+            # type() rather than isinstance(), which would evaluate lazy objects such as request.user
+            cls = type(obj)
+            if issubclass(cls, models):
+                counts[f"model:{cls.__name__}"] += 1
+            elif issubclass(cls, BaseSerializer):
+                counts[f"serializer:{cls.__name__}"] += 1
+        return dict(counts.most_common())
+
+    def cache_sizes(self) -> Dict[str, int]:
+        """Entries held by the in-process caches"""
+        from auth.services.user_payload_cache import get_user_payload_cache
+        from marketdata.services.watchlist_service import get_watchlist_service
+
+        return {
+            "user_payload": len(get_user_payload_cache()),
+            "watchers": len(get_watchlist_service().watchers_cache),
+        }
+
+    def status(self, include_objects: bool = True) -> Dict[str, Any]:
+        current, peak = tracemalloc.get_traced_memory()
+        result = {
+            "pid": os.getpid(),
+            "tracing": self.tracing,
+            "frames": tracemalloc.get_traceback_limit() if self.tracing else None,
+            "rss_bytes": rss_bytes(),
+            "traced_bytes": current,
+            "traced_peak_bytes": peak,
+            "tracemalloc_overhead_bytes": tracemalloc.get_tracemalloc_memory(),
+            "snapshots": self.snapshots(),
+            "caches": self.cache_sizes(),
+        }
+        if include_objects:
+            result["objects"] = self.object_counts()
+        return result
+
+
+class MemorySampler:
+    """Background thread that logs memory use and its trend at a fixed interval"""
+
+    # Samples considered when looking for steady growth
+    WINDOW = 12
+
+    def __init__(self, profiler: MemoryProfiler):
+        self.profiler = profiler
+        self._history: deque = deque(maxlen=self.WINDOW)
+        self._previous: Optional[tracemalloc.Snapshot] = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self) -> None:
+        """Start the thread in this process (after a fork the parent's thread is gone)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._history.clear()
+                self._previous = None
+                threading.Thread(target=self._run, name="memory-sampler", daemon=True).start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(settings.MEMORY_SAMPLER_INTERVAL_SECONDS)
+            try:
+                self.sample()
+            except Exception as e:
+                logger.error(f"Memory sample failed: {str(e)}")
+
+    def sample(self) -> Dict[str, Any]:
+        rss = rss_bytes()
+        traced = tracemalloc.get_traced_memory()[0] if self.profiler.tracing else None
+        self._history.append((time.monotonic(), traced if traced is not None else rss))
+
+        entry: Dict[str, Any] = {
+            "pid": os.getpid(),
+            "rss_bytes": rss,
+            "traced_bytes": traced,
+            "growth_bytes_per_hour": round(self._slope() * 3600),
+            "caches": self.profiler.cache_sizes(),
+        }
+
+        if self.profiler.tracing:
+            snapshot = self.profiler._take()
+            if self._previous is not None:
+                entry["top_growth"] = [
+                    {"site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                     "size_diff_bytes": stat.size_diff}
+                    for stat in self.profiler._reported(snapshot.compare_to(self._previous, "lineno"), 5)
+                    if stat.size_diff > 0
+                ]
+            self._previous = snapshot
+
+        values = [value for _, value in self._history]
+        steady_growth = len(values) == self.WINDOW and all(b > a for a, b in zip(values, values[1:]))
+        if steady_growth:
+            logger.warning(f"Memory grew over each of the last {self.WINDOW} samples: {json.dumps(entry)}")
+        else:
+            logger.info(json.dumps(entry))
+        return entry
+
+    def _slope(self) -> float:
+        """Least-squares growth in bytes per second over the window"""
+        if len(self._history) < 2:
+            return 0.0
+        times = [t for t, _ in self._history]
+        values = [v for _, v in self._history]
+        mean_t = sum(times) / len(times)
+        mean_v = sum(values) / len(values)
+        variance = sum((t - mean_t) ** 2 for t in times)
+        if not variance:
+            return 0.0
+        return sum((t - mean_t) * (v - mean_v) for t, v in zip(times, values)) / variance
+
+
+memory_profiler = MemoryProfiler()
+memory_sampler = MemorySampler(memory_profiler)
+
+
+def get_memory_profiler() -> MemoryProfiler:
+    """Return the process-wide MemoryProfiler instance."""
+    return memory_profiler
@@ -0,0 +1,395 @@
+"""
+Prometheus-style metrics shared by all worker processes.
+
+Each process writes its samples into its own mmap-backed file in METRICS_DIR,
+so recording is a dict lookup and a struct write under a process-local lock (a
+few microseconds, no cross-process locking). The /api/metrics endpoint sums the
+files of every process, so counters and histograms aggregate correctly across
+gunicorn workers and management commands such as check_alerts.
+
+The files of processes that have exited are folded into metrics_aggregate.json
+and deleted (see helpers.process_files) by the first read after start-up and
+then at most every COMPACT_INTERVAL_SECONDS per process, so scrapes rarely wait
+on the directory lock; until then a dead file is summed like a live one. Their
+counts stay in the totals without METRICS_DIR growing with every worker
+recycle or cron run. Gauges are the exception: they describe a live process
+(a queue's current depth, say), so an exited process's gauges are dropped
+rather than folded. Clear METRICS_DIR when the service is (re)deployed.
+"""
+import bisect
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from django.conf import settings
+
+from helpers.process_files import dead_process_files, directory_lock
+
+# Header: bytes used; entry: key length, key (padded to 8 bytes), float64 value
+_HEADER = struct.Struct("Q")
+_KEY_LENGTH = struct.Struct("I")
+_VALUE = struct.Struct("d")
+INITIAL_FILE_SIZE = 64 * 1024
+AGGREGATE_FILE = "metrics_aggregate.json"
+COMPACT_INTERVAL_SECONDS = 300
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _padded(length: int) -> int:
+    return (length + 7) & ~7
+
+
+def _read_entries(data) -> Iterable[Tuple[str, float, int]]:
+    """Yield (key, value, value_offset) for every complete entry in a file's bytes"""
+    if len(data) < _HEADER.size:
+        return
+    used = _HEADER.unpack_from(data, 0)[0]
+    pos = _HEADER.size
+    while pos < used:
+        length = _KEY_LENGTH.unpack_from(data, pos)[0]
+        key_start = pos + _KEY_LENGTH.size
+        value_offset = _padded(key_start + length)
+        key = bytes(data[key_start:key_start + length]).decode("utf-8")
+        yield key, _VALUE.unpack_from(data, value_offset)[0], value_offset
+        pos = value_offset + _VALUE.size
+
+
+class _ProcessFile:
+    """This process's value file; only ever written by the process that owns it"""
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"metrics_{os.getpid()}.db")
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        size = os.fstat(self._fd).st_size
+        if size < INITIAL_FILE_SIZE:
+            os.ftruncate(self._fd, INITIAL_FILE_SIZE)
+            size = INITIAL_FILE_SIZE
+        self._mm = mmap.mmap(self._fd, size)
+
+        # A file left by an earlier process with the same pid keeps its entries
+        self.positions: Dict[str, int] = {key: offset for key, _, offset in _read_entries(self._mm)}
+        self.used = _HEADER.unpack_from(self._mm, 0)[0] or _HEADER.size
+        _HEADER.pack_into(self._mm, 0, self.used)
+
+    def _allocate(self, key: str) -> int:
+        encoded = key.encode("utf-8")
+        key_start = self.used + _KEY_LENGTH.size
+        value_offset = _padded(key_start + len(encoded))
+        end = value_offset + _VALUE.size
+
+        if end > len(self._mm):
+            new_size = max(len(self._mm) * 2, end)
+            self._mm.close()
+            os.ftruncate(self._fd, new_size)
+            self._mm = mmap.mmap(self._fd, new_size)
+
+        _KEY_LENGTH.pack_into(self._mm, self.used, len(encoded))
+        self._mm[key_start:key_start + len(encoded)] = encoded
+        _VALUE.pack_into(self._mm, value_offset, 0.0)
+        # Publish the entry to readers only once it is fully written
+        self.used = end
+        _HEADER.pack_into(self._mm, 0, end)
+        self.positions[key] = value_offset
+        return value_offset
+
+    def add(self, key: str, amount: float) -> None:
+        offset = self.positions.get(key)
+        if offset is None:
+            offset = self._allocate(key)
+        _VALUE.pack_into(self._mm, offset, _VALUE.unpack_from(self._mm, offset)[0] + amount)
+
+    def set(self, key: str, value: float) -> None:
+        offset = self.positions.get(key)
+        if offset is None:
+            offset = self._allocate(key)
+        _VALUE.pack_into(self._mm, offset, value)
+
+
+class MetricsStore:
+    """Per-process writer plus a reader that sums the files of all processes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._file = None
+        self._pid = None
+        self._compacted_at = None
+
+    @property
+    def directory(self) -> str:
+        return str(settings.METRICS_DIR)
+
+    def _process_file(self) -> _ProcessFile:
+        if self._pid != os.getpid():
+            # First use, or we are a forked child: never write the parent's file.
+            # Locked so a leftover file with our pid isn't folded away while we open it
+            with directory_lock(self.directory):
+                self._file = _ProcessFile(self.directory)
+            self._pid = os.getpid()
+        return self._file
+
+    def add(self, updates: Sequence[Tuple[str, float]]) -> None:
+        with self._lock:
+            process_file = self._process_file()
+            for key, amount in updates:
+                process_file.add(key, amount)
+
+    def set(self, key: str, value: float) -> None:
+        with self._lock:
+            self._process_file().set(key, value)
+
+    def _aggregate_path(self) -> str:
+        return os.path.join(self.directory, AGGREGATE_FILE)
+
+    def _read_aggregate(self) -> Dict[str, float]:
+        try:
+            with open(self._aggregate_path()) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def compact(self) -> int:
+        """Fold the files of exited processes into the aggregate file; returns files folded"""
+        if not os.path.isdir(self.directory):
+            return 0
+        with directory_lock(self.directory):
+            dead = dead_process_files(self.directory, "metrics_", ".db")
+            if not dead:
+                return 0
+            totals = self._read_aggregate()
+            gauges = {metric.name for metric in REGISTRY if metric.kind == "gauge"}
+            for _, path in dead:
+                with open(path, "rb") as f:
+                    for key, value, _ in _read_entries(f.read()):
+                        # A gauge of an exited process no longer describes anything
+                        if json.loads(key)[0] not in gauges:
+                            totals[key] = totals.get(key, 0.0) + value
+            temporary = self._aggregate_path() + ".tmp"
+            with open(temporary, "w") as f:
+                json.dump(totals, f)
+            os.replace(temporary, self._aggregate_path())
+            for _, path in dead:
+                os.remove(path)
+        return len(dead)
+
+    def _compact_if_due(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if self._compacted_at is not None and now - self._compacted_at < COMPACT_INTERVAL_SECONDS:
+                return
+            self._compacted_at = now
+        self.compact()
+
+    def collect(self) -> Dict[str, float]:
+        """Sum of every sample across all processes' files and the aggregate of exited ones"""
+        self._compact_if_due()
+        totals: Dict[str, float] = self._read_aggregate()
+        for path in glob.glob(os.path.join(self.directory, "metrics_*.db")):
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError:
+                continue
+            for key, value, _ in _read_entries(data):
+                totals[key] = totals.get(key, 0.0) + value
+        return totals
+
+
+store = MetricsStore()
+
+# Every metric, in definition order, for the exporter
+REGISTRY: List["_Metric"] = []
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        REGISTRY.append(self)
+
+    def labels(self, *values):
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            child = self._children[values] = self._make_child(values)
+        return child
+
+    def _key(self, suffix: str, values: Tuple[str, ...], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+        return json.dumps([self.name + suffix, list(zip(self.labelnames, values)) + [list(e) for e in extra]])
+
+    def _make_child(self, values):
+        raise NotImplementedError
+
+
+class _CounterChild:
+    def __init__(self, key: str):
+        self._key = key
+
+    def inc(self, amount: float = 1) -> None:
+        store.add(((self._key, amount),))
+
+
+class Counter(_Metric):
+    """Monotonic counter; the name should end in _total"""
+    kind = "counter"
+
+    def _make_child(self, values):
+        return _CounterChild(self._key("", values))
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+
+class _GaugeChild:
+    def __init__(self, key: str):
+        self._key = key
+
+    def set(self, value: float) -> None:
+        store.set(self._key, value)
+
+
+class Gauge(_Metric):
+    """Current value per process, exported as the sum over live processes"""
+    kind = "gauge"
+
+    def _make_child(self, values):
+        return _GaugeChild(self._key("", values))
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+
+class _HistogramChild:
+    def __init__(self, metric: "Histogram", values: Tuple[str, ...]):
+        self._bounds = metric.buckets
+        bucket_labels = [f"{bound}" for bound in metric.buckets] + ["+Inf"]
+        self._bucket_keys = [metric._key("_bucket", values, (("le", le),)) for le in bucket_labels]
+        self._sum_key = metric._key("_sum", values)
+        self._count_key = metric._key("_count", values)
+
+    def observe(self, value: float) -> None:
+        # Buckets are stored non-cumulative and summed up on export
+        bucket = self._bucket_keys[bisect.bisect_left(self._bounds, value)]
+        store.add(((bucket, 1), (self._sum_key, value), (self._count_key, 1)))
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _make_child(self, values):
+        return _HistogramChild(self, values)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+
+def _format_labels(labels: List[List[str]]) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        name + '="' + value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for name, value in labels
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def render_prometheus() -> str:
+    """All registered metrics in the Prometheus text exposition format"""
+    # sample name -> {labels as JSON: value}
+    grouped: Dict[str, Dict[str, float]] = {}
+    for key, value in store.collect().items():
+        sample_name, labels = json.loads(key)
+        grouped.setdefault(sample_name, {})[json.dumps(labels)] = value
+
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+
+        if metric.kind in ("counter", "gauge"):
+            for series, value in sorted(grouped.get(metric.name, {}).items()):
+                lines.append(f"{metric.name}{_format_labels(json.loads(series))} {_format_value(value)}")
+            continue
+
+        # Histogram buckets are stored per bucket; export them cumulative per series
+        buckets: Dict[str, Dict[str, float]] = {}
+        for series, value in grouped.get(metric.name + "_bucket", {}).items():
+            labels = json.loads(series)
+            buckets.setdefault(json.dumps(labels[:-1]), {})[labels[-1][1]] = value
+        sums = grouped.get(metric.name + "_sum", {})
+        counts = grouped.get(metric.name + "_count", {})
+
+        for series in sorted(buckets):
+            labels = json.loads(series)
+            cumulative = 0.0
+            for le in [f"{bound}" for bound in metric.buckets] + ["+Inf"]:
+                cumulative += buckets[series].get(le, 0.0)
+                lines.append(f"{metric.name}_bucket{_format_labels(labels + [['le', le]])} {_format_value(cumulative)}")
+            lines.append(f"{metric.name}_sum{_format_labels(labels)} {_format_value(sums.get(series, 0.0))}")
+            lines.append(f"{metric.name}_count{_format_labels(labels)} {_format_value(counts.get(series, 0.0))}")
+
+    return "\n".join(lines) + "\n"
+
+
+# Application metrics
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Request latency per view", ("view", "method", "status"))
+HTTP_ERRORS = Counter(
+    "http_errors_total", "Responses with a 4xx or 5xx status per view", ("view", "status"))
+DB_QUERIES = Counter(
+    "db_queries_total", "Database queries executed per view", ("view",))
+DB_QUERY_SECONDS = Counter(
+    "db_query_seconds_total", "Time spent in database queries per view", ("view",))
+CACHE_REQUESTS = Counter(
+    "cache_requests_total", "In-process cache lookups by cache and hit/miss", ("cache", "result"))
+UPSTREAM_DURATION = Histogram(
+    "upstream_request_duration_seconds", "Microservice call latency", ("service", "status"))
+UPSTREAM_ERRORS = Counter(
+    "upstream_errors_total", "Microservice calls that failed without a response", ("service",))
+UPSTREAM_EJECTIONS = Counter(
+    "upstream_ejections_total", "Replicas taken out of rotation after consecutive failures", ("service",))
+UPSTREAM_HEDGES = Counter(
+    "upstream_hedged_requests_total", "Hedged second attempts, by which attempt answered first", ("service", "winner"))
+ADMISSION_DECISIONS = Counter(
+    "admission_decisions_total", "Cost-controlled requests by scope and admission outcome", ("scope", "outcome"))
+ADMISSION_COST = Counter(
+    "admission_cost_total", "Cost units admitted per scope", ("scope",))
+ADMISSION_QUEUE_SECONDS = Histogram(
+    "admission_queue_seconds", "Time requests waited for capacity before being admitted", ("scope",),
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+CLIENT_ERRORS_REPORTED = Counter(
+    "client_errors_reported_total", "Errors reported to the error log endpoint", ("type",))
+ALERT_CHECK_DURATION = Histogram(
+    "alert_check_duration_seconds", "Duration of one check_alerts shard",
+    buckets=(0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0))
+ALERTS_CHECKED = Counter("alerts_checked_total", "Alerts evaluated by check_alerts")
+ALERTS_TRIGGERED = Counter("alerts_triggered_total", "Alerts triggered (email sent) by check_alerts")
+EVENT_BUS_EVENTS = Counter(
+    "event_bus_events_total", "Events published on the in-process event bus, queued or dropped", ("event", "outcome"))
+EVENT_BUS_QUEUE_DEPTH = Gauge(
+    "event_bus_queue_depth", "Events waiting for an event bus worker")
+EVENT_BUS_HANDLER_SECONDS = Histogram(
+    "event_bus_handler_seconds", "Event handler run time, by handler and whether it raised", ("handler", "outcome"),
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0))
@@ -0,0 +1,63 @@
+"""
+Housekeeping for directories of per-process files (metrics, continuous profiles).
+
+Each process writes its own file named after its pid, which keeps writes free
+of cross-process locking but leaves one file behind per process that ever ran.
+Readers fold the files of processes that have exited into one aggregate file
+and delete them, so the directory stays as large as the set of live processes.
+
+Folding and creating a process file both happen under an exclusive lock on the
+directory, so a process that reuses a dead pid never has its new file folded
+away. Where flock isn't available (Windows) nothing is folded.
+"""
+import os
+import re
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+LOCK_FILE = ".lock"
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Exists, but belongs to another user
+        return True
+    return True
+
+
+@contextmanager
+def directory_lock(directory) -> Iterator[bool]:
+    """Hold the directory's exclusive lock; yields False (and doesn't lock) where flock is unavailable"""
+    if fcntl is None:
+        yield False
+        return
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, LOCK_FILE), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def dead_process_files(directory, prefix: str, suffix: str) -> List[Tuple[int, Path]]:
+    """(pid, path) of every `<prefix><pid><suffix>` file whose process has exited; call under directory_lock"""
+    if fcntl is None:
+        return []
+    pattern = re.compile(rf"^{re.escape(prefix)}(\d+){re.escape(suffix)}$")
+    dead = []
+    for path in Path(directory).glob(f"{prefix}*{suffix}"):
+        match = pattern.match(path.name)
+        if match and int(match.group(1)) != os.getpid() and not pid_alive(int(match.group(1))):
+            dead.append((int(match.group(1)), path))
+    return dead
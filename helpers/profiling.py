@@ -0,0 +1,296 @@
+"""
+On-demand and continuous CPU profiling of API requests.
+
+On demand: a staff user adds `?_profile=cprofile` (or `sampling`) or an
+`X-Profile` header to any request. ProfilingMiddleware runs that request under
+cProfile, or under a stack sampler thread, and stores the result in
+PROFILES_DIR: a .prof file (load with pstats or snakeviz) or a .folded file of
+collapsed stacks (flamegraph.pl, speedscope). The response carries the
+profile's id in X-Profile-Id; staff list and download profiles at
+/api/profiles/.
+
+Continuous: with PROFILING_CONTINUOUS enabled, one sampler thread per process
+records the stacks of threads that are handling a request every
+PROFILING_CONTINUOUS_INTERVAL_MS, aggregated per endpoint, and flushes them to
+a per-process file. /api/profiles/flamegraph/ merges the files of all
+processes into folded stacks per endpoint, first folding the files of exited
+processes into one aggregate file (see helpers.process_files).
+
+With PROFILING_ENABLED off the middleware removes itself at startup, so there
+is no per-request cost at all.
+"""
+import cProfile
+import io
+import json
+import logging
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+
+from helpers.process_files import dead_process_files, directory_lock
+
+logger = logging.getLogger(__name__)
+
+MODES = ("cprofile", "sampling")
+EXTENSIONS = {"cprofile": ".prof", "sampling": ".folded"}
+FLAME_FILE_PREFIX = "flame_"
+FLAME_AGGREGATE_FILE = "flame_aggregate.json"
+
+
+def profiles_dir() -> Path:
+    path = Path(settings.PROFILES_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    root = str(settings.BASE_DIR)
+    if filename.startswith(root):
+        filename = os.path.relpath(filename, root)
+    elif "site-packages" in filename:
+        filename = filename.split("site-packages" + os.sep, 1)[1]
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame) -> str:
+    """A frame's stack, outermost first, in the folded format ("a;b;c")"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+def folded(stacks: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+class StackSampler:
+    """Samples one thread's stack at a fixed interval on a background thread"""
+
+    def __init__(self, thread_id: int, interval_ms: float):
+        self.thread_id = thread_id
+        self.interval = interval_ms / 1000
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse_stack(frame)] += 1
+
+
+def profile_call(mode: str, fn, *args, interval_ms: float = 1.0):
+    """Run fn(*args) under the given profiler; returns (result, profile data as bytes)"""
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        result = profiler.runcall(fn, *args)
+        profiler.create_stats()
+        # Same bytes as Profile.dump_stats, so pstats.Stats() can load the file
+        return result, marshal.dumps(profiler.stats)
+
+    sampler = StackSampler(threading.get_ident(), interval_ms).start()
+    try:
+        result = fn(*args)
+    finally:
+        stacks = sampler.stop()
+    return result, folded(stacks).encode("utf-8")
+
+
+def save_profile(mode: str, data: bytes, metadata: Dict[str, Any]) -> str:
+    """Store a profile with its metadata; returns its id. Only the newest PROFILING_MAX_PROFILES are kept."""
+    directory = profiles_dir()
+    profile_id = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+    (directory / f"{profile_id}{EXTENSIONS[mode]}").write_bytes(data)
+    (directory / f"{profile_id}.json").write_text(json.dumps({"id": profile_id, "mode": mode, **metadata}))
+
+    for stale in list_profiles()[settings.PROFILING_MAX_PROFILES:]:
+        delete_profile(stale["id"])
+    return profile_id
+
+
+def list_profiles() -> List[Dict[str, Any]]:
+    """Metadata of every stored profile, newest first"""
+    profiles = []
+    for path in profiles_dir().glob("*.json"):
+        if path.name.startswith(FLAME_FILE_PREFIX):
+            continue
+        try:
+            profiles.append(json.loads(path.read_text()))
+        except (OSError, ValueError):
+            continue
+    return sorted(profiles, key=lambda profile: profile["id"], reverse=True)
+
+
+def _profile_paths(profile_id: str) -> Optional[Dict[str, Path]]:
+    # Ids are generated by save_profile; anything else (e.g. "../x") is not a profile
+    if not profile_id or Path(profile_id).name != profile_id or profile_id.startswith(FLAME_FILE_PREFIX):
+        return None
+    directory = profiles_dir()
+    metadata = directory / f"{profile_id}.json"
+    if not metadata.exists():
+        return None
+    mode = json.loads(metadata.read_text())["mode"]
+    return {"metadata": metadata, "data": directory / f"{profile_id}{EXTENSIONS[mode]}"}
+
+
+def get_profile(profile_id: str) -> Optional[Dict[str, Any]]:
+    """A stored profile's metadata plus its data file path, or None"""
+    paths = _profile_paths(profile_id)
+    if paths is None:
+        return None
+    return {**json.loads(paths["metadata"].read_text()), "path": paths["data"]}
+
+
+def profile_summary(path: Path, limit: int = 60) -> str:
+    """pstats text report of a cProfile file, by cumulative time"""
+    output = io.StringIO()
+    stats = pstats.Stats(str(path), stream=output)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit)
+    return output.getvalue()
+
+
+def delete_profile(profile_id: str) -> None:
+    paths = _profile_paths(profile_id)
+    if paths is None:
+        return
+    for path in paths.values():
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class ContinuousSampler:
+    """
+    Low-rate sampler of every thread that is handling a request, aggregated per
+    endpoint. One per process; started by the first request a process serves.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # thread id -> request being handled on it
+        self._active: Dict[int, Any] = {}
+        self._stacks: Dict[str, Counter] = {}
+        self._pid = None
+        self._last_flush = 0.0
+
+    def _ensure_thread(self) -> None:
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                # First use, or a forked child that must not flush the parent's samples
+                self._pid = os.getpid()
+                self._active.clear()
+                self._stacks = {}
+                threading.Thread(target=self._run, name="continuous-profiler", daemon=True).start()
+
+    def begin(self, request) -> None:
+        self._ensure_thread()
+        self._active[threading.get_ident()] = request
+
+    def end(self) -> None:
+        self._active.pop(threading.get_ident(), None)
+
+    def _endpoint(self, request) -> str:
+        match = getattr(request, "resolver_match", None)
+        return f"{request.method} {match.view_name if match else request.path}"
+
+    def _run(self) -> None:
+        interval = settings.PROFILING_CONTINUOUS_INTERVAL_MS / 1000
+        while True:
+            time.sleep(interval)
+            frames = sys._current_frames()
+            for thread_id, request in list(self._active.items()):
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                endpoint = self._endpoint(request)
+                with self._lock:
+                    self._stacks.setdefault(endpoint, Counter())[collapse_stack(frame)] += 1
+
+            if time.monotonic() - self._last_flush >= settings.PROFILING_FLUSH_SECONDS:
+                self.flush()
+
+    def flush(self) -> None:
+        """Write this process's aggregate (all samples since it started) to its file"""
+        with self._lock:
+            data = {endpoint: dict(stacks) for endpoint, stacks in self._stacks.items()}
+        path = profiles_dir() / f"{FLAME_FILE_PREFIX}{os.getpid()}.json"
+        temporary = path.with_suffix(".tmp")
+        try:
+            temporary.write_text(json.dumps(data))
+            # Locked so a leftover file with our pid isn't being folded away as we replace it
+            with directory_lock(path.parent):
+                os.replace(temporary, path)
+        except OSError as e:
+            logger.error(f"Could not write continuous profile: {str(e)}")
+        self._last_flush = time.monotonic()
+
+
+continuous_sampler = ContinuousSampler()
+
+
+def _read_flame_file(path: Path) -> Dict[str, Dict[str, int]]:
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def compact_flame_files() -> int:
+    """Fold the flame files of exited processes into the aggregate file; returns files folded"""
+    directory = profiles_dir()
+    with directory_lock(directory):
+        dead = dead_process_files(directory, FLAME_FILE_PREFIX, ".json")
+        if not dead:
+            return 0
+        aggregate_path = directory / FLAME_AGGREGATE_FILE
+        merged = {endpoint: Counter(stacks) for endpoint, stacks in _read_flame_file(aggregate_path).items()}
+        for _, path in dead:
+            for endpoint, stacks in _read_flame_file(path).items():
+                merged.setdefault(endpoint, Counter()).update(stacks)
+        temporary = aggregate_path.with_suffix(".tmp")
+        temporary.write_text(json.dumps({endpoint: dict(stacks) for endpoint, stacks in merged.items()}))
+        os.replace(temporary, aggregate_path)
+        for _, path in dead:
+            path.unlink()
+    return len(dead)
+
+
+def flame_graph_data() -> Dict[str, Counter]:
+    """Continuous samples per endpoint, summed over every process's file and the aggregate of exited ones"""
+    compact_flame_files()
+    merged: Dict[str, Counter] = {}
+    for path in profiles_dir().glob(f"{FLAME_FILE_PREFIX}*.json"):
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        for endpoint, stacks in data.items():
+            merged.setdefault(endpoint, Counter()).update(stacks)
+    return merged
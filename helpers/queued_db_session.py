@@ -0,0 +1,19 @@
+"""
+Database session engine whose writes go through the single-writer queue.
+
+Use with SESSION_ENGINE = "helpers.queued_db_session".
+"""
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+
+from helpers.write_queue import get_write_queue
+
+
+class SessionStore(DBStore):
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+        return get_write_queue().run(super().save, must_create)
+
+    def delete(self, session_key=None):
+        return get_write_queue().run(super().delete, session_key)
@@ -0,0 +1,11 @@
+from rest_framework.renderers import JSONRenderer
+
+from helpers.request_timing import span
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """JSONRenderer that reports its encoding time as "serialize" in Server-Timing"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with span("serialize"):
+            return super().render(data, accepted_media_type, renderer_context)
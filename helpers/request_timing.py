@@ -0,0 +1,79 @@
+"""
+Per-request timing breakdown (DB, upstream services, serialization).
+
+RequestTimingMiddleware activates a RequestTimings for sampled requests; code
+anywhere in the request then records into it with `span(name)` (or `record`),
+and the totals are emitted as a Server-Timing header and one log line.
+Outside a sampled request these calls are no-ops.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+
+_current: "ContextVar[Optional[RequestTimings]]" = ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    """Accumulated durations (seconds) and counts per named phase of one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+
+    def record(self, name: str, seconds: float, count: int = 1) -> None:
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+        self.counts[name] = self.counts.get(name, 0) + count
+
+    def db_wrapper(self, execute, sql, params, many, context):
+        """connection.execute_wrapper hook: time every query on this connection"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.record("db", time.perf_counter() - started)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def server_timing(self) -> str:
+        """Server-Timing header value, durations in milliseconds"""
+        parts = [
+            f'{name};dur={seconds * 1000:.2f};desc="{self.counts[name]}"'
+            for name, seconds in self.durations.items()
+        ]
+        parts.append(f"total;dur={self.elapsed() * 1000:.2f}")
+        return ", ".join(parts)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    return _current.get()
+
+
+def activate(timings: Optional[RequestTimings]):
+    return _current.set(timings)
+
+
+def deactivate(token) -> None:
+    _current.reset(token)
+
+
+def record(name: str, seconds: float, count: int = 1) -> None:
+    timings = _current.get()
+    if timings is not None:
+        timings.record(name, seconds, count)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Time the enclosed block under `name` for the current request"""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.record(name, time.perf_counter() - started)
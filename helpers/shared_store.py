@@ -0,0 +1,225 @@
+"""
+Process-safe counter store backed by a small dedicated SQLite file.
+
+Django's default cache is per-process LocMem, so counters kept there (failed
+logins, lockouts, rate limits) are not shared between workers. This store keeps
+them in a separate SQLite database in WAL mode: every worker process and thread
+sees the same values, and increments are single atomic statements.
+"""
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Roughly one write in this many also purges expired rows
+PURGE_EVERY = 1000
+# Token buckets idle for this long are purged (they must refill within it)
+BUCKET_IDLE_SECONDS = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS counters (
+    key        TEXT PRIMARY KEY,
+    value      INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS token_buckets (
+    key        TEXT PRIMARY KEY,
+    tokens     REAL NOT NULL,
+    updated_at REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+class SharedStore:
+    """Atomic increment-with-TTL store shared by all worker processes"""
+
+    def __init__(self, path: Optional[str] = None):
+        self._path = path
+        self._local = threading.local()
+
+    @property
+    def path(self) -> str:
+        if self._path is None:
+            self._path = str(settings.SHARED_STORE_PATH)
+        return self._path
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread, reopened after a fork
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=NORMAL;")
+            conn.execute("PRAGMA busy_timeout=5000;")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def incr(self, key: str, amount: int = 1, ttl: float = 60) -> int:
+        """Atomically add `amount` to a counter and (re)set its TTL; returns the new value"""
+        now = time.time()
+        conn = self._connection()
+        row = conn.execute(
+            """
+            INSERT INTO counters (key, value, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET
+                value = CASE WHEN counters.expires_at <= ? THEN excluded.value
+                             ELSE counters.value + excluded.value END,
+                expires_at = excluded.expires_at
+            RETURNING value
+            """,
+            (key, amount, now + ttl, now),
+        ).fetchone()
+        if random.randrange(PURGE_EVERY) == 0:
+            self.purge_expired()
+        return row[0]
+
+    def get(self, key: str) -> Optional[int]:
+        """Current value of a counter, or None if missing or expired"""
+        row = self._connection().execute(
+            "SELECT value FROM counters WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: int, ttl: float) -> None:
+        self._connection().execute(
+            "INSERT OR REPLACE INTO counters (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, time.time() + ttl),
+        )
+
+    def delete(self, *keys: str) -> None:
+        self._connection().executemany("DELETE FROM counters WHERE key = ?", [(key,) for key in keys])
+
+    def ttl(self, key: str) -> Optional[int]:
+        """Seconds until a key expires, or None if missing or expired"""
+        now = time.time()
+        row = self._connection().execute(
+            "SELECT expires_at FROM counters WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        return int(row[0] - now + 0.999) if row else None
+
+    def hit_sliding_window(self, key: str, limit: int, window: float) -> Tuple[bool, Optional[float]]:
+        """
+        Record a hit against a sliding-window limit of `limit` hits per `window` seconds.
+
+        Uses the sliding-window-counter approximation: the previous fixed window's
+        count is weighted by how much of it still overlaps the sliding window.
+        Read and increment run in one IMMEDIATE transaction, so concurrent workers
+        can't overshoot the limit. Returns (allowed, retry_after_seconds).
+        """
+        now = time.time()
+        bucket = int(now // window)
+        elapsed = (now % window) / window
+        current_key = f"{key}:{bucket}"
+        previous_key = f"{key}:{bucket - 1}"
+
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = dict(conn.execute(
+                "SELECT key, value FROM counters WHERE key IN (?, ?) AND expires_at > ?",
+                (current_key, previous_key, now),
+            ).fetchall())
+            previous = rows.get(previous_key, 0)
+            current = rows.get(current_key, 0)
+            estimate = previous * (1 - elapsed) + current
+
+            if estimate >= limit:
+                conn.execute("COMMIT")
+                until_next_bucket = (1 - elapsed) * window
+                if previous and current < limit:
+                    return False, min((estimate - limit) / previous * window + 0.001, until_next_bucket)
+                return False, until_next_bucket
+
+            conn.execute(
+                """
+                INSERT INTO counters (key, value, expires_at) VALUES (?, 1, ?)
+                ON CONFLICT (key) DO UPDATE SET value = counters.value + 1
+                """,
+                (current_key, (bucket + 2) * window),
+            )
+            conn.execute("COMMIT")
+            return True, None
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def take_tokens(
+        self, buckets: List[Tuple[str, float, float]], cost: float
+    ) -> Tuple[bool, Optional[float], Optional[str]]:
+        """
+        Take `cost` tokens from every one of several token buckets, or from none.
+
+        Each bucket is (key, capacity, refill per second) and starts full. All
+        buckets are read, refilled and debited in one IMMEDIATE transaction, so
+        concurrent workers can't overdraw them. Returns (taken, retry_after_seconds,
+        key): when refused, how long until every bucket will hold `cost` tokens,
+        and the first bucket (in the order given) that is short.
+        """
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            stored = dict(
+                (key, (tokens, updated_at)) for key, tokens, updated_at in conn.execute(
+                    f"SELECT key, tokens, updated_at FROM token_buckets WHERE key IN ({','.join('?' * len(buckets))})",
+                    [key for key, _, _ in buckets],
+                )
+            )
+            levels = []
+            retry_after, limiting = 0.0, None
+            for key, capacity, refill in buckets:
+                tokens, updated_at = stored.get(key, (capacity, now))
+                tokens = min(capacity, tokens + (now - updated_at) * refill)
+                levels.append((key, tokens))
+                if tokens < cost:
+                    retry_after = max(retry_after, (cost - tokens) / refill)
+                    limiting = limiting or key
+
+            if limiting is not None:
+                conn.execute("COMMIT")
+                return False, retry_after, limiting
+
+            conn.executemany(
+                "INSERT OR REPLACE INTO token_buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                [(key, tokens - cost, now) for key, tokens in levels],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if random.randrange(PURGE_EVERY) == 0:
+            self.purge_expired()
+        return True, None, None
+
+    def return_tokens(self, keys: List[str], amount: float) -> None:
+        """Give back tokens taken for work that didn't run (capacity is reapplied on the next take)"""
+        self._connection().execute(
+            f"UPDATE token_buckets SET tokens = tokens + ? WHERE key IN ({','.join('?' * len(keys))})",
+            [amount, *keys],
+        )
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        conn = self._connection()
+        cursor = conn.execute("DELETE FROM counters WHERE expires_at <= ?", (now,))
+        purged = cursor.rowcount
+        # A bucket untouched this long has refilled; dropping it is the same as keeping it full
+        cursor = conn.execute("DELETE FROM token_buckets WHERE updated_at <= ?", (now - BUCKET_IDLE_SECONDS,))
+        return purged + cursor.rowcount
+
+
+shared_store = SharedStore()
+
+
+def get_shared_store() -> SharedStore:
+    """Return the process-wide SharedStore instance."""
+    return shared_store
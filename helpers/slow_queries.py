@@ -0,0 +1,202 @@
+"""
+Slow query log.
+
+SlowQueryLog is installed as an execute wrapper on every database connection
+(see MiscellaneousConfig.ready), so it sees queries from requests, management
+commands and background threads alike. Queries at or over
+SLOW_QUERY_THRESHOLD_MS are logged as one JSON line on the "slow_queries"
+logger and folded into a SlowQuery row per fingerprint (the SQL with literals
+and placeholders normalised), which staff can read at /api/slow-queries/.
+
+Queries cancelled at their request's deadline (see helpers.deadlines) are
+recorded here too, whatever their duration, and counted per fingerprint.
+
+The first time a process sees a fingerprint it also captures SQLite's
+EXPLAIN QUERY PLAN for it; a plan that scans all of `prices` (rather than
+searching idx_prices_symbol_ts_readable or the primary key) is flagged.
+
+Parameter values can hold session keys, password hashes and personal data, so
+they are left out of the log line and the SlowQuery row unless
+SLOW_QUERY_LOG_PARAMS is on, and even then never for the session and auth
+tables (SENSITIVE_TABLES).
+
+Below the threshold the cost is two perf_counter calls per query.
+"""
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+import traceback
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from django.conf import settings
+
+logger = logging.getLogger("slow_queries")
+
+FLAGGED_TABLE = "prices"
+# Statements EXPLAIN QUERY PLAN can describe (not PRAGMA, SAVEPOINT, ...)
+_EXPLAINABLE = ("SELECT", "WITH", "UPDATE", "DELETE", "INSERT", "REPLACE")
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+_PLACEHOLDER = re.compile(r"%s|\?")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+# Tables whose parameters are never logged: sessions, django.contrib.auth and the custom_auth app
+SENSITIVE_TABLES = re.compile(r"\b(?:django_session|auth_\w+|custom_auth_\w+)\b", re.IGNORECASE)
+
+# fingerprint -> plan, captured once per process (shared by every connection's wrapper)
+_plans: Dict[str, "QueryPlan"] = {}
+
+_PROJECT_ROOT = str(settings.BASE_DIR)
+_THIS_FILE = str(Path(__file__).resolve())
+
+
+def normalize_sql(sql: str) -> str:
+    """SQL with literals and placeholders as ? and IN lists collapsed, so one shape maps to one fingerprint"""
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _PLACEHOLDER.sub("?", sql)
+    sql = _IN_LIST.sub("(...)", sql)
+    return _WHITESPACE.sub(" ", sql).strip()
+
+
+def fingerprint_sql(normalized: str) -> str:
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def query_source(exclude: Sequence[str] = (), stack: Optional[traceback.StackSummary] = None) -> str:
+    """
+    Where in project code a query was issued: the innermost view, service or
+    management command frame, else the innermost project frame at all. Looks at
+    the current stack unless given another (e.g. the one an exception was raised from).
+    """
+    skipped = {_THIS_FILE, *exclude}
+    fallback = None
+    for frame in reversed(stack if stack is not None else traceback.extract_stack()[:-1]):
+        if frame.filename.startswith("<"):
+            continue
+        filename = str(Path(frame.filename).resolve())
+        if not filename.startswith(_PROJECT_ROOT) or filename in skipped or "site-packages" in filename:
+            continue
+        location = f"{Path(filename).relative_to(_PROJECT_ROOT)}:{frame.lineno} in {frame.name}"
+        if "views" in filename or "services" in filename or "commands" in filename:
+            return location
+        fallback = fallback or location
+    return fallback or "<django internals>"
+
+
+def loggable_params(sql: str, params, many: bool) -> str:
+    """What the log keeps of a query's parameters: their repr only if allowed for this statement"""
+    if many:
+        return "<executemany>"
+    if not getattr(settings, "SLOW_QUERY_LOG_PARAMS", False) or SENSITIVE_TABLES.search(sql):
+        return f"<{len(params or ())} redacted>"
+    return repr(params)[:2000]
+
+
+@dataclass
+class QueryPlan:
+    lines: List[str] = field(default_factory=list)
+    # Tables read in full (a SCAN step, with or without a covering index)
+    scanned_tables: List[str] = field(default_factory=list)
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.lines)
+
+    @property
+    def flagged(self) -> bool:
+        return FLAGGED_TABLE in self.scanned_tables
+
+
+class SlowQueryLog:
+    """Execute wrapper that logs and aggregates queries over the threshold"""
+
+    def __init__(self, threshold_ms: float):
+        self.threshold = threshold_ms / 1000
+        self._local = threading.local()
+
+    def __call__(self, execute, sql, params, many, context):
+        if getattr(self._local, "busy", False):
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        result = execute(sql, params, many, context)
+        elapsed = time.perf_counter() - started
+
+        if elapsed >= self.threshold:
+            self._local.busy = True
+            try:
+                record(sql, params, many, context["connection"], elapsed)
+            except Exception as e:
+                logger.error(f"Could not record slow query: {str(e)}")
+            finally:
+                self._local.busy = False
+        return result
+
+
+def explain(connection, sql: str, params) -> QueryPlan:
+    plan = QueryPlan()
+    if not sql.lstrip().upper().startswith(_EXPLAINABLE):
+        return plan
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        for row in cursor.fetchall():
+            # (id, parent, notused, detail), e.g. "SEARCH prices USING INDEX idx_... (symbol=?)"
+            detail = row[3]
+            plan.lines.append(detail)
+            words = detail.split()
+            if words[0] == "SCAN" and len(words) > 1:
+                plan.scanned_tables.append(words[1])
+    return plan
+
+
+def record(sql: str, params, many: bool, connection, elapsed: float, cancelled: bool = False,
+           caller: Optional[str] = None) -> None:
+    """
+    Log one slow (or cancelled) execution and queue it for its fingerprint's
+    SlowQuery row; caller defaults to query_source() of the current stack.
+    """
+    # Avoid feeding the log its own bookkeeping queries
+    if "miscellaneous_slowquery" in sql:
+        return
+    normalized = normalize_sql(sql)
+    fingerprint = fingerprint_sql(normalized)
+
+    plan = _plans.get(fingerprint)
+    captured = plan is None
+    if captured:
+        plan = QueryPlan() if many else explain(connection, sql, params)
+        _plans[fingerprint] = plan
+
+    entry = {
+        "fingerprint": fingerprint,
+        "sql": normalized,
+        "example_sql": sql,
+        "params": loggable_params(sql, params, many),
+        "caller": caller or query_source(),
+        "duration_ms": round(elapsed * 1000, 2),
+        "cancelled": cancelled,
+        "plan": plan.text if captured else None,
+        "scanned_tables": plan.scanned_tables,
+        "prices_full_scan": plan.flagged,
+    }
+    logger.warning(json.dumps(entry))
+
+    from helpers.write_queue import get_write_queue
+    from miscellaneous.services.slow_query_service import get_slow_query_service
+    # Fire and forget: the slow request shouldn't also wait on the bookkeeping write
+    get_write_queue().submit(get_slow_query_service().record_query, entry, elapsed, cancelled)
+
+
+def install(sender, connection, **kwargs) -> None:
+    """connection_created receiver: add the slow query log to the connection once"""
+    if not getattr(settings, "SLOW_QUERY_LOG_ENABLED", False):
+        return
+    if not any(isinstance(wrapper, SlowQueryLog) for wrapper in connection.execute_wrappers):
+        connection.execute_wrappers.insert(0, SlowQueryLog(getattr(settings, "SLOW_QUERY_THRESHOLD_MS", 100)))
@@ -0,0 +1,304 @@
+"""
+Local stand-ins for the technical-analysis, LSTM, sentiment and notification
+microservices, for load and timeout testing where the real ones don't run.
+
+Each stand-in answers the same requests the proxy views and send_alert_email
+make, with made-up but well-formed results (derived from the symbol, so a
+symbol always gets the same answer). Every request first goes through the
+service's FaultProfile: a latency drawn from a configurable distribution, then
+possibly an error status or a hang (the connection is held open without a
+reply, then dropped). A request that carries X-Request-Deadline-Ms gets a 504
+once that budget is spent instead of waiting out the full delay. Draws come from a seeded generator per service, so a
+given seed and request order always produce the same delays and failures.
+
+Profiles can be changed while running: GET /__faults__ returns a service's
+profile and PUT /__faults__ with a JSON body updates any of its fields.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from dataclasses import asdict, dataclass, fields
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Tuple
+from urllib.parse import urlparse
+
+from helpers import deadlines
+from helpers.env_variables import (
+    LSTM_SERVICE_URLS, NOTIFICATION_SERVICE_URLS, SENTIMENT_ANALYSIS_SERVICE_URLS, TECHNICAL_ANALYSIS_SERVICE_URLS,
+)
+
+logger = logging.getLogger(__name__)
+
+FAULTS_PATH = "/__faults__"
+
+# name -> (parameter names, sampler taking a Random and the parameters, in ms)
+LATENCY_DISTRIBUTIONS: Dict[str, Tuple[Tuple[str, ...], Callable[..., float]]] = {
+    "fixed": (("ms",), lambda rng, ms: ms),
+    "uniform": (("low_ms", "high_ms"), lambda rng, low, high: rng.uniform(low, high)),
+    "normal": (("mean_ms", "stddev_ms"), lambda rng, mean, stddev: max(0.0, rng.gauss(mean, stddev))),
+    # Median and shape; sigma around 0.5-1 gives the long tail real services have
+    "lognormal": (("median_ms", "sigma"), lambda rng, median, sigma: median * rng.lognormvariate(0, sigma)),
+    "exponential": (("mean_ms",), lambda rng, mean: rng.expovariate(1 / mean) if mean > 0 else 0.0),
+}
+
+
+def parse_latency(spec: str) -> Tuple[str, Tuple[float, ...]]:
+    """'lognormal:200:0.5' -> ('lognormal', (200.0, 0.5))"""
+    name, *values = spec.split(":")
+    if name not in LATENCY_DISTRIBUTIONS:
+        raise ValueError(f'Unknown latency distribution "{name}" (use one of {", ".join(LATENCY_DISTRIBUTIONS)})')
+    parameter_names = LATENCY_DISTRIBUTIONS[name][0]
+    if len(values) != len(parameter_names):
+        raise ValueError(f'"{name}" latency takes {":".join(parameter_names)}, got "{spec}"')
+    try:
+        return name, tuple(float(value) for value in values)
+    except ValueError:
+        raise ValueError(f'Latency parameters must be numbers, got "{spec}"')
+
+
+@dataclass
+class FaultProfile:
+    latency: str = "fixed:0"
+    # Fraction of requests answered with error_status (after the latency)
+    error_rate: float = 0.0
+    error_status: int = 500
+    # Fraction of requests that get no reply; the connection is dropped after hang_seconds
+    hang_rate: float = 0.0
+    hang_seconds: float = 3600.0
+
+    def __post_init__(self):
+        parse_latency(self.latency)
+        for name in ("error_rate", "hang_rate"):
+            if not 0 <= getattr(self, name) <= 1:
+                raise ValueError(f"{name} must be between 0 and 1")
+
+
+@dataclass
+class Outcome:
+    delay: float
+    hang: bool
+    error: bool
+
+
+class FaultInjector:
+    """Draws each request's delay and failure from a profile, deterministically per seed"""
+
+    def __init__(self, profile: FaultProfile, seed: int):
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self.profile = profile
+
+    def update(self, changes: Dict[str, Any]) -> FaultProfile:
+        known = {f.name for f in fields(FaultProfile)}
+        unknown = set(changes) - known
+        if unknown:
+            raise ValueError(f"Unknown fault settings: {', '.join(sorted(unknown))}")
+        with self._lock:
+            self.profile = FaultProfile(**{**asdict(self.profile), **changes})
+            return self.profile
+
+    def draw(self) -> Outcome:
+        with self._lock:
+            profile = self.profile
+            name, parameters = parse_latency(profile.latency)
+            delay = LATENCY_DISTRIBUTIONS[name][1](self._rng, *parameters) / 1000
+            # Always draw both so one setting doesn't shift the other's sequence
+            hang_draw, error_draw = self._rng.random(), self._rng.random()
+        if hang_draw < profile.hang_rate:
+            return Outcome(profile.hang_seconds, hang=True, error=False)
+        return Outcome(delay, hang=False, error=error_draw < profile.error_rate)
+
+
+# Response bodies; each returns (status, body) for a parsed JSON request
+
+def _symbol_rng(*parts) -> random.Random:
+    return random.Random(":".join(str(part) for part in parts))
+
+
+def _missing(payload: Dict[str, Any], *names: str):
+    missing = [name for name in names if not payload.get(name)]
+    if missing:
+        return 422, {"detail": f"Missing field(s): {', '.join(missing)}"}
+    return None
+
+
+def technical_analysis(payload):
+    invalid = _missing(payload, "symbol", "timeframe")
+    if invalid:
+        return invalid
+    symbol, timeframe = payload["symbol"], payload["timeframe"]
+    if timeframe not in ("1d", "1w", "1m"):
+        return 404, {"detail": f"No data for timeframe {timeframe}"}
+    rng = _symbol_rng(symbol, timeframe)
+    price = rng.uniform(0.1, 50_000)
+    macd = rng.gauss(0, price * 0.01)
+    signal_line = macd + rng.gauss(0, price * 0.002)
+    rsi = rng.uniform(10, 90)
+    return 200, {
+        "symbol": symbol,
+        "timeframe": timeframe,
+        "price": round(price, 4),
+        "indicators": {
+            "rsi": round(rsi, 2),
+            "macd": {"macd": round(macd, 4), "signal": round(signal_line, 4),
+                     "histogram": round(macd - signal_line, 4)},
+            "sma_20": round(price * rng.uniform(0.9, 1.1), 4),
+            "ema_50": round(price * rng.uniform(0.85, 1.15), 4),
+            "bollinger": {"upper": round(price * 1.05, 4), "middle": round(price, 4),
+                          "lower": round(price * 0.95, 4)},
+        },
+        "signal": "BUY" if rsi < 30 else "SELL" if rsi > 70 else "HOLD",
+    }
+
+
+def lstm_prediction(payload):
+    invalid = _missing(payload, "crypto")
+    if invalid:
+        return invalid
+    crypto = payload["crypto"]
+    rng = _symbol_rng(crypto, payload.get("lookback"), payload.get("epochs"))
+    price = rng.uniform(0.1, 50_000)
+    predictions = []
+    for day in range(1, 8):
+        price *= 1 + rng.gauss(0, 0.02)
+        predictions.append({"day": day, "price": round(price, 4)})
+    return 200, {
+        "crypto": crypto,
+        "lookback": payload.get("lookback", 30),
+        "epochs": payload.get("epochs", 5),
+        "predictions": predictions,
+        "metrics": {"rmse": round(rng.uniform(0.01, 0.1) * price, 4),
+                    "mae": round(rng.uniform(0.005, 0.05) * price, 4)},
+    }
+
+
+def sentiment_analysis(payload):
+    invalid = _missing(payload, "symbol")
+    if invalid:
+        return invalid
+    symbol = payload["symbol"]
+    rng = _symbol_rng(symbol)
+    return 200, {
+        "symbol": symbol,
+        "price_sentiment_chart": f"/media/analysis/{symbol}_price_sentiment.png",
+        "addresses_chart": f"/media/analysis/{symbol}_addresses.png",
+        "correlations": {
+            "sentiment": round(rng.uniform(-1, 1), 3),
+            "tweet_volume": round(rng.uniform(-1, 1), 3),
+            "active_addresses": round(rng.uniform(-1, 1), 3),
+        },
+    }
+
+
+def send_email(payload):
+    invalid = _missing(payload, "subject", "body", "recipients")
+    if invalid:
+        return invalid
+    return 200, {"status": "sent", "recipients": len(payload["recipients"])}
+
+
+@dataclass
+class StubService:
+    name: str
+    # One stand-in replica is served per URL
+    base_urls: List[str]
+    # POST path -> response body function
+    routes: Dict[str, Callable[[Dict[str, Any]], Tuple[int, Dict[str, Any]]]]
+
+    @property
+    def ports(self) -> List[int]:
+        # Port 0 binds a free port (see each server's server_address)
+        ports = [urlparse(url.strip()).port for url in self.base_urls if url.strip()]
+        return [80 if port is None else port for port in ports]
+
+
+SERVICES = {
+    "technical_analysis": StubService("technical_analysis", TECHNICAL_ANALYSIS_SERVICE_URLS,
+                                      {"/analyze": technical_analysis}),
+    "lstm": StubService("lstm", LSTM_SERVICE_URLS, {"/predict": lstm_prediction}),
+    "sentiment": StubService("sentiment", SENTIMENT_ANALYSIS_SERVICE_URLS, {"/analyze": sentiment_analysis}),
+    "notification": StubService("notification", NOTIFICATION_SERVICE_URLS, {"/send-email": send_email}),
+}
+
+
+def _make_handler(service: StubService, injector: FaultInjector):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            logger.debug(f"{service.name}: {format % args}")
+
+        def _reply(self, status: int, body: Dict[str, Any]):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _body(self) -> Dict[str, Any]:
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def do_GET(self):
+            if self.path != FAULTS_PATH:
+                return self._reply(404, {"detail": "Not Found"})
+            self._reply(200, asdict(injector.profile))
+
+        def do_PUT(self):
+            if self.path != FAULTS_PATH:
+                return self._reply(404, {"detail": "Not Found"})
+            try:
+                profile = injector.update(self._body())
+            except (ValueError, TypeError) as e:
+                return self._reply(400, {"detail": str(e)})
+            logger.info(f"{service.name}: fault profile now {asdict(profile)}")
+            self._reply(200, asdict(profile))
+
+        def do_POST(self):
+            route = service.routes.get(self.path)
+            if route is None:
+                return self._reply(404, {"detail": "Not Found"})
+            try:
+                payload = self._body()
+            except ValueError:
+                return self._reply(422, {"detail": "Body must be JSON"})
+
+            outcome = injector.draw()
+            # Give up when the caller's forwarded budget runs out, as the real services should
+            budget = deadlines.parse_header(self.headers.get(deadlines.DEADLINE_HEADER))
+            if budget is not None and outcome.delay > budget:
+                time.sleep(budget)
+                return self._reply(504, {"detail": "Deadline exceeded"})
+            time.sleep(outcome.delay)
+            if outcome.hang:
+                # Drop the connection without a response
+                self.close_connection = True
+                return
+            if outcome.error:
+                return self._reply(injector.profile.error_status, {"detail": "Injected failure"})
+            self._reply(*route(payload))
+
+    return Handler
+
+
+def start_services(profiles: Dict[str, FaultProfile], seed: int = 42,
+                   host: str = "127.0.0.1") -> List[ThreadingHTTPServer]:
+    """
+    Serve each named stand-in on its configured ports (one replica per URL in its
+    *_SERVICE_URL) in background threads. Replicas share the profile but draw
+    their faults independently and can be reconfigured one by one.
+    """
+    servers = []
+    for name, profile in profiles.items():
+        service = SERVICES[name]
+        for port in service.ports:
+            injector = FaultInjector(profile, seed + len(servers))
+            server = ThreadingHTTPServer((host, port), _make_handler(service, injector))
+            server.daemon_threads = True
+            server.service_name = name
+            threading.Thread(target=server.serve_forever, name=f"stub-{name}-{port}", daemon=True).start()
+            servers.append(server)
+    return servers
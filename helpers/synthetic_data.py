@@ -0,0 +1,222 @@
+"""
+Synthetic market data and users for benchmarks and load tests.
+
+Prices are a seeded geometric random walk per symbol, generated and inserted by
+SQLite itself in a single INSERT ... SELECT over a recursive CTE, so no
+per-row Python work is done (10M rows in under a minute). The random numbers
+come from a Park-Miller (Lehmer) generator carried along each symbol's walk,
+so a given seed always produces the same data.
+
+generate_prices turns off synchronous writes and drops an index while it runs,
+so it refuses to touch the application's own database (DB_NAME) unless forced;
+point the default connection at a scratch file first.
+
+Users go through bulk_create; alerts and watchlist items are inserted with a
+plain executemany, since model instantiation and per-field pre_save dominate at
+100k+ rows. Which users and
+symbols they land on follows a Zipf distribution with a configurable exponent
+(`skew`): 0 spreads them evenly, 1 or more concentrates them on a few.
+"""
+import itertools
+import random
+from datetime import date
+from pathlib import Path
+from typing import List, Sequence
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+
+from marketdata.models import PriceAlert, WatchlistItem
+
+PRICES_TABLE_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS prices (
+        symbol        TEXT NOT NULL,
+        yahoo_symbol  TEXT NOT NULL,
+        ts_readable   TEXT NOT NULL,
+        open          REAL,
+        high          REAL,
+        low           REAL,
+        close         REAL,
+        adj_close     REAL,
+        volume        REAL,
+        liquidity     REAL,
+        PRIMARY KEY (symbol, ts_readable)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_prices_symbol_ts_readable ON prices(symbol, ts_readable)",
+]
+PRICES_INDEX = "idx_prices_symbol_ts_readable"
+
+START_DATE = date(2015, 1, 1)
+SYNTHETIC_PASSWORD = "synthetic-Pass-123"
+
+# Park-Miller minimal standard generator: x -> 48271 * x mod (2^31 - 1).
+# Products stay below 2^62, so SQLite keeps them as exact integers.
+_M = 2147483647
+_A1 = 48271
+_A2 = _A1 * _A1 % _M
+_A3 = _A2 * _A1 % _M
+# Scale that gives the logistic distribution unit variance (sqrt(3) / pi)
+_LOGISTIC_SCALE = 0.5513
+
+# Each row draws three uniforms from its symbol's stream: the return (A1 * x),
+# the high/low wick (A2 * x) and the volume (A3 * x, which is also the next state).
+PRICES_INSERT_SQL = f"""
+INSERT OR REPLACE INTO prices (symbol, yahoo_symbol, ts_readable, open, high, low, close, adj_close, volume, liquidity)
+WITH RECURSIVE
+    symbols(i) AS (
+        SELECT 0 UNION ALL SELECT i + 1 FROM symbols WHERE i + 1 < %(symbols)s
+    ),
+    walk(i, day, x, previous, price, base_volume) AS (
+        SELECT i, 0,
+               1 + (%(seed)s * 1000003 + i * 7919 + 17) %% {_M - 1},
+               NULL,
+               exp(((%(seed)s * 31 + i * 7919) %% 900) / 100.0),
+               exp(10 + ((%(seed)s * 17 + i * 104729) %% 800) / 100.0)
+        FROM symbols
+        UNION ALL
+        SELECT i, day + 1, ({_A3} * x) %% {_M}, price,
+               price * exp(%(volatility)s * {_LOGISTIC_SCALE} *
+                           ln((({_A1} * x) %% {_M}) * 1.0 / ({_M} - ({_A1} * x) %% {_M}))),
+               base_volume
+        FROM walk
+        WHERE day + 1 < %(days)s
+        -- Depth-first per symbol, so rows arrive in primary key order
+        ORDER BY 1, 2
+    ),
+    candles AS (
+        SELECT i, day, price, coalesce(previous, price) AS open,
+               (({_A2} * x) %% {_M}) * 1.0 / {_M} AS wick,
+               base_volume * exp(2 * (({_A3} * x) %% {_M}) * 1.0 / {_M} - 1) AS volume
+        FROM walk
+    )
+SELECT printf('%%s%%04d', %(prefix)s, i), printf('%%s%%04d-USD', %(prefix)s, i),
+       date(%(start)s, '+' || day || ' days'),
+       open, max(open, price) * (1 + wick * %(volatility)s), min(open, price) * (1 - wick * %(volatility)s),
+       price, price, volume, volume * price
+FROM candles
+"""
+
+
+def symbol_names(count: int, prefix: str = "SYM") -> List[str]:
+    """SYM0000, SYM0001, ... (the symbols generate_prices writes)"""
+    return [f"{prefix}{index:04d}" for index in range(count)]
+
+
+def is_configured_database() -> bool:
+    """Whether the default connection points at the application's own database file"""
+    current = Path(str(connection.settings_dict['NAME']))
+    # settings.DATABASES['default'] is the same dict as the connection's, so compare with DB_NAME instead
+    configured = Path(settings.BASE_DIR) / settings.DB_NAME
+    return current.resolve() == configured.resolve()
+
+
+def check_target_database(force: bool = False) -> None:
+    """Raise RuntimeError if synthetic data would be written to the application's database without `force`"""
+    if is_configured_database() and not force:
+        raise RuntimeError(
+            f"Refusing to write synthetic data into the application database {connection.settings_dict['NAME']}"
+        )
+
+
+def ensure_prices_table() -> None:
+    with connection.cursor() as cursor:
+        for statement in PRICES_TABLE_DDL:
+            cursor.execute(statement)
+
+
+def generate_prices(symbols: int, days: int, seed: int = 42, volatility: float = 0.04,
+                    prefix: str = "SYM", start: date = START_DATE, force: bool = False) -> int:
+    """
+    Write `days` daily candles for each of `symbols` symbols; returns rows written.
+    Raises RuntimeError on the application's own database unless `force`.
+    """
+    check_target_database(force)
+    ensure_prices_table()
+    # SQLite can't change the sync level inside a transaction (a test case's, say)
+    relax_sync = not connection.in_atomic_block
+    with connection.cursor() as cursor:
+        if relax_sync:
+            cursor.execute("PRAGMA synchronous=OFF")
+        # Maintaining the secondary index row by row is slower than rebuilding it once
+        cursor.execute(f"DROP INDEX IF EXISTS {PRICES_INDEX}")
+        try:
+            with transaction.atomic():
+                cursor.execute(PRICES_INSERT_SQL, {
+                    "symbols": symbols, "days": days, "seed": seed, "volatility": volatility,
+                    "prefix": prefix, "start": start.isoformat(),
+                })
+                written = cursor.rowcount
+        finally:
+            cursor.execute(PRICES_TABLE_DDL[1])
+            if relax_sync:
+                cursor.execute("PRAGMA synchronous=NORMAL")
+    return written
+
+
+def zipf_weights(count: int, skew: float) -> List[float]:
+    """Cumulative weights for picking rank r with probability ~ 1 / r^skew"""
+    return list(itertools.accumulate(1 / (rank ** skew) for rank in range(1, count + 1)))
+
+
+def generate_users(count: int, prefix: str = "synthetic") -> List[int]:
+    """Create `count` users sharing one password; returns their ids"""
+    password = make_password(SYNTHETIC_PASSWORD)
+    User.objects.bulk_create(
+        [User(username=f"{prefix}{index}", email=f"{prefix}{index}@example.com", password=password)
+         for index in range(count)],
+        batch_size=5000, ignore_conflicts=True,
+    )
+    return list(User.objects.filter(username__startswith=prefix).order_by("id").values_list("id", flat=True))
+
+
+def generate_alerts(user_ids: Sequence[int], symbols: Sequence[str], count: int, skew: float = 0.0,
+                    seed: int = 42) -> int:
+    """Create `count` static price alerts 1-30% away from each symbol's last close"""
+    rng = random.Random(seed)
+    with connection.cursor() as cursor:
+        # SQLite returns the bare `close` column from the row holding MAX(ts_readable)
+        cursor.execute("SELECT symbol, close, MAX(ts_readable) FROM prices GROUP BY symbol")
+        last_close = {symbol: close for symbol, close, _ in cursor.fetchall()}
+
+    alert_users = rng.choices(user_ids, cum_weights=zipf_weights(len(user_ids), skew), k=count)
+    alert_symbols = rng.choices(symbols, cum_weights=zipf_weights(len(symbols), skew), k=count)
+
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    rows = []
+    for user_id, symbol in zip(alert_users, alert_symbols):
+        close = last_close.get(symbol) or 1.0
+        condition = rng.choice(PriceAlert.PRICE_CONDITIONS)
+        move = rng.uniform(0.01, 0.3)
+        target = close * (1 + move) if condition == "above" else close * (1 - move)
+        rows.append((user_id, symbol, symbol, condition, max(0.01, round(target, 2)), True, False, now, now))
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {PriceAlert._meta.db_table} "
+            "(user_id, crypto, symbol, condition, price, active, is_triggered, created_at, updated_at) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)",
+            rows,
+        )
+    return count
+
+
+def generate_watchlist(user_ids: Sequence[int], symbols: Sequence[str], count: int, skew: float = 0.0,
+                       seed: int = 42) -> int:
+    """Create up to `count` watchlist items (repeated user/symbol pairs are skipped)"""
+    rng = random.Random(seed)
+    pairs = set(zip(
+        rng.choices(user_ids, cum_weights=zipf_weights(len(user_ids), skew), k=count),
+        rng.choices(symbols, cum_weights=zipf_weights(len(symbols), skew), k=count),
+    ))
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT OR IGNORE INTO {WatchlistItem._meta.db_table} (user_id, symbol, created_at) VALUES (%s, %s, %s)",
+            [(user_id, symbol, now) for user_id, symbol in sorted(pairs)],
+        )
+    return len(pairs)
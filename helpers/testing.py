@@ -0,0 +1,311 @@
+"""
+Query-budget test harness.
+
+QueryBudgetMixin requests each endpoint against a small seeded database and
+fails when it answers with another status than expected, or runs more queries,
+more full table/index scans (per SQLite's EXPLAIN QUERY PLAN) or more unbounded
+reads of `prices` than its budget allows. A read of `prices` is unbounded when
+the SELECT it sits in has no LIMIT: an index SEARCH by symbol doesn't show as a
+scan, yet still reads the symbol's whole history. Failures list every query with the line of project code that
+issued it. Each app's tests.py declares one EndpointCase per URL name in its
+urls.py; a missing case is a failure too.
+
+IsolatedStateTestRunner (settings.TEST_RUNNER) gives each test run its own
+shared store, metrics, profiles and traces under a temporary directory.
+"""
+import random
+import re
+import shutil
+import tempfile
+import traceback
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from unittest import mock
+
+import requests
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+from django.urls import URLPattern
+from rest_framework.test import APIClient
+
+from helpers import deadlines
+from helpers.synthetic_data import ensure_prices_table
+from marketdata.models import PriceAlert, SupportedCoin, WatchlistItem
+
+SEED_SYMBOLS = ["BTC", "ETH", "SOL"]
+SEED_DAYS = 120
+TEST_PASSWORD = "budget-Pass-123"
+
+_PROJECT_ROOT = str(settings.BASE_DIR)
+_THIS_FILE = str(Path(__file__).resolve())
+# Execute wrappers installed on every connection: never the code that issued a query
+_SKIPPED_FILES = {_THIS_FILE} | {
+    str(Path(settings.BASE_DIR) / "helpers" / name)
+    for name in ("slow_queries.py", "deadlines.py", "tracing.py", "request_timing.py")
+}
+
+
+class IsolatedStateTestRunner(DiscoverRunner):
+    """DiscoverRunner that keeps the process-shared state files of a test run in a temporary directory"""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._state_dir = Path(tempfile.mkdtemp(prefix="test_state_"))
+        self._state_settings = override_settings(
+            SHARED_STORE_PATH=self._state_dir / "shared_store.db",
+            METRICS_DIR=self._state_dir / "metrics",
+            PROFILES_DIR=self._state_dir / "profiles",
+            TRACES_PATH=self._state_dir / "traces.db",
+        )
+        self._state_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._state_settings.disable()
+        shutil.rmtree(self._state_dir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
+
+
+@dataclass
+class EndpointCase:
+    """One request to an endpoint, the status it must answer with and the most queries / full scans it may cost"""
+    url_name: str
+    method: str
+    # May reference {alert_id} (an alert owned by the test user) and whatever path_params() adds
+    path: str
+    max_queries: int
+    max_scans: int = 0
+    max_unbounded_reads: int = 0
+    data: Optional[Dict[str, Any]] = None
+    format: Optional[str] = "json"
+    authenticated: bool = True
+    # Sent as the staff user instead of the regular one
+    staff: bool = False
+    # Proxy views answer 503 in tests because the microservices are patched out
+    status: int = 200
+
+
+@dataclass
+class RecordedQuery:
+    sql: str
+    params: Any
+    source: str
+    scans: List[str] = field(default_factory=list)
+    unbounded_reads: int = 0
+
+
+_PRICES_ACCESS = re.compile(r'\b(?:FROM|JOIN)\s+"?prices"?(?![\w"])', re.IGNORECASE)
+_LIMIT = re.compile(r"\bLIMIT\b", re.IGNORECASE)
+
+
+def unbounded_price_reads(sql: str) -> int:
+    """How many times `sql` reads the prices table in a SELECT (or subquery) without a LIMIT"""
+    count = 0
+    for match in _PRICES_ACCESS.finditer(sql):
+        # The enclosing parenthesised subquery, or the whole statement
+        depth, start = 0, 0
+        for index in range(match.start() - 1, -1, -1):
+            depth += {")": 1, "(": -1}.get(sql[index], 0)
+            if depth < 0:
+                start = index + 1
+                break
+        depth, end = 0, len(sql)
+        for index in range(match.end(), len(sql)):
+            depth += {"(": 1, ")": -1}.get(sql[index], 0)
+            if depth < 0:
+                end = index
+                break
+        # Keep only this level's own text: drop nested parentheses
+        own, depth = [], 0
+        for char in sql[start:end]:
+            depth += {"(": 1, ")": -1}.get(char, 0)
+            own.append(char if depth == 0 else " ")
+        if not _LIMIT.search("".join(own)):
+            count += 1
+    return count
+
+
+def _query_source() -> str:
+    """The innermost project (non-test-harness) frame that issued a query"""
+    for frame in reversed(traceback.extract_stack()[:-2]):
+        filename = str(Path(frame.filename).resolve())
+        if filename.startswith(_PROJECT_ROOT) and filename not in _SKIPPED_FILES and "site-packages" not in filename:
+            return f"{Path(filename).relative_to(_PROJECT_ROOT)}:{frame.lineno} in {frame.name}"
+    return "<django internals>"
+
+
+class QueryRecorder:
+    """Record every query on the default connection, then explain the SELECTs"""
+
+    def __init__(self):
+        self.queries: List[RecordedQuery] = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(RecordedQuery(sql, params, _query_source()))
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._wrapper = connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        self._wrapper.__exit__(*exc)
+        self._explain()
+
+    def _explain(self):
+        tables = set(connection.introspection.table_names())
+        with connection.cursor() as cursor:
+            for query in self.queries:
+                if not query.sql.lstrip().upper().startswith(("SELECT", "WITH")):
+                    continue
+                query.unbounded_reads = unbounded_price_reads(query.sql)
+                cursor.execute(f"EXPLAIN QUERY PLAN {query.sql}", query.params)
+                # Full passes over a real table or its index (not over temp results of subqueries)
+                query.scans = [
+                    row[3] for row in cursor.fetchall()
+                    if row[3].startswith("SCAN ") and row[3].split()[1] in tables
+                ]
+
+    @property
+    def scan_count(self) -> int:
+        return sum(len(query.scans) for query in self.queries)
+
+    @property
+    def unbounded_read_count(self) -> int:
+        return sum(query.unbounded_reads for query in self.queries)
+
+    def report(self) -> str:
+        lines = []
+        for index, query in enumerate(self.queries, 1):
+            scans = f"  [{'; '.join(query.scans)}]" if query.scans else ""
+            unbounded = f"  [{query.unbounded_reads} unbounded prices reads]" if query.unbounded_reads else ""
+            lines.append(f"  {index}. {query.source}{scans}{unbounded}\n     {query.sql[:300]}")
+        return "\n".join(lines)
+
+
+class VMStepCounter:
+    """
+    Count SQLite virtual machine steps on the default connection, a measure of
+    rows read that doesn't depend on the machine's speed. Replaces the
+    connection's progress handler (helpers.deadlines') while counting.
+    """
+    GRANULARITY = 100
+
+    def __init__(self):
+        self.steps = 0
+
+    def _tick(self) -> int:
+        self.steps += self.GRANULARITY
+        return 0
+
+    def __enter__(self):
+        connection.ensure_connection()
+        connection.connection.set_progress_handler(self._tick, self.GRANULARITY)
+        return self
+
+    def __exit__(self, *exc):
+        connection.connection.set_progress_handler(None, 0)
+        deadlines.install(None, connection)
+
+
+def seed_market_data(symbols=SEED_SYMBOLS, days=SEED_DAYS, seed=7) -> None:
+    """Create the prices table and fill it with a deterministic random walk"""
+    rng = random.Random(seed)
+    start = date(2024, 1, 1)
+    rows = []
+    for symbol in symbols:
+        price = rng.uniform(10, 1000)
+        for day in range(days):
+            open_price = price
+            price = max(0.01, price * (1 + rng.gauss(0, 0.03)))
+            high = max(open_price, price) * (1 + rng.random() * 0.01)
+            low = min(open_price, price) * (1 - rng.random() * 0.01)
+            volume = rng.uniform(1e5, 1e7)
+            rows.append((symbol, f"{symbol}-USD", (start + timedelta(days=day)).isoformat(),
+                         open_price, high, low, price, price, volume, volume * price))
+
+    ensure_prices_table()
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            "INSERT INTO prices (symbol, yahoo_symbol, ts_readable, open, high, low, close, adj_close, volume, liquidity) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
+            rows,
+        )
+
+
+class QueryBudgetMixin:
+    """Mix into a TestCase and set `urlpatterns` and `cases`"""
+    urlpatterns: List[URLPattern] = []
+    cases: List[EndpointCase] = []
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_market_data()
+        cls.user = User.objects.create_user("budget", "budget@example.com", TEST_PASSWORD)
+        cls.staff_user = User.objects.create_user("budget-staff", "staff@example.com", TEST_PASSWORD, is_staff=True)
+        for symbol in SEED_SYMBOLS:
+            SupportedCoin.objects.create(symbol=symbol, name=symbol)
+            WatchlistItem.objects.create(user=cls.user, symbol=symbol)
+            cls.alert = PriceAlert.objects.create(user=cls.user, crypto=symbol, symbol=symbol, condition="above", price=1)
+
+    def setUp(self):
+        # Microservices are never reachable from tests
+        patcher = mock.patch.object(requests, "post", side_effect=requests.exceptions.ConnectionError("offline"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def client_for(self, case: EndpointCase) -> APIClient:
+        client = APIClient(enforce_csrf_checks=False)
+        if case.authenticated:
+            client.force_login(self.staff_user if case.staff else self.user)
+            # Warm the session so the measured request reflects steady state
+            client.get("/api/auth/session/", secure=True)
+        return client
+
+    def request(self, client: APIClient, case: EndpointCase):
+        kwargs = {"secure": True}
+        if case.data is not None:
+            kwargs["data"] = case.data
+            if case.format:
+                kwargs["format"] = case.format
+        return getattr(client, case.method.lower())(case.path.format(**self.path_params()), **kwargs)
+
+    def path_params(self) -> Dict[str, Any]:
+        """Values for the placeholders in case paths; extend to point cases at objects created in setUp"""
+        return {"alert_id": self.alert.id}
+
+    def test_every_url_has_a_budget(self):
+        covered = {case.url_name for case in self.cases}
+        missing = [pattern.name for pattern in self.urlpatterns if pattern.name not in covered]
+        self.assertEqual(missing, [], f"URLs without a query budget: {missing}")
+
+    def test_query_budgets(self):
+        for case in self.cases:
+            with self.subTest(endpoint=f"{case.method} {case.path}"):
+                client = self.client_for(case)
+                with QueryRecorder() as recorder:
+                    response = self.request(client, case)
+
+                self.assertEqual(response.status_code, case.status,
+                                 f"{case.method} {case.path} answered {response.status_code}: "
+                                 f"{response.content[:200]}")
+                self.assertLessEqual(
+                    len(recorder.queries), case.max_queries,
+                    f"{case.method} {case.path} ran {len(recorder.queries)} queries "
+                    f"(budget {case.max_queries}):\n{recorder.report()}"
+                )
+                self.assertLessEqual(
+                    recorder.scan_count, case.max_scans,
+                    f"{case.method} {case.path} did {recorder.scan_count} full scans "
+                    f"(budget {case.max_scans}):\n{recorder.report()}"
+                )
+                self.assertLessEqual(
+                    recorder.unbounded_read_count, case.max_unbounded_reads,
+                    f"{case.method} {case.path} read prices without a LIMIT {recorder.unbounded_read_count} times "
+                    f"(budget {case.max_unbounded_reads}):\n{recorder.report()}"
+                )
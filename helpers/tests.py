@@ -0,0 +1,484 @@
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from pathlib import Path
+from unittest import mock
+
+import requests
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from rest_framework.exceptions import Throttled
+
+from auth.exceptions.handlers import custom_auth_exception_handler
+from helpers import admission, deadlines, load_balancer, metrics, stub_services, upstream
+from helpers.admission import AdmissionController, Overloaded, RequestTooExpensive
+from helpers.event_bus import EventBus
+from helpers.load_balancer import ServicePool
+from helpers.metrics import EVENT_BUS_QUEUE_DEPTH, MetricsStore, _ProcessFile, render_prometheus
+from helpers.shared_store import SharedStore
+from helpers.stub_services import FaultProfile, start_services
+from helpers.write_queue import WriteQueue, WriteTimeout
+from marketdata.models import SupportedCoin
+from miscellaneous.models import SlowQuery
+
+THREADS = 8
+
+# Counts to `rows`; the default takes SQLite several seconds unless something interrupts it
+COUNT_SQL = "WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n WHERE x < %s) SELECT count(*) FROM n"
+
+
+class SharedStoreTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix="shared_store_")
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = str(Path(directory) / "store.db")
+
+    def run_concurrently(self, work, calls_per_thread):
+        """Run `work(store)` from THREADS threads, each with its own store and connection"""
+        barrier = threading.Barrier(THREADS)
+
+        def worker():
+            store = SharedStore(self.path)
+            barrier.wait()
+            return [work(store) for _ in range(calls_per_thread)]
+
+        with ThreadPoolExecutor(THREADS) as pool:
+            futures = [pool.submit(worker) for _ in range(THREADS)]
+            return [result for future in futures for result in future.result()]
+
+    def test_incr(self):
+        store = SharedStore(self.path)
+        self.assertEqual(store.incr("hits", ttl=60), 1)
+        self.assertEqual(store.incr("hits", amount=4, ttl=60), 5)
+        self.assertEqual(store.get("hits"), 5)
+        # An expired counter starts over
+        store.set("old", 10, ttl=-1)
+        self.assertIsNone(store.get("old"))
+        self.assertEqual(store.incr("old", ttl=60), 1)
+
+    def test_incr_is_atomic_across_connections(self):
+        values = self.run_concurrently(lambda store: store.incr("hits", ttl=60), 50)
+        self.assertEqual(sorted(values), list(range(1, THREADS * 50 + 1)))
+
+    def test_sliding_window(self):
+        store = SharedStore(self.path)
+        self.assertEqual([store.hit_sliding_window("login", 3, 3600)[0] for _ in range(4)],
+                         [True, True, True, False])
+        allowed, retry_after = store.hit_sliding_window("login", 3, 3600)
+        self.assertFalse(allowed)
+        self.assertTrue(0 < retry_after <= 3600)
+
+    def test_sliding_window_never_overshoots_across_connections(self):
+        results = self.run_concurrently(lambda store: store.hit_sliding_window("login", 50, 3600)[0], 20)
+        self.assertEqual(results.count(True), 50)
+
+    def test_take_tokens_from_all_buckets_or_none(self):
+        store = SharedStore(self.path)
+        buckets = [("global", 10, 1), ("client", 2, 0.5)]
+        self.assertEqual(store.take_tokens(buckets, 1), (True, None, None))
+        self.assertEqual(store.take_tokens(buckets, 1), (True, None, None))
+
+        taken, retry_after, limiting = store.take_tokens(buckets, 1)
+        self.assertFalse(taken)
+        self.assertEqual(limiting, "client")
+        self.assertAlmostEqual(retry_after, 2, delta=0.1)
+        # The refused take left the global bucket untouched
+        self.assertEqual(store.take_tokens([("global", 10, 1)], 8), (True, None, None))
+
+        store.return_tokens(["client"], 1)
+        self.assertTrue(store.take_tokens([("client", 2, 0.5)], 1)[0])
+
+    def test_take_tokens_never_overdraws_across_connections(self):
+        results = self.run_concurrently(lambda store: store.take_tokens([("bucket", 30, 0.001)], 1)[0], 10)
+        self.assertEqual(results.count(True), 30)
+
+
+def create_coin(symbol):
+    SupportedCoin.objects.create(symbol=symbol, name=symbol)
+    return threading.current_thread().name
+
+
+def create_coin_and_fail(symbol):
+    create_coin(symbol)
+    raise ValueError(symbol)
+
+
+# The writer thread needs committed data and its own connection, so no per-test transaction
+class WriteQueueTests(TransactionTestCase):
+    def make_queue(self, **kwargs):
+        return WriteQueue(**{"enabled": True, "max_batch": 10, "linger_ms": 100, "timeout": 10, **kwargs})
+
+    def test_queued_jobs_commit_in_one_batch(self):
+        queue = self.make_queue()
+        futures = [queue.submit(create_coin, f"C{i}") for i in range(5)]
+        self.assertEqual({future.result(10) for future in futures}, {"sqlite-writer"})
+        self.assertEqual((queue.batches, queue.jobs), (1, 5))
+        self.assertEqual(SupportedCoin.objects.count(), 5)
+
+    def test_failing_job_only_rolls_back_itself(self):
+        queue = self.make_queue()
+        futures = [queue.submit(create_coin, "A"), queue.submit(create_coin_and_fail, "B"),
+                   queue.submit(create_coin, "C")]
+        self.assertEqual(futures[0].result(10), "sqlite-writer")
+        with self.assertRaisesMessage(ValueError, "B"):
+            futures[1].result(10)
+        self.assertEqual(futures[2].result(10), "sqlite-writer")
+        self.assertEqual(queue.batches, 1)
+        self.assertEqual(sorted(SupportedCoin.objects.values_list("symbol", flat=True)), ["A", "C"])
+
+    def test_runs_inline_inside_a_transaction(self):
+        queue = self.make_queue()
+        with transaction.atomic():
+            self.assertEqual(queue.run(create_coin, "A"), threading.current_thread().name)
+        self.assertIsNone(queue._thread)
+        self.assertTrue(SupportedCoin.objects.filter(symbol="A").exists())
+
+    def test_timeout_is_a_503_and_drops_the_job(self):
+        queue = self.make_queue(timeout=0.2, linger_ms=0)
+        release = threading.Event()
+        blocker = queue.submit(release.wait, 10)
+
+        with self.assertLogs("helpers.write_queue", "ERROR"), self.assertRaises(WriteTimeout) as raised:
+            queue.run(create_coin, "LATE")
+        self.assertEqual(custom_auth_exception_handler(raised.exception, {}).status_code, 503)
+
+        release.set()
+        self.assertTrue(blocker.result(10))
+        # The writer is free again, and the job whose caller gave up never ran
+        self.assertEqual(queue.run(create_coin, "NEXT"), "sqlite-writer")
+        self.assertEqual(list(SupportedCoin.objects.values_list("symbol", flat=True)), ["NEXT"])
+
+    def test_dead_writer_is_restarted(self):
+        queue = self.make_queue()
+        dead = threading.Thread(target=lambda: None)
+        dead.start()
+        dead.join()
+        queue._thread = dead
+
+        with self.assertLogs("helpers.write_queue", "ERROR"):
+            self.assertEqual(queue.run(create_coin, "A"), "sqlite-writer")
+        self.assertIsNot(queue._thread, dead)
+        self.assertTrue(queue._thread.is_alive())
+
+
+class DeadlineTests(TestCase):
+    def run_slow_query(self, budget, rows=100_000_000):
+        token = deadlines.activate(deadlines.Deadline(budget))
+        try:
+            # DeadlineMiddleware installs the wrapper for requests
+            with connection.execute_wrapper(deadlines.db_wrapper), connection.cursor() as cursor:
+                cursor.execute(COUNT_SQL, [rows])
+                return cursor.fetchone()[0]
+        except Exception as e:
+            # Services re-raise database errors as their own
+            raise RuntimeError("service failed") from e
+        finally:
+            deadlines.deactivate(token)
+
+    def test_query_past_the_deadline_is_cancelled(self):
+        started = time.monotonic()
+        with self.assertLogs("slow_queries", "WARNING"), self.assertRaises(RuntimeError) as raised:
+            self.run_slow_query(0.05)
+        self.assertLess(time.monotonic() - started, 2)
+
+        response = custom_auth_exception_handler(raised.exception, {})
+        self.assertEqual(response.status_code, 504)
+        self.assertEqual(response.data["detail"].code, "query_cancelled")
+
+        query = SlowQuery.objects.get()
+        self.assertEqual((query.count, query.cancelled_count), (1, 1))
+        self.assertIn("WITH RECURSIVE", query.sql)
+        self.assertTrue(query.caller.startswith("helpers/tests.py:"), query.caller)
+
+    def test_query_within_the_deadline_completes(self):
+        self.assertEqual(self.run_slow_query(60, rows=1000), 1000)
+        self.assertFalse(SlowQuery.objects.exists())
+
+    def test_query_after_the_deadline_is_refused(self):
+        with self.assertRaises(RuntimeError) as raised:
+            self.run_slow_query(0)
+        self.assertEqual(type(raised.exception.__cause__), deadlines.DeadlineExceeded)
+        self.assertFalse(SlowQuery.objects.exists())
+
+
+ANALYSIS = {"json": {"symbol": "BTC", "timeframe": "1d"}}
+
+
+class UpstreamTests(SimpleTestCase):
+    def start_replicas(self, count, **profile) -> ServicePool:
+        """Serve `count` technical-analysis stand-ins on free ports and route calls to them"""
+        service = replace(stub_services.SERVICES["technical_analysis"], base_urls=["http://127.0.0.1:0"] * count)
+        with mock.patch.dict(stub_services.SERVICES, {"technical_analysis": service}):
+            servers = start_services({"technical_analysis": FaultProfile(**profile)})
+        for server in servers:
+            self.addCleanup(server.server_close)
+            self.addCleanup(server.shutdown)
+
+        pool = ServicePool("technical_analysis", [f"http://127.0.0.1:{server.server_address[1]}" for server in servers])
+        patcher = mock.patch.dict(load_balancer.pools, {"technical_analysis": pool})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return pool
+
+    def set_faults(self, endpoint, **changes):
+        requests.put(f"{endpoint.url}{stub_services.FAULTS_PATH}", json=changes, timeout=5).raise_for_status()
+
+    def call(self, **kwargs):
+        return upstream.post("technical_analysis", "/analyze", **ANALYSIS, **kwargs)
+
+    def call_until(self, condition, limit=100):
+        for _ in range(limit):
+            self.call()
+            if condition():
+                return
+        self.fail(f"Condition not reached in {limit} calls")
+
+    def test_least_outstanding_selection(self):
+        pool = ServicePool("svc", ["http://a", "http://b", "http://c"])
+        first = [pool.acquire() for _ in range(3)]
+        self.assertEqual({endpoint.url for endpoint in first}, {"http://a", "http://b", "http://c"})
+        pool.release(first[1], True, 0.01)
+        self.assertIs(pool.acquire(), first[1])
+        # Everything else is busier, but an excluded replica is never picked
+        self.assertIsNot(pool.acquire(exclude=first[1]), first[1])
+
+    @override_settings(UPSTREAM_EJECT_AFTER_FAILURES=2, UPSTREAM_EJECT_SECONDS=60)
+    def test_failing_replica_is_ejected_with_doubling_backoff(self):
+        pool = self.start_replicas(2)
+        bad, good = pool.endpoints
+        self.set_faults(bad, error_rate=1)
+
+        with self.assertLogs("helpers.load_balancer", "WARNING"):
+            self.call_until(lambda: bad.ejected_until > 0)
+        self.assertAlmostEqual(bad.ejected_until - time.monotonic(), 60, delta=1)
+        self.assertEqual([self.call().status_code for _ in range(10)], [200] * 10)
+        self.assertEqual(good.consecutive_failures, 0)
+
+        # The ejection runs out, the replica still fails: out for twice as long
+        bad.ejected_until = 0
+        with self.assertLogs("helpers.load_balancer", "WARNING"):
+            self.call_until(lambda: bad.ejected_until > 0)
+        self.assertAlmostEqual(bad.ejected_until - time.monotonic(), 120, delta=1)
+
+        # Once it answers again the backoff starts over
+        self.set_faults(bad, error_rate=0)
+        bad.ejected_until = 0
+        self.call_until(lambda: bad.ejections == 0)
+
+    def test_hedge_delay_is_the_recent_p95(self):
+        pool = ServicePool("svc", ["http://a"])
+        pool._latencies.extend(ms / 1000 for ms in range(1, load_balancer.MIN_LATENCY_SAMPLES))
+        self.assertIsNone(pool.hedge_delay())
+        pool._latencies.extend(ms / 1000 for ms in range(load_balancer.MIN_LATENCY_SAMPLES, 101))
+        with override_settings(UPSTREAM_HEDGE_MIN_DELAY_MS=0):
+            self.assertAlmostEqual(pool.hedge_delay(), 0.096)
+        with override_settings(UPSTREAM_HEDGE_MIN_DELAY_MS=200):
+            self.assertAlmostEqual(pool.hedge_delay(), 0.2)
+
+    @override_settings(UPSTREAM_HEDGING_ENABLED=True, UPSTREAM_HEDGE_MIN_DELAY_MS=50)
+    def test_slow_call_is_hedged_to_another_replica(self):
+        pool = self.start_replicas(2)
+        slow, fast = pool.endpoints
+        self.set_faults(slow, latency="fixed:2000")
+        pool._latencies.extend([0.01] * load_balancer.MIN_LATENCY_SAMPLES)
+        # Plenty of hedge budget, and the fast replica busy so the first attempt goes to the slow one
+        pool.calls = 100
+        fast.outstanding += 1
+        try:
+            started = time.monotonic()
+            response = self.call(idempotent=True)
+        finally:
+            fast.outstanding -= 1
+
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(pool.hedges, 1)
+
+        # Calls that aren't idempotent are never sent twice
+        fast.outstanding += 1
+        try:
+            self.call()
+        finally:
+            fast.outstanding -= 1
+        self.assertEqual(pool.hedges, 1)
+
+    @override_settings(UPSTREAM_HEDGING_ENABLED=True)
+    def test_hedges_stay_within_the_budget(self):
+        pool = self.start_replicas(2, latency="fixed:60")
+        with mock.patch.object(pool, "hedge_delay", return_value=0.01):
+            for _ in range(20):
+                self.assertEqual(self.call(idempotent=True).status_code, 200)
+        self.assertEqual(pool.calls, 20)
+        self.assertEqual(pool.hedges, 20 * load_balancer.HEDGE_BUDGET)
+
+    @override_settings(UPSTREAM_EJECT_AFTER_FAILURES=1)
+    def test_deadline_failures_do_not_eject(self):
+        pool = self.start_replicas(2, latency="fixed:1000")
+        for _ in range(4):
+            token = deadlines.activate(deadlines.Deadline(0.1))
+            try:
+                with self.assertRaises(deadlines.DeadlineExceeded):
+                    self.call()
+            finally:
+                deadlines.deactivate(token)
+        self.assertEqual([(endpoint.consecutive_failures, endpoint.ejected_until) for endpoint in pool.endpoints],
+                         [(0, 0), (0, 0)])
+
+        # The same timeout set by the caller does count against the replica
+        for endpoint in pool.endpoints:
+            self.set_faults(endpoint, hang_rate=1, hang_seconds=0.5)
+        with self.assertLogs("helpers.load_balancer", "WARNING"), self.assertRaises(requests.exceptions.Timeout):
+            self.call(timeout=0.1)
+        self.assertEqual(len([endpoint for endpoint in pool.endpoints if endpoint.ejected_until]), 1)
+
+
+@override_settings(ADMISSION_BUDGETS={"test": {"client": 60, "global": 600}}, ADMISSION_MAX_QUEUE_SECONDS=1,
+                   ADMISSION_MAX_IN_FLIGHT=4, ADMISSION_MAX_QUEUED=8)
+class AdmissionTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix="admission_")
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        patcher = mock.patch.object(admission, "get_shared_store", return_value=SharedStore(f"{directory}/store.db"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.controller = AdmissionController()
+
+    def admit(self, client, cost):
+        return self.controller.admit("test", client, cost)
+
+    def response_for(self, exc):
+        return custom_auth_exception_handler(exc, {})
+
+    def test_cost_over_a_whole_budget_is_a_400(self):
+        with self.assertRaises(RequestTooExpensive) as raised:
+            self.admit("a", 61)
+        self.assertEqual(self.response_for(raised.exception).status_code, 400)
+
+    def test_client_over_its_budget_is_a_429_at_once(self):
+        self.admit("a", 60).release()
+        started = time.monotonic()
+        with self.assertRaises(Throttled) as raised:
+            self.admit("a", 10)
+        self.assertLess(time.monotonic() - started, 0.5)
+        response = self.response_for(raised.exception)
+        self.assertEqual(response.status_code, 429)
+        # The client's bucket refills 1 unit a second
+        self.assertIn(int(response["Retry-After"]), (9, 10))
+        # Other clients still have theirs
+        self.admit("b", 10).release()
+
+    @override_settings(ADMISSION_BUDGETS={"test": {"client": 600, "global": 60}})
+    def test_global_budget_too_far_off_is_a_503(self):
+        self.admit("a", 60).release()
+        with self.assertLogs("helpers.admission", "WARNING"), self.assertRaises(Overloaded) as raised:
+            self.admit("b", 30)
+        response = self.response_for(raised.exception)
+        self.assertEqual(response.status_code, 503)
+        self.assertIn(int(response["Retry-After"]), (30, 31))
+
+    @override_settings(ADMISSION_BUDGETS={"test": {"client": 600, "global": 600}})
+    def test_waits_for_the_global_budget_to_refill(self):
+        self.admit("a", 600).release()
+        started = time.monotonic()
+        # 10 units a second: two units come back within the queue time
+        self.admit("b", 2).release()
+        self.assertGreaterEqual(time.monotonic() - started, 0.15)
+
+    @override_settings(ADMISSION_BUDGETS={"test": {"client": 60, "global": 20}}, ADMISSION_MAX_IN_FLIGHT=1,
+                       ADMISSION_MAX_QUEUE_SECONDS=0.2)
+    def test_tokens_come_back_when_no_slot_frees_up(self):
+        ticket = self.admit("a", 10)
+        with self.assertLogs("helpers.admission", "WARNING"), self.assertRaises(Overloaded):
+            self.admit("b", 10)
+        ticket.release()
+        # Without the refused request's 10 units back this would need 30 seconds of refill
+        self.admit("c", 10).release()
+
+
+class MetricsTests(SimpleTestCase):
+    def sample(self, name):
+        """Value of one exported sample, by its full name and labels"""
+        for line in render_prometheus().splitlines():
+            if line.startswith(name + " "):
+                return float(line.rsplit(" ", 1)[1])
+        return None
+
+    def test_event_bus_metrics_are_exported(self):
+        bus = EventBus(workers=1, queue_size=1)
+        started, release = threading.Event(), threading.Event()
+
+        def handler(event_type, payload):
+            started.set()
+            release.wait(10)
+
+        bus.subscribe("metrics-test", handler)
+        self.addCleanup(release.set)
+        bus.publish("metrics-test", {})
+        self.assertTrue(started.wait(10))
+        # The worker is busy: one event waits, the next finds the queue full
+        self.assertTrue(bus.publish("metrics-test", {}))
+        self.assertFalse(bus.publish("metrics-test", {}))
+
+        self.assertEqual(self.sample("event_bus_queue_depth"), 1)
+        self.assertEqual(self.sample('event_bus_events_total{event="metrics-test",outcome="queued"}'), 2)
+        self.assertEqual(self.sample('event_bus_events_total{event="metrics-test",outcome="dropped"}'), 1)
+
+        release.set()
+        bus._queue.join()
+        self.assertEqual(self.sample("event_bus_queue_depth"), 0)
+        handler_name = handler.__qualname__
+        self.assertEqual(
+            self.sample(f'event_bus_handler_seconds_count{{handler="{handler_name}",outcome="ok"}}'), 2
+        )
+
+    COUNTER_KEY = json.dumps(["event_bus_events_total", [["event", "x"], ["outcome", "queued"]]])
+
+    def metrics_dir(self):
+        directory = tempfile.mkdtemp(prefix="metrics_")
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        return directory
+
+    def exited_process_file(self, directory, counter=0.0, gauge=0.0):
+        """A metrics file as left behind by a process that has exited"""
+        process_file = _ProcessFile(directory)
+        process_file.add(self.COUNTER_KEY, counter)
+        process_file.set(EVENT_BUS_QUEUE_DEPTH.labels()._key, gauge)
+        exited = subprocess.Popen(["true"])
+        exited.wait()
+        path = os.path.join(directory, f"metrics_{exited.pid}.db")
+        os.rename(process_file.path, path)
+        return path
+
+    def test_gauges_of_exited_processes_are_dropped(self):
+        directory = self.metrics_dir()
+        self.exited_process_file(directory, counter=3, gauge=5)
+        with override_settings(METRICS_DIR=directory):
+            totals = MetricsStore().collect()
+        self.assertEqual(totals, {self.COUNTER_KEY: 3})
+
+    def test_scrapes_compact_at_most_once_per_interval(self):
+        directory = self.metrics_dir()
+        store = MetricsStore()
+        with override_settings(METRICS_DIR=directory):
+            first = self.exited_process_file(directory, counter=1)
+            self.assertEqual(store.collect()[self.COUNTER_KEY], 1)
+            self.assertFalse(os.path.exists(first))
+
+            # Within the interval the new dead file is summed where it lies
+            second = self.exited_process_file(directory, counter=2)
+            with mock.patch.object(store, "compact", wraps=store.compact) as compact:
+                self.assertEqual(store.collect()[self.COUNTER_KEY], 3)
+                compact.assert_not_called()
+                self.assertTrue(os.path.exists(second))
+
+                later = time.monotonic() + metrics.COMPACT_INTERVAL_SECONDS
+                with mock.patch("helpers.metrics.time.monotonic", return_value=later):
+                    self.assertEqual(store.collect()[self.COUNTER_KEY], 3)
+                compact.assert_called_once()
+                self.assertFalse(os.path.exists(second))
@@ -0,0 +1,45 @@
+"""
+DRF throttles backed by the shared SQLite store.
+
+Drop-in replacements for DRF's user/anon/scoped throttles that use a
+sliding-window counter in helpers.shared_store instead of the per-process
+cache, so limits hold across all worker processes. Rates are configured the
+usual way through REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'].
+"""
+from rest_framework.throttling import (
+    AnonRateThrottle, ScopedRateThrottle, SimpleRateThrottle, UserRateThrottle
+)
+
+from helpers.shared_store import get_shared_store
+
+
+class SharedRateThrottle(SimpleRateThrottle):
+    """Sliding-window throttle whose state lives in the shared store"""
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        allowed, self.retry_after = get_shared_store().hit_sliding_window(
+            self.key, self.num_requests, self.duration
+        )
+        return allowed
+
+    def wait(self):
+        return getattr(self, "retry_after", None)
+
+
+class SharedAnonRateThrottle(AnonRateThrottle, SharedRateThrottle):
+    """Limit anonymous requests per client IP"""
+
+
+class SharedUserRateThrottle(UserRateThrottle, SharedRateThrottle):
+    """Limit requests per user, or per client IP when anonymous"""
+
+
+class SharedScopedRateThrottle(ScopedRateThrottle, SharedRateThrottle):
+    """Limit requests per view `throttle_scope` and user/IP"""
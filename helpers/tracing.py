@@ -0,0 +1,344 @@
+"""
+Lightweight request tracing with W3C trace context.
+
+With TRACING_ENABLED on, TracingMiddleware starts a server span for a sampled
+fraction of requests (TRACE_SAMPLE_RATE) and, inside it, a span for the view, every DB query and every
+service method (AbstractService subclasses are traced automatically).
+helpers.upstream adds a client span per microservice call and sends a
+`traceparent` header, so the microservices can join the same trace. An
+incoming `traceparent` makes a sampled request continue the caller's trace;
+its sampled flag only decides sampling with TRACE_TRUST_PARENT_SAMPLING on
+(the caller is a trusted proxy), since otherwise any client could have every
+one of its requests traced.
+
+Finished traces are handed to a background exporter that writes them to a
+small SQLite file (TRACES_PATH); /api/traces/ lists them and
+/api/traces/<trace_id>/view/ draws a waterfall. An unsampled request pays one
+ContextVar lookup per span site and nothing else.
+"""
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+TRACEPARENT_HEADER = "traceparent"
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+# Roughly one export batch in this many also purges traces past retention
+PURGE_EVERY = 200
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS spans (
+    trace_id    TEXT NOT NULL,
+    span_id     TEXT NOT NULL,
+    parent_id   TEXT,
+    name        TEXT NOT NULL,
+    kind        TEXT NOT NULL,
+    start_us    INTEGER NOT NULL,
+    duration_us INTEGER NOT NULL,
+    status      TEXT NOT NULL,
+    attributes  TEXT NOT NULL,
+    PRIMARY KEY (trace_id, span_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS spans_server_start_idx ON spans (start_us) WHERE kind = 'server';
+DROP INDEX IF EXISTS spans_root_start_idx;
+"""
+
+
+def _random_id(length: int) -> str:
+    return f"{random.getrandbits(length * 4):0{length}x}"
+
+
+@dataclass
+class Span:
+    trace: "Trace"
+    name: str
+    kind: str
+    parent_id: Optional[str]
+    span_id: str = field(default_factory=lambda: _random_id(16))
+    start_us: int = field(default_factory=lambda: time.time_ns() // 1000)
+    duration_us: int = 0
+    status: str = "ok"
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def traceparent(self) -> str:
+        """W3C header value identifying this span as the parent of a downstream call"""
+        return f"00-{self.trace.trace_id}-{self.span_id}-01"
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+
+@dataclass
+class Trace:
+    trace_id: str
+    # Parent span from an incoming traceparent (a span in the caller's process)
+    remote_parent_id: Optional[str] = None
+    spans: List[Span] = field(default_factory=list)
+
+
+_current: ContextVar[Optional[Span]] = ContextVar("trace_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """(trace_id, parent span_id, sampled) from a traceparent header, or None if absent or invalid"""
+    match = _TRACEPARENT.match((value or "").strip().lower())
+    if not match or match.group(1) == "0" * 32 or match.group(2) == "0" * 16:
+        return None
+    return match.group(1), match.group(2), bool(int(match.group(3), 16) & 1)
+
+
+@contextmanager
+def start_trace(name: str, traceparent: Optional[str] = None, sample_rate: float = 0.0,
+                trust_parent: bool = False) -> Iterator[Optional[Span]]:
+    """
+    Root (server) span for one unit of work, sampled at sample_rate. An incoming
+    traceparent supplies the trace id, and its sampled flag decides sampling
+    instead only when trust_parent is set.
+    """
+    parent = parse_traceparent(traceparent)
+    if parent is not None and trust_parent:
+        sampled = parent[2]
+    else:
+        sampled = sample_rate > 0 and random.random() < sample_rate
+    if not sampled:
+        yield None
+        return
+
+    trace = Trace(trace_id=parent[0] if parent else _random_id(32), remote_parent_id=parent[1] if parent else None)
+    with _span(trace, name, "server", trace.remote_parent_id) as root:
+        yield root
+    get_exporter().export(trace)
+
+
+@contextmanager
+def _span(trace: Trace, name: str, kind: str, parent_id: Optional[str], **attributes) -> Iterator[Span]:
+    span = Span(trace, name, kind, parent_id, attributes=attributes)
+    token = _current.set(span)
+    started = time.perf_counter()
+    try:
+        yield span
+    except BaseException as e:
+        span.status = "error"
+        span.attributes.setdefault("error", f"{type(e).__name__}: {e}"[:500])
+        raise
+    finally:
+        span.duration_us = int((time.perf_counter() - started) * 1_000_000)
+        _current.reset(token)
+        trace.spans.append(span)
+
+
+@contextmanager
+def start_span(name: str, kind: str = "internal", **attributes) -> Iterator[Optional[Span]]:
+    """Child of the current span; a no-op (yields None) when the request isn't being traced"""
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    with _span(parent.trace, name, kind, parent.span_id, **attributes) as span:
+        yield span
+
+
+def traced(name: str):
+    """Decorator: run the function in a span while a trace is active"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return fn(*args, **kwargs)
+            with start_span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def db_wrapper(execute, sql, params, many, context):
+    """Execute wrapper that records each query run inside a trace as a span"""
+    parent = _current.get()
+    if parent is None:
+        return execute(sql, params, many, context)
+    with _span(parent.trace, "db.query", "client", parent.span_id, statement=sql[:500], many=many):
+        return execute(sql, params, many, context)
+
+
+def install(sender, connection, **kwargs) -> None:
+    """connection_created receiver: add db_wrapper to the connection once"""
+    if not getattr(settings, "TRACING_ENABLED", False):
+        return
+    if db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(db_wrapper)
+
+
+class SpanExporter:
+    """Writes finished traces to the spans table on a background thread"""
+
+    def __init__(self, path: Optional[str] = None):
+        self._path = path
+        self._queue: "queue.Queue[Trace]" = queue.Queue(maxsize=10000)
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.dropped = 0
+
+    @property
+    def path(self) -> str:
+        if self._path is None:
+            self._path = str(settings.TRACES_PATH)
+        return self._path
+
+    def connection(self) -> sqlite3.Connection:
+        # One connection per thread, reopened after a fork
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=NORMAL;")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def export(self, trace: Trace) -> None:
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._queue = queue.Queue(maxsize=10000)
+                    self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                    self._thread.start()
+                    self._pid = os.getpid()
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            # Never slow requests down for tracing; count what was lost instead
+            self.dropped += 1
+
+    def _run(self) -> None:
+        while True:
+            traces = [self._queue.get()]
+            while True:
+                try:
+                    traces.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.write(traces)
+            except sqlite3.Error as e:
+                logger.error(f"Could not export {len(traces)} traces: {str(e)}")
+
+    def write(self, traces: List[Trace]) -> None:
+        rows = [
+            (trace.trace_id, span.span_id, span.parent_id, span.name, span.kind, span.start_us,
+             span.duration_us, span.status, json.dumps(span.attributes, default=str))
+            for trace in traces for span in trace.spans
+        ]
+        conn = self.connection()
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany("INSERT OR REPLACE INTO spans VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        if random.randrange(PURGE_EVERY) == 0:
+            self.purge()
+
+    def purge(self) -> int:
+        cutoff = (time.time() - settings.TRACE_RETENTION_HOURS * 3600) * 1_000_000
+        with self.connection() as conn:
+            return conn.execute(
+                "DELETE FROM spans WHERE trace_id IN (SELECT trace_id FROM spans WHERE kind = 'server' AND start_us < ?)",
+                (cutoff,),
+            ).rowcount
+
+    def recent_traces(self, limit: int = 50, min_duration_ms: float = 0, name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Root spans of the newest traces, with their span counts"""
+        # Roots are the server spans: a root continuing a caller's trace has a (remote) parent_id
+        sql = """
+            SELECT root.trace_id, root.name, root.start_us, root.duration_us, root.status, root.attributes,
+                   (SELECT COUNT(*) FROM spans s WHERE s.trace_id = root.trace_id)
+            FROM spans root
+            WHERE root.kind = 'server' AND root.duration_us >= ?
+        """
+        params: List[Any] = [int(min_duration_ms * 1000)]
+        if name:
+            sql += " AND root.name LIKE ?"
+            params.append(f"%{name}%")
+        sql += " ORDER BY root.start_us DESC LIMIT ?"
+        params.append(limit)
+        return [
+            {"trace_id": row[0], "name": row[1], "start_us": row[2], "duration_ms": row[3] / 1000,
+             "status": row[4], "attributes": json.loads(row[5]), "spans": row[6]}
+            for row in self.connection().execute(sql, params)
+        ]
+
+    def get_trace(self, trace_id: str) -> List[Dict[str, Any]]:
+        """Every span of a trace, in start order"""
+        rows = self.connection().execute(
+            "SELECT span_id, parent_id, name, kind, start_us, duration_us, status, attributes "
+            "FROM spans WHERE trace_id = ? ORDER BY start_us",
+            (trace_id,),
+        )
+        return [
+            {"span_id": row[0], "parent_id": row[1], "name": row[2], "kind": row[3], "start_us": row[4],
+             "duration_ms": row[5] / 1000, "status": row[6], "attributes": json.loads(row[7])}
+            for row in rows
+        ]
+
+
+exporter = SpanExporter()
+
+
+def get_exporter() -> SpanExporter:
+    """Return the process-wide SpanExporter instance."""
+    return exporter
+
+
+def waterfall(spans: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Spans (as returned by SpanExporter.get_trace) in tree order, each with its
+    depth and its start and width as percentages of the trace's extent.
+    """
+    if not spans:
+        return []
+    start = min(span["start_us"] for span in spans)
+    end = max(span["start_us"] + span["duration_ms"] * 1000 for span in spans)
+    extent = max(end - start, 1)
+
+    ids = {span["span_id"] for span in spans}
+    children: Dict[Optional[str], List[Dict[str, Any]]] = {}
+    for span in spans:
+        # The root's parent lives in the calling process, if anywhere
+        parent = span["parent_id"] if span["parent_id"] in ids else None
+        children.setdefault(parent, []).append(span)
+
+    rows: List[Dict[str, Any]] = []
+
+    def visit(parent: Optional[str], depth: int) -> None:
+        for span in children.get(parent, []):
+            rows.append({
+                **span,
+                "depth": depth,
+                "offset_ms": round((span["start_us"] - start) / 1000, 3),
+                "left_pct": round((span["start_us"] - start) * 100 / extent, 3),
+                "width_pct": round(max(span["duration_ms"] * 1000 * 100 / extent, 0.2), 3),
+            })
+            visit(span["span_id"], depth + 1)
+
+    visit(None, 0)
+    return rows
@@ -0,0 +1,157 @@
+"""
+HTTP calls from the proxy views to the analysis microservices.
+
+Going through these helpers (rather than `requests` directly) puts the time
+spent waiting on a microservice into the request's Server-Timing breakdown
+and the upstream latency / error metrics and, for traced requests, adds a
+client span and a `traceparent` header so the microservice can join the trace.
+
+Calls name a service and a path; the replica is chosen by the service's pool
+(see helpers.load_balancer). Idempotent calls can be hedged: with
+UPSTREAM_HEDGING_ENABLED, if the first attempt hasn't answered within the
+service's recent p95, a second goes to another replica and whichever answers
+first wins.
+
+Inside a request the call's timeout comes from the request's deadline (see
+helpers.deadlines), capped by any timeout the caller passes, and the time left
+is forwarded in X-Request-Deadline-Ms. A timeout or 504 that comes from the
+request's own deadline running out says nothing about the replica, so it
+doesn't count against the replica's health (a client could otherwise send a
+tiny deadline to get healthy replicas ejected).
+"""
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Optional
+
+import requests
+from django.conf import settings
+
+from helpers import deadlines
+from helpers.load_balancer import Endpoint, ServicePool, get_pool
+from helpers.metrics import UPSTREAM_DURATION, UPSTREAM_ERRORS, UPSTREAM_HEDGES
+from helpers.request_timing import span
+from helpers.tracing import TRACEPARENT_HEADER, start_span
+
+# Threads running hedged calls (both attempts), created per process on first use
+HEDGE_WORKERS = 32
+# A 504 arriving with less than this left of the request's deadline is the service honouring that deadline
+DEADLINE_SLACK_SECONDS = 0.5
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor, _executor_pid
+    if _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="upstream-hedge")
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def post(service: str, path: str, idempotent: bool = False, **kwargs) -> requests.Response:
+    """
+    requests.post to one of the service's replicas, timed as "upstream" for the
+    current request and recorded per service. Pass idempotent=True for calls
+    that are safe to send twice, to allow hedging.
+
+    Raises DeadlineExceeded if the request's budget is spent before or during the call.
+    """
+    deadline = deadlines.current_deadline()
+    if deadline is None:
+        kwargs["timeout"] = kwargs.get("timeout") or settings.UPSTREAM_TIMEOUT_SECONDS
+    else:
+        # Capped again, and the deadline header added, by each attempt
+        kwargs["timeout"] = deadlines.timeout(kwargs.get("timeout"), what=f"calling {service}")
+
+    pool = get_pool(service)
+    pool.start_call()
+    hedge_delay = pool.hedge_delay() if idempotent and settings.UPSTREAM_HEDGING_ENABLED else None
+    if hedge_delay is None:
+        return _attempt(pool, pool.acquire(), path, kwargs)
+    return _hedged(pool, path, kwargs, hedge_delay)
+
+
+def _attempt(pool: ServicePool, endpoint: Endpoint, path: str, kwargs: Dict[str, Any],
+             hedge: bool = False) -> requests.Response:
+    """One POST to one replica; releases the replica with the outcome"""
+    service = pool.name
+    url = f"{endpoint.url}{path}"
+    deadline = deadlines.current_deadline()
+    started = time.perf_counter()
+    # None: the outcome says nothing about the replica's health
+    ok: Optional[bool] = None
+    try:
+        if deadline is not None:
+            # Time left now, not when the call was prepared (a hedge starts later than the first attempt)
+            kwargs = {
+                **kwargs,
+                "timeout": deadlines.timeout(kwargs.get("timeout"), what=f"calling {service}"),
+                "headers": {**(kwargs.get("headers") or {}), deadlines.DEADLINE_HEADER: deadlines.header_value(deadline)},
+            }
+        ok = False
+        with start_span(f"POST {service}", "client", **{"http.url": url, "peer.service": service}) as client_span:
+            if client_span is not None:
+                client_span.set(hedge=hedge)
+                kwargs = {**kwargs, "headers": {**(kwargs.get("headers") or {}), TRACEPARENT_HEADER: client_span.traceparent}}
+            try:
+                with span("upstream"):
+                    response = requests.post(url, **kwargs)
+            except requests.exceptions.Timeout as e:
+                UPSTREAM_ERRORS.labels(service).inc()
+                if deadline is not None and deadline.expired:
+                    ok = None
+                    raise deadlines.DeadlineExceeded(f"{service} did not answer within the request's time budget") from e
+                raise
+            except requests.exceptions.RequestException:
+                UPSTREAM_ERRORS.labels(service).inc()
+                raise
+            ok = response.status_code < 500
+            if response.status_code == 504 and deadline is not None:
+                # The service gave up, normally at the deadline we forwarded
+                UPSTREAM_ERRORS.labels(service).inc()
+                if deadline.remaining() <= DEADLINE_SLACK_SECONDS:
+                    ok = None
+                raise deadlines.DeadlineExceeded(f"{service} did not answer within the request's time budget")
+            if client_span is not None:
+                client_span.set(**{"http.status_code": response.status_code})
+                if not ok:
+                    client_span.status = "error"
+    finally:
+        pool.release(endpoint, ok, time.perf_counter() - started)
+    UPSTREAM_DURATION.labels(service, response.status_code).observe(time.perf_counter() - started)
+    return response
+
+
+def _hedged(pool: ServicePool, path: str, kwargs: Dict[str, Any], delay: float) -> requests.Response:
+    """
+    Run the call on a worker thread; if it hasn't answered after `delay`, send a
+    second attempt to another replica and return the first good response. The
+    losing attempt is left to finish in the background.
+    """
+    executor = _get_executor()
+    primary_endpoint = pool.acquire()
+    # Each attempt runs in a copy of this context, so it sees the request's deadline and trace
+    primary = executor.submit(contextvars.copy_context().run, _attempt, pool, primary_endpoint, path, kwargs)
+    done, _ = wait([primary], timeout=delay)
+    if done or not pool.allow_hedge():
+        return primary.result()
+
+    secondary = executor.submit(
+        contextvars.copy_context().run, _attempt, pool, pool.acquire(exclude=primary_endpoint), path, kwargs, True
+    )
+    pending = {primary, secondary}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None and future.result().status_code < 500:
+                UPSTREAM_HEDGES.labels(pool.name, "hedge" if future is secondary else "primary").inc()
+                return future.result()
+    # Both failed: report the original attempt's outcome
+    UPSTREAM_HEDGES.labels(pool.name, "neither").inc()
+    return primary.result()
@@ -0,0 +1,154 @@
+"""
+Single-writer queue for SQLite write traffic.
+
+SQLite allows one writer at a time, so many request threads writing at once
+mostly spend their time waiting on the database lock. Instead, small writes are
+handed to one dedicated writer thread per process, which groups whatever is
+queued into a single transaction (each job in its own savepoint, so one failing
+job does not roll back the others). Callers block until their batch has
+committed, so the API stays synchronous.
+
+A caller waits at most WRITE_QUEUE_TIMEOUT_SECONDS (or what is left of its
+request's deadline) and then gets a 503; a job that has not started by then is
+dropped. A writer thread that has died (or didn't survive a fork) is started
+again by the next submit.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, List, Optional, Tuple
+
+from django.db import close_old_connections, connection, transaction
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from helpers import deadlines
+from helpers.env_variables import (
+    WRITE_QUEUE_ENABLED, WRITE_QUEUE_MAX_BATCH, WRITE_QUEUE_LINGER_MS, WRITE_QUEUE_TIMEOUT_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+Job = Tuple[Callable[..., Any], tuple, dict, Future]
+
+
+class WriteTimeout(APIException):
+    """A queued write didn't commit in time; it may still commit later if it had already started"""
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'The database is busy, please try again.'
+    default_code = 'write_timeout'
+
+
+class WriteQueue:
+    """One writer thread that commits queued write jobs in batches"""
+
+    def __init__(self, enabled: bool = WRITE_QUEUE_ENABLED, max_batch: int = WRITE_QUEUE_MAX_BATCH,
+                 linger_ms: float = WRITE_QUEUE_LINGER_MS, timeout: float = WRITE_QUEUE_TIMEOUT_SECONDS):
+        self.enabled = enabled
+        self.max_batch = max_batch
+        self.linger = linger_ms / 1000
+        self.timeout = timeout
+        self._queue: "queue.Queue[Job]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        self.batches = 0
+        self.jobs = 0
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        """Queue a write job; the future resolves once its batch has committed"""
+        future: Future = Future()
+        if not self.enabled or threading.current_thread() is self._thread or connection.in_atomic_block:
+            # Disabled, a job queuing more work, or the caller already holds a transaction
+            # (handing off would deadlock against its own lock): run inline
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        self._ensure_thread()
+        self._queue.put((fn, args, kwargs, future))
+        return future
+
+    def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run a write job on the writer thread and wait for it to commit.
+        Raises WriteTimeout (or DeadlineExceeded) when that takes too long.
+        """
+        timeout = deadlines.timeout(self.timeout, "queued write")
+        future = self.submit(fn, *args, **kwargs)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            # Dropped if the writer hasn't picked it up yet
+            future.cancel()
+            logger.error(f"Write job {getattr(fn, '__qualname__', fn)} didn't commit within {timeout:.1f}s "
+                         f"({self._queue.qsize()} queued, writer alive: {self._writer_alive()})")
+            raise WriteTimeout()
+
+    def _writer_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _ensure_thread(self) -> None:
+        if self._writer_alive():
+            return
+        with self._lock:
+            if not self._writer_alive():
+                if self._thread is not None:
+                    logger.error("Write queue thread is gone, starting a new one")
+                self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+                self._thread.start()
+
+    def _collect_batch(self) -> List[Job]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect_batch()
+            outcomes = []
+            try:
+                close_old_connections()
+                with transaction.atomic():
+                    for fn, args, kwargs, future in batch:
+                        # Checked just before each job runs, so a job queued behind a slow one is
+                        # still dropped when its caller gives up waiting
+                        if not future.set_running_or_notify_cancel():
+                            continue
+                        try:
+                            with transaction.atomic():
+                                outcomes.append((future, True, fn(*args, **kwargs)))
+                        except Exception as e:
+                            outcomes.append((future, False, e))
+            except Exception as e:
+                logger.error(f"Write batch of {len(batch)} jobs failed to commit: {str(e)}")
+                for _, _, _, future in batch:
+                    if future.running() or future.set_running_or_notify_cancel():
+                        future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.jobs += len(outcomes)
+            for future, ok, value in outcomes:
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+
+write_queue = WriteQueue()
+
+
+def get_write_queue() -> WriteQueue:
+    """Return the process-wide WriteQueue instance."""
+    return write_queue
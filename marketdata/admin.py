@@ -35,7 +35,7 @@ class PriceAlertAdmin(admin.ModelAdmin):
 
     fieldsets = (
         ('Alert Details', {
-            'fields': ('user', 'crypto', 'symbol', 'condition', 'price')
+            'fields': ('user', 'crypto', 'symbol', 'condition', 'price', 'period')
         }),
         ('Status', {
             'fields': ('active', 'is_triggered')
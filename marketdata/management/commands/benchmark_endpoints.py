@@ -0,0 +1,195 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from io import StringIO
+from pathlib import Path
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from helpers.synthetic_data import generate_alerts, generate_prices, generate_users, symbol_names
+import json
+import statistics
+import subprocess
+import time
+
+SIZES = {'10k': 10_000, '1m': 1_000_000, '10m': 10_000_000}
+
+# Endpoints timed for every dataset; {symbol} is filled with a generated symbol
+ENDPOINTS = [
+    ('tickers', '/api/tickers/', False),
+    ('candles', '/api/candles/{symbol}/', False),
+    ('summary', '/api/summary/', False),
+    ('alerts', '/api/alerts/', True),
+]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=settings.BASE_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+class Command(BaseCommand):
+    help = ('Benchmark tickers, candles, summary, alerts and check_alerts against generated datasets '
+            'and save latency percentiles and throughput as JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10k,1m,10m',
+                            help=f'Comma-separated price row counts ({", ".join(SIZES)} or a number)')
+        parser.add_argument('--alerts', type=int, default=100_000, help='Alerts per dataset')
+        parser.add_argument('--symbols', type=int, default=100, help='Symbols per dataset')
+        parser.add_argument('--concurrency', default='1,4,16', help='Comma-separated concurrency levels')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint and concurrency level')
+        parser.add_argument('--data-dir', default=str(settings.BASE_DIR / 'benchmark_data'),
+                            help='Where generated dataset databases are kept (reused when present)')
+        parser.add_argument('--output', help='Result file (default benchmark_results/<commit>.json)')
+        parser.add_argument('--baseline', help='Earlier result file to compare against')
+
+    def handle(self, *args, **options):
+        sizes = [self.parse_size(value) for value in options['sizes'].split(',')]
+        levels = [int(value) for value in options['concurrency'].split(',')]
+        commit = git_commit()
+
+        report = {
+            'commit': commit,
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'requests': options['requests'],
+            'datasets': [],
+        }
+
+        original_db = settings.DATABASES['default']['NAME']
+        try:
+            for rows in sizes:
+                path = Path(options['data_dir']) / f'bench_{rows}_{options["symbols"]}_{options["alerts"]}.db'
+                self.use_database(path)
+                self.prepare_dataset(path, rows, options['symbols'], options['alerts'])
+                report['datasets'].append(self.run_dataset(rows, options, levels))
+        finally:
+            self.use_database(original_db)
+
+        output = Path(options['output'] or settings.BASE_DIR / 'benchmark_results' / f'{commit}.json')
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2))
+        self.stdout.write(self.style.SUCCESS(f'Results written to {output}'))
+
+        if options['baseline']:
+            self.compare(json.loads(Path(options['baseline']).read_text()), report)
+
+    def parse_size(self, value):
+        value = value.strip().lower()
+        if value in SIZES:
+            return SIZES[value]
+        try:
+            return int(value)
+        except ValueError:
+            raise CommandError(f'Invalid size "{value}"')
+
+    def use_database(self, path):
+        """Point the default connection at another SQLite file"""
+        connections['default'].close()
+        connections['default'].settings_dict['NAME'] = str(path)
+
+    def prepare_dataset(self, path, rows, symbols, alerts):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        call_command('migrate', verbosity=0)
+
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'prices'")
+            has_prices = cursor.fetchone() is not None
+            if has_prices:
+                cursor.execute('SELECT COUNT(*) FROM prices')
+                has_prices = cursor.fetchone()[0] >= rows
+
+        if has_prices:
+            self.stdout.write(f'Reusing dataset {path.name}')
+            return
+
+        self.stdout.write(f'Generating {rows:,} price rows and {alerts:,} alerts into {path.name}...')
+        started = time.perf_counter()
+        generate_prices(symbols=symbols, days=max(1, rows // symbols))
+        user_ids = generate_users(max(1, alerts // 20), prefix='bench')
+        generate_alerts(user_ids, symbol_names(symbols), alerts)
+        self.stdout.write(f'Generated in {time.perf_counter() - started:.1f}s')
+
+    def run_dataset(self, rows, options, levels):
+        symbol = symbol_names(1)[0]
+        user = User.objects.filter(username__startswith='bench').order_by('id').first()
+        dataset = {'price_rows': rows, 'alerts': options['alerts'], 'symbols': options['symbols'], 'endpoints': []}
+
+        for name, path, authenticated in ENDPOINTS:
+            for concurrency in levels:
+                result = self.run_endpoint(path.format(symbol=symbol), user if authenticated else None,
+                                           concurrency, options['requests'])
+                result.update({'endpoint': name, 'concurrency': concurrency})
+                dataset['endpoints'].append(result)
+                self.stdout.write(
+                    f'{rows:>10,} rows  {name:<8} c={concurrency:<3} '
+                    f'p50 {result["p50_ms"]:8.2f}ms  p95 {result["p95_ms"]:8.2f}ms  '
+                    f'p99 {result["p99_ms"]:8.2f}ms  {result["throughput_rps"]:8.1f} req/s  '
+                    f'errors {result["errors"]}'
+                )
+
+        started = time.perf_counter()
+        call_command('check_alerts', stdout=StringIO())
+        dataset['check_alerts_seconds'] = round(time.perf_counter() - started, 3)
+        self.stdout.write(f'{rows:>10,} rows  check_alerts {dataset["check_alerts_seconds"]:.2f}s')
+        return dataset
+
+    def run_endpoint(self, path, user, concurrency, total_requests):
+        per_thread = max(1, total_requests // concurrency)
+
+        def worker(_):
+            client = Client()
+            if user is not None:
+                client.force_login(user)
+            times, errors = [], 0
+            try:
+                for _ in range(per_thread):
+                    started = time.perf_counter()
+                    response = client.get(path, secure=True)
+                    times.append(time.perf_counter() - started)
+                    errors += response.status_code >= 400
+            finally:
+                connections.close_all()
+            return times, errors
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(worker, range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+        times = [t for result in results for t in result[0]]
+        return {
+            'requests': len(times),
+            'errors': sum(result[1] for result in results),
+            'mean_ms': round(statistics.mean(times) * 1000, 3),
+            'p50_ms': round(percentile(times, 50) * 1000, 3),
+            'p95_ms': round(percentile(times, 95) * 1000, 3),
+            'p99_ms': round(percentile(times, 99) * 1000, 3),
+            'throughput_rps': round(len(times) / elapsed, 1),
+        }
+
+    def compare(self, baseline, report):
+        self.stdout.write(f'\nCompared with {baseline["commit"]}:')
+        previous = {
+            (dataset['price_rows'], entry['endpoint'], entry['concurrency']): entry
+            for dataset in baseline['datasets'] for entry in dataset['endpoints']
+        }
+        for dataset in report['datasets']:
+            for entry in dataset['endpoints']:
+                before = previous.get((dataset['price_rows'], entry['endpoint'], entry['concurrency']))
+                if not before:
+                    continue
+                change = (entry['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100 if before['p50_ms'] else 0
+                line = (f'{dataset["price_rows"]:>10,} rows  {entry["endpoint"]:<8} c={entry["concurrency"]:<3} '
+                        f'p50 {before["p50_ms"]:.2f} -> {entry["p50_ms"]:.2f}ms ({change:+.1f}%)')
+                self.stdout.write(self.style.ERROR(line) if change > 10 else line)
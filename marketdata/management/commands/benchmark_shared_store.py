@@ -0,0 +1,80 @@
+from concurrent.futures import ProcessPoolExecutor
+from django.core.management.base import BaseCommand
+from helpers.db_utils import init_worker_process
+from helpers.shared_store import get_shared_store
+import statistics
+import time
+import uuid
+
+
+def run_worker(run_id, iterations):
+    """Process-pool entry point: time increments and rate-limit checks on shared keys"""
+    store = get_shared_store()
+    incr_times = []
+    check_times = []
+    allowed = 0
+
+    for _ in range(iterations):
+        started = time.perf_counter()
+        store.incr(f'bench:{run_id}:counter', ttl=300)
+        incr_times.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        ok, _ = store.hit_sliding_window(f'bench:{run_id}:limit', limit=iterations, window=300)
+        check_times.append(time.perf_counter() - started)
+        allowed += ok
+
+    return incr_times, check_times, allowed
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the shared counter store and verify it stays consistent across processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4, help='Number of worker processes')
+        parser.add_argument('--iterations', type=int, default=2000, help='Operations per process')
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        iterations = options['iterations']
+        run_id = uuid.uuid4().hex[:8]
+
+        self.stdout.write(f'Running {iterations} increments and checks in each of {processes} processes...')
+
+        started = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=processes, initializer=init_worker_process) as pool:
+            results = list(pool.map(run_worker, [run_id] * processes, [iterations] * processes))
+        elapsed = time.perf_counter() - started
+
+        incr_times = [t for result in results for t in result[0]]
+        check_times = [t for result in results for t in result[1]]
+        allowed = sum(result[2] for result in results)
+
+        for name, times in (('incr', incr_times), ('rate limit check', check_times)):
+            self.stdout.write(
+                f'{name:>17}: mean {statistics.mean(times) * 1e6:.0f}us, '
+                f'p50 {percentile(times, 50) * 1e6:.0f}us, '
+                f'p95 {percentile(times, 95) * 1e6:.0f}us, '
+                f'p99 {percentile(times, 99) * 1e6:.0f}us'
+            )
+        self.stdout.write(f'Throughput: {len(incr_times) * 2 / elapsed:.0f} ops/s')
+
+        store = get_shared_store()
+        expected = processes * iterations
+        counter = store.get(f'bench:{run_id}:counter')
+        store.delete(f'bench:{run_id}:counter')
+
+        if counter == expected and allowed == iterations:
+            self.stdout.write(self.style.SUCCESS(
+                f'[OK] Counter reached {counter}, rate limit allowed exactly {allowed} of {expected} hits'
+            ))
+        else:
+            self.stdout.write(self.style.ERROR(
+                f'[ERROR] Counter {counter} (expected {expected}), '
+                f'rate limit allowed {allowed} (expected {iterations})'
+            ))
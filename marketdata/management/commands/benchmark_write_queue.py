@@ -0,0 +1,107 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from helpers.synthetic_data import is_configured_database
+from helpers.write_queue import WriteQueue
+from pathlib import Path
+import statistics
+import time
+
+SCRATCH_TABLE = 'bench_write_queue'
+
+
+def insert_row(worker, n):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {SCRATCH_TABLE} (worker, n, payload) VALUES (%s, %s, %s)',
+            [worker, n, 'x' * 200],
+        )
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Command(BaseCommand):
+    help = ('Compare concurrent direct writes with writes routed through the single-writer queue, '
+            'in a scratch table of the SQLite file given by --database (created if needed).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', required=True,
+                            help='Scratch SQLite file to write to; must not be the application database')
+        parser.add_argument('--threads', type=int, default=16, help='Number of concurrent writer threads')
+        parser.add_argument('--writes', type=int, default=200, help='Writes per thread')
+
+    def handle(self, *args, **options):
+        threads = options['threads']
+        writes = options['writes']
+
+        original_db = settings.DATABASES['default']['NAME']
+        self.use_database(Path(options['database']).resolve())
+        try:
+            if is_configured_database():
+                raise CommandError(f'Refusing to benchmark writes against the application database '
+                                   f'{connection.settings_dict["NAME"]}')
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE IF EXISTS {SCRATCH_TABLE}')
+                cursor.execute(
+                    f'CREATE TABLE {SCRATCH_TABLE} (id INTEGER PRIMARY KEY, worker INTEGER, n INTEGER, payload TEXT)'
+                )
+
+            self.stdout.write(f'{threads} threads x {writes} writes into {connection.settings_dict["NAME"]}')
+            self.report('direct', self.run_direct(threads, writes), threads * writes)
+
+            queue = WriteQueue(enabled=True)
+            self.report('queued', self.run_queued(queue, threads, writes), threads * writes)
+            self.stdout.write(f'Queue committed {queue.jobs} writes in {queue.batches} transactions')
+        finally:
+            self.use_database(original_db)
+
+    def use_database(self, path):
+        """Point the default connection at another SQLite file"""
+        connections['default'].close()
+        connections['default'].settings_dict['NAME'] = str(path)
+
+    def run_direct(self, threads, writes):
+        def worker(index):
+            times = []
+            try:
+                for n in range(writes):
+                    started = time.perf_counter()
+                    with transaction.atomic():
+                        insert_row(index, n)
+                    times.append(time.perf_counter() - started)
+            finally:
+                connections.close_all()
+            return times
+
+        return self.run_threads(worker, threads)
+
+    def run_queued(self, queue, threads, writes):
+        def worker(index):
+            times = []
+            for n in range(writes):
+                started = time.perf_counter()
+                queue.run(insert_row, index, n)
+                times.append(time.perf_counter() - started)
+            return times
+
+        return self.run_threads(worker, threads)
+
+    def run_threads(self, worker, threads):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            results = list(pool.map(worker, range(threads)))
+        return [t for times in results for t in times], time.perf_counter() - started
+
+    def report(self, name, result, expected):
+        times, elapsed = result
+        self.stdout.write(
+            f'{name:>7}: {len(times)}/{expected} writes, {len(times) / elapsed:.0f} writes/s, '
+            f'mean {statistics.mean(times) * 1e3:.2f}ms, '
+            f'p50 {percentile(times, 50) * 1e3:.2f}ms, '
+            f'p99 {percentile(times, 99) * 1e3:.2f}ms, '
+            f'max {max(times) * 1e3:.2f}ms'
+        )
@@ -1,103 +1,207 @@
-from django.core.management.base import BaseCommand
+from concurrent.futures import ProcessPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Q
 from django.utils import timezone
 from datetime import timedelta
-from marketdata.models import PriceAlert, Price
+from marketdata.models import PriceAlert
+from marketdata.services.alert_conditions import CandleIndicators, evaluate_alert, required_lookback
 from auth.services.email_service import send_alert_email
+from helpers.db_utils import init_worker_process
+from helpers.metrics import ALERT_CHECK_DURATION, ALERTS_CHECKED, ALERTS_TRIGGERED
 import logging
+import time
+import zlib
 
 logger = logging.getLogger(__name__)
 
+# Minimum time between two emails for the same alert
+SEND_COOLDOWN = timedelta(hours=24)
+
+
+def parse_shard(value):
+    """Parse a shard spec of the form "i/N" into (i, N)"""
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except (AttributeError, ValueError):
+        raise CommandError(f'Invalid shard "{value}", expected the form i/N (e.g. 0/4)')
+
+    if count < 1 or not 0 <= index < count:
+        raise CommandError(f'Invalid shard "{value}", index must be between 0 and {count - 1}')
+    return index, count
+
+
+def symbol_shard(symbol, shard_count):
+    """Stable shard index for a symbol (crc32, so it is the same in every process)"""
+    return zlib.crc32(symbol.encode('utf-8')) % shard_count
+
+
+def run_shard(shard_index, shard_count):
+    """Process-pool entry point: check a single shard and return its counts"""
+    return Command().check_shard(shard_index, shard_count)
+
 
 class Command(BaseCommand):
     help = 'Check price alerts and send notifications when conditions are met'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of worker processes; alerts are split into this many shards by symbol',
+        )
+        parser.add_argument(
+            '--shard',
+            type=parse_shard,
+            default=None,
+            help='Only check shard i of N (e.g. 0/4), for running shards as separate jobs',
+        )
+
     def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('Starting alert check...'))
         
-        active_alerts = PriceAlert.objects.filter(active=True)
-        self.stdout.write(f'Found {active_alerts.count()} active alerts')
+        workers = options['workers']
+        shard = options['shard']
+
+        if workers < 1:
+            raise CommandError('--workers must be at least 1')
+        if shard and workers > 1:
+            raise CommandError('--shard and --workers cannot be combined')
+
+        if shard:
+            results = [self.check_shard(*shard)]
+        elif workers > 1:
+            # Children must not share the parent's SQLite connection
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker_process) as pool:
+                results = list(pool.map(run_shard, range(workers), [workers] * workers))
+        else:
+            results = [self.check_shard(0, 1)]
+
+        checked_count = sum(result['checked'] for result in results)
+        triggered_count = sum(result['triggered'] for result in results)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'\nAlert check complete: {checked_count} checked, {triggered_count} triggered'
+        ))
+    
+    def check_shard(self, shard_index, shard_count):
+        """Check all active alerts whose symbol hashes to the given shard"""
+        label = f'[shard {shard_index}/{shard_count}] ' if shard_count > 1 else ''
+        started = time.perf_counter()
+
+        active_alerts = PriceAlert.objects.filter(active=True).select_related('user')
+        if shard_count > 1:
+            symbols = PriceAlert.objects.filter(active=True).values_list('symbol', flat=True).distinct()
+            shard_symbols = [s for s in symbols if symbol_shard(s, shard_count) == shard_index]
+            active_alerts = active_alerts.filter(symbol__in=shard_symbols)
+
+        active_alerts = list(active_alerts)
+        self.stdout.write(f'{label}Found {len(active_alerts)} active alerts')
         
+        # One candle window per symbol, long enough for its most demanding alert
+        lookbacks = {}
+        for alert in active_alerts:
+            lookbacks[alert.symbol] = max(lookbacks.get(alert.symbol, 1), required_lookback(alert))
+
         checked_count = 0
         triggered_count = 0
+        indicators = {}
         
         for alert in active_alerts:
             try:
                 # Check if we should skip due to recent notification
                 if alert.last_sent_at:
                     time_since_last_sent = timezone.now() - alert.last_sent_at
-                    if time_since_last_sent < timedelta(hours=24):
+                    if time_since_last_sent < SEND_COOLDOWN:
                         # Log but don't count as "checked" in a way that implies failure, strictly skipping
-                        self.stdout.write(f'Skipping {alert.symbol} for user {alert.user.username} - email sent {time_since_last_sent.total_seconds() / 3600:.1f} hours ago')
+                        self.stdout.write(f'{label}Skipping {alert.symbol} for user {alert.user.username} - email sent {time_since_last_sent.total_seconds() / 3600:.1f} hours ago')
                         continue
                 
-                current_price = self.get_current_price(alert.symbol)
+                if alert.symbol not in indicators:
+                    indicators[alert.symbol] = self.get_indicators(alert.symbol, lookbacks[alert.symbol])
+                symbol_indicators = indicators[alert.symbol]
+                current_price = symbol_indicators.last if symbol_indicators else None
                 
                 if current_price is None:
-                    self.stdout.write(self.style.WARNING(f'Could not fetch price for {alert.symbol}'))
+                    self.stdout.write(self.style.WARNING(f'{label}Could not fetch price for {alert.symbol}'))
                     continue
                 
                 checked_count += 1
                 
-                condition_met = False
-                if alert.condition == 'above' and current_price >= float(alert.price):
-                    condition_met = True
-                elif alert.condition == 'below' and current_price <= float(alert.price):
-                    condition_met = True
+                condition_met, observed = evaluate_alert(alert, symbol_indicators)
                 
                 if condition_met:
-                    self.stdout.write(f'Alert condition met for {alert.symbol}: {current_price} {alert.condition} {alert.price}')
+                    self.stdout.write(f'{label}Alert condition met for {alert.symbol}: {observed} {alert.condition} {alert.price}')
                     
                     # Check if user has an email address
                     if not alert.user.email or not alert.user.email.strip():
                         self.stdout.write(self.style.WARNING(
-                            f'⚠ Skipping email for {alert.symbol} - user {alert.user.username} has no email address'
+                            f'{label}⚠ Skipping email for {alert.symbol} - user {alert.user.username} has no email address'
                         ))
                         continue
                     
+                    claimed_at = timezone.now()
+                    if not self.claim_alert(alert, claimed_at):
+                        self.stdout.write(f'{label}Skipping alert {alert.id} - already claimed by another worker')
+                        continue
+
                     success = send_alert_email(
                         user_email=alert.user.email,
                         crypto_name=alert.crypto,
                         symbol=alert.symbol,
                         condition=alert.condition,
                         target_price=float(alert.price),
-                        current_price=current_price
+                        current_price=current_price,
+                        period=alert.period,
+                        observed=observed,
                     )
                     
                     if success:
-                        alert.is_triggered = True
-                        alert.last_triggered_at = timezone.now()
-                        alert.last_sent_at = timezone.now()
-                        alert.save()
+                        PriceAlert.objects.filter(pk=alert.pk).update(
+                            is_triggered=True,
+                            last_triggered_at=claimed_at,
+                            updated_at=claimed_at,
+                        )
                         
                         triggered_count += 1
                         self.stdout.write(self.style.SUCCESS(
-                            f'✓ Alert triggered and email sent: {alert.symbol} {alert.condition} ${alert.price} (current: ${current_price:.2f})'
+                            f'{label}✓ Alert triggered and email sent: {alert.symbol} {alert.condition} ${alert.price} (current: ${current_price:.2f})'
                         ))
                     else:
-                        self.stdout.write(self.style.ERROR(f'Failed to send email for {alert.symbol}'))
+                        self.release_alert(alert, claimed_at)
+                        self.stdout.write(self.style.ERROR(f'{label}Failed to send email for {alert.symbol}'))
                 
             except Exception as e:
                 logger.error(f'Error checking alert {alert.id}: {str(e)}')
-                self.stdout.write(self.style.ERROR(f'Error checking alert {alert.id}: {str(e)}'))
+                self.stdout.write(self.style.ERROR(f'{label}Error checking alert {alert.id}: {str(e)}'))
         
-        self.stdout.write(self.style.SUCCESS(
-            f'\nAlert check complete: {checked_count} checked, {triggered_count} triggered'
-        ))
-    
-    def get_current_price(self, symbol):
-        """Fetch current price directly from the Price model"""
+        ALERT_CHECK_DURATION.observe(time.perf_counter() - started)
+        ALERTS_CHECKED.inc(checked_count)
+        ALERTS_TRIGGERED.inc(triggered_count)
+        return {'checked': checked_count, 'triggered': triggered_count}
+
+    def claim_alert(self, alert, claimed_at):
+        """
+        Atomically claim an alert for sending.
+
+        The conditional update only succeeds if nobody has sent it within the
+        cooldown, so overlapping shards or colliding runs never send twice.
+        """
+        claimed = PriceAlert.objects.filter(pk=alert.pk, active=True).filter(
+            Q(last_sent_at__isnull=True) | Q(last_sent_at__lt=claimed_at - SEND_COOLDOWN)
+        ).update(last_sent_at=claimed_at)
+        return claimed == 1
+
+    def release_alert(self, alert, claimed_at):
+        """Undo our claim after a failed send so the next run can retry"""
+        PriceAlert.objects.filter(pk=alert.pk, last_sent_at=claimed_at).update(last_sent_at=alert.last_sent_at)
+
+    def get_indicators(self, symbol, lookback):
+        """Load the recent candles for a symbol, shared by all of its alerts"""
         try:
-            # simple usage of filter/order_by to get latest price
-            # assuming ts_readable is reliable sort or use 'ts' (timestamp)
-            latest_price = Price.objects.filter(symbol=symbol).order_by('-ts_readable').first()
-            
-            if latest_price:
-                # Prioritize 'close', then 'adj_close'
-                price = latest_price.close if latest_price.close is not None else latest_price.adj_close
-                return price
-            
-            return None
-            
+            return CandleIndicators.for_symbol(symbol, lookback)
         except Exception as e:
-            logger.error(f'Error fetching price for {symbol}: {str(e)}')
+            logger.error(f'Error fetching prices for {symbol}: {str(e)}')
             return None
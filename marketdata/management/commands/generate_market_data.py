@@ -0,0 +1,94 @@
+from datetime import date
+from pathlib import Path
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from helpers.synthetic_data import (
+    START_DATE, SYNTHETIC_PASSWORD, check_target_database, generate_alerts, generate_prices, generate_users,
+    generate_watchlist, symbol_names,
+)
+import time
+
+
+class Command(BaseCommand):
+    help = ('Generate synthetic OHLCV rows in the prices table (seeded random walk) plus users, '
+            'alerts and watchlist items, for load and scale testing, into the SQLite file given by --database '
+            '(created and migrated if needed).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', required=True,
+                            help='SQLite file to write to; the application database itself needs --force')
+        parser.add_argument('--force', action='store_true',
+                            help='Allow --database to be the application database (DB_NAME)')
+        parser.add_argument('--symbols', type=int, default=100, help='Number of symbols')
+        parser.add_argument('--days', type=int, default=1000, help='Daily candles per symbol')
+        parser.add_argument('--start-date', type=date.fromisoformat, default=START_DATE,
+                            help='Date of the first candle (YYYY-MM-DD)')
+        parser.add_argument('--prefix', default='SYM', help='Symbol name prefix (symbols are PREFIX0000, ...)')
+        parser.add_argument('--volatility', type=float, default=0.04, help='Daily return standard deviation')
+        parser.add_argument('--users', type=int, default=0, help='Users to create')
+        parser.add_argument('--alerts', type=int, default=0, help='Price alerts to create')
+        parser.add_argument('--watchlist', type=int, default=0, help='Watchlist items to create')
+        parser.add_argument('--skew', type=float, default=1.0,
+                            help='Zipf exponent for how alerts/watchlist items concentrate on users and symbols '
+                                 '(0 = uniform)')
+        parser.add_argument('--user-prefix', default='synthetic', help='Username prefix for generated users')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed (same seed, same data)')
+
+    def handle(self, *args, **options):
+        if options['symbols'] < 1 or options['days'] < 1:
+            raise CommandError('--symbols and --days must be at least 1')
+        if (options['alerts'] or options['watchlist']) and not options['users']:
+            raise CommandError('--alerts and --watchlist need --users')
+
+        original_db = settings.DATABASES['default']['NAME']
+        self.use_database(Path(options['database']).resolve())
+        try:
+            try:
+                check_target_database(options['force'])
+            except RuntimeError as e:
+                raise CommandError(f'{e}; pass --force to do this anyway')
+            call_command('migrate', verbosity=0)
+            self.generate(options)
+        finally:
+            self.use_database(original_db)
+
+    def use_database(self, path):
+        """Point the default connection at another SQLite file"""
+        connections['default'].close()
+        connections['default'].settings_dict['NAME'] = str(path)
+
+    def generate(self, options):
+        started = time.perf_counter()
+        rows = generate_prices(
+            symbols=options['symbols'], days=options['days'], seed=options['seed'],
+            volatility=options['volatility'], prefix=options['prefix'], start=options['start_date'],
+            force=options['force'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {rows:,} price rows ({options["symbols"]} symbols x {options["days"]} days) '
+            f'in {time.perf_counter() - started:.1f}s'
+        ))
+
+        if not options['users']:
+            return
+
+        started = time.perf_counter()
+        user_ids = generate_users(options['users'], prefix=options['user_prefix'])
+        self.stdout.write(
+            f'{len(user_ids):,} users with prefix "{options["user_prefix"]}" (password "{SYNTHETIC_PASSWORD}") '
+            f'in {time.perf_counter() - started:.1f}s'
+        )
+
+        symbols = symbol_names(options['symbols'], prefix=options['prefix'])
+        if options['alerts']:
+            started = time.perf_counter()
+            count = generate_alerts(user_ids, symbols, options['alerts'], skew=options['skew'], seed=options['seed'])
+            self.stdout.write(f'{count:,} alerts in {time.perf_counter() - started:.1f}s')
+
+        if options['watchlist']:
+            started = time.perf_counter()
+            count = generate_watchlist(user_ids, symbols, options['watchlist'], skew=options['skew'],
+                                       seed=options['seed'])
+            self.stdout.write(f'{count:,} watchlist items in {time.perf_counter() - started:.1f}s')
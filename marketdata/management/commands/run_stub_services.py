@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand, CommandError
+from helpers.stub_services import SERVICES, FaultProfile, start_services
+import time
+
+
+def per_service(values, services, cast):
+    """['lognormal:200:0.5', 'lstm=fixed:2000'] -> {service: value}; a bare value applies to every service"""
+    result = {}
+    for value in values or []:
+        name, sep, setting = value.partition('=')
+        if not sep:
+            result.update({service: cast(value) for service in services})
+        elif name not in services:
+            raise CommandError(f'"{name}" is not one of the running services ({", ".join(services)})')
+        else:
+            result[name] = cast(setting)
+    return result
+
+
+class Command(BaseCommand):
+    help = ('Run local stand-ins for the technical-analysis, LSTM, sentiment and notification microservices '
+            'on their *_SERVICE_URL ports, with injected latency, errors and hangs')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--services', default=','.join(SERVICES),
+                            help='Comma-separated services to run')
+        parser.add_argument('--host', default='127.0.0.1', help='Interface to listen on')
+        parser.add_argument('--latency', action='append',
+                            help='[service=]DIST:PARAMS, e.g. lognormal:200:0.5, uniform:50:500, fixed:2000, '
+                                 'normal:100:20, exponential:150 (milliseconds; repeatable)')
+        parser.add_argument('--error-rate', action='append', help='[service=]FRACTION answered with an error')
+        parser.add_argument('--error-status', action='append', help='[service=]STATUS used for errors (default 500)')
+        parser.add_argument('--hang-rate', action='append', help='[service=]FRACTION that never get a reply')
+        parser.add_argument('--hang-seconds', action='append',
+                            help='[service=]SECONDS a hung connection is held before being dropped (default 3600)')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed (same seed and order, same faults)')
+
+    def handle(self, *args, **options):
+        services = [name.strip() for name in options['services'].split(',') if name.strip()]
+        unknown = [name for name in services if name not in SERVICES]
+        if unknown:
+            raise CommandError(f'Unknown services: {", ".join(unknown)} (choose from {", ".join(SERVICES)})')
+
+        settings = {
+            'latency': per_service(options['latency'], services, str),
+            'error_rate': per_service(options['error_rate'], services, float),
+            'error_status': per_service(options['error_status'], services, int),
+            'hang_rate': per_service(options['hang_rate'], services, float),
+            'hang_seconds': per_service(options['hang_seconds'], services, float),
+        }
+        try:
+            profiles = {
+                name: FaultProfile(**{key: values[name] for key, values in settings.items() if name in values})
+                for name in services
+            }
+            servers = start_services(profiles, seed=options['seed'], host=options['host'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        except OSError as e:
+            raise CommandError(f'Could not listen: {e}')
+
+        for server in servers:
+            name = server.service_name
+            profile = profiles[name]
+            self.stdout.write(
+                f'{name:<18} http://{options["host"]}:{server.server_address[1]}  latency {profile.latency}  '
+                f'errors {profile.error_rate:.0%} ({profile.error_status})  hangs {profile.hang_rate:.0%}'
+            )
+        self.stdout.write(self.style.SUCCESS('Stand-ins running; PUT /__faults__ on a service to change its '
+                                             'profile. Ctrl-C to stop.'))
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for server in servers:
+                server.shutdown()
+                server.server_close()
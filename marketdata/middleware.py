@@ -1,33 +1,298 @@
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
 from django.utils import timezone
-from datetime import timedelta
+from datetime import datetime, timedelta
+from helpers import deadlines, profiling, tracing
+from helpers.memory_profiling import memory_profiler, memory_sampler
+from helpers.metrics import DB_QUERIES, DB_QUERY_SECONDS, HTTP_ERRORS, HTTP_REQUEST_DURATION
+from helpers.request_timing import RequestTimings, activate, deactivate
+import json
+import logging
+import os
+import random
+import time
+
+timing_logger = logging.getLogger('request_timing')
 
 
 class SessionTimeoutMiddleware:
+    """
+    Expire idle sessions based on the session's own last_activity timestamp.
+
+    last_activity is only rewritten once it is older than
+    SESSION_ACTIVITY_GRANULARITY_SECONDS, so a burst of read-only requests
+    doesn't mark the session modified and doesn't cause a session write.
+    """
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.granularity = timedelta(seconds=getattr(settings, 'SESSION_ACTIVITY_GRANULARITY_SECONDS', 0))
 
     def __call__(self, request):
         if request.user.is_authenticated:
             last_activity = request.session.get('last_activity')
-            
+            current_time = timezone.now()
+
             if last_activity:
                 try:
-                    from datetime import datetime
                     last_activity_time = datetime.fromisoformat(last_activity)
                     if timezone.is_naive(last_activity_time):
                         last_activity_time = timezone.make_aware(last_activity_time)
-                    
-                    current_time = timezone.now()
+
                     timeout_duration = timedelta(seconds=request.session.get_expiry_age())
-                    
-                    if current_time - last_activity_time > timeout_duration:
+                    expires_at = last_activity_time + timeout_duration
+
+                    if current_time > expires_at:
                         request.session.flush()
-                    else:
+                    elif current_time - last_activity_time > self.granularity:
                         request.session['last_activity'] = current_time.isoformat()
                 except (ValueError, TypeError):
-                    request.session['last_activity'] = timezone.now().isoformat()
+                    request.session['last_activity'] = current_time.isoformat()
             else:
-                request.session['last_activity'] = timezone.now().isoformat()
+                request.session['last_activity'] = current_time.isoformat()
 
         response = self.get_response(request)
         return response
+
+
+class RequestTimingMiddleware:
+    """
+    Break down where a request's time goes and report it.
+
+    For a sampled fraction of requests (SERVER_TIMING_SAMPLE_RATE) this counts and
+    times every DB query, collects the "upstream" and "serialize" spans recorded via
+    helpers.request_timing, and emits the totals as a Server-Timing header plus one
+    JSON log line on the "request_timing" logger.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'SERVER_TIMING_SAMPLE_RATE', 1.0)
+
+    def __call__(self, request):
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        timings = RequestTimings()
+        token = activate(timings)
+        try:
+            with connection.execute_wrapper(timings.db_wrapper):
+                response = self.get_response(request)
+        finally:
+            deactivate(token)
+
+        response['Server-Timing'] = timings.server_timing()
+        timing_logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(timings.elapsed() * 1000, 2),
+            **{f'{name}_ms': round(seconds * 1000, 2) for name, seconds in timings.durations.items()},
+            **{f'{name}_count': count for name, count in timings.counts.items()},
+        }))
+        return response
+
+
+class MetricsMiddleware:
+    """Record per-view latency, status and DB query metrics for every request (see helpers.metrics)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = [0, 0.0]
+
+        def count_query(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries[0] += 1
+                queries[1] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        with connection.execute_wrapper(count_query):
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unmatched'
+        HTTP_REQUEST_DURATION.labels(view, request.method, response.status_code).observe(elapsed)
+        if response.status_code >= 400:
+            HTTP_ERRORS.labels(view, response.status_code).inc()
+        if queries[0]:
+            DB_QUERIES.labels(view).inc(queries[0])
+            DB_QUERY_SECONDS.labels(view).inc(queries[1])
+        return response
+
+
+class DeadlineMiddleware:
+    """
+    Give each request a time budget (see helpers.deadlines).
+
+    The clock starts when the request reaches this middleware; once the URL is
+    resolved the budget becomes its route class's (REQUEST_DEADLINE_ROUTES), or
+    the client's X-Request-Deadline-Ms if that is shorter. Queries are refused
+    once the budget is spent, but only inside this middleware, so the session
+    and other bookkeeping on the way out still get saved.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.budgets = getattr(settings, 'REQUEST_DEADLINES', {})
+        self.routes = getattr(settings, 'REQUEST_DEADLINE_ROUTES', {})
+
+    def __call__(self, request):
+        # Budget and route are only known in process_view; start the clock now
+        request._deadline_started = time.monotonic()
+        token = deadlines.activate(None)
+        try:
+            with connection.execute_wrapper(deadlines.db_wrapper):
+                return self.get_response(request)
+        finally:
+            deadlines.deactivate(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        route_class = self.routes.get(request.resolver_match.url_name, 'default')
+        budget = self.budgets.get(route_class) or None
+        client_budget = deadlines.parse_header(request.headers.get(deadlines.DEADLINE_HEADER))
+        if client_budget is not None:
+            budget = min(budget, client_budget) if budget else client_budget
+        if budget:
+            deadlines.activate(deadlines.Deadline(budget, started=request._deadline_started))
+        return None
+
+
+class ProfilingMiddleware:
+    """
+    Profile staff requests on demand and sample all requests continuously (see helpers.profiling).
+
+    Sits after AuthenticationMiddleware so it can check is_staff; the profile covers
+    everything from here inwards (the view, DRF, serialization and the queries they run).
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.continuous = getattr(settings, 'PROFILING_CONTINUOUS', False)
+
+    def requested_mode(self, request):
+        value = request.GET.get('_profile') or request.headers.get('X-Profile')
+        if not value:
+            return None
+        value = value.lower()
+        if value not in profiling.MODES:
+            # ?_profile=1 and the like
+            value = 'cprofile'
+        return value if request.user.is_staff else None
+
+    def __call__(self, request):
+        mode = self.requested_mode(request)
+        if self.continuous:
+            profiling.continuous_sampler.begin(request)
+        try:
+            if mode is None:
+                return self.get_response(request)
+
+            # Read before the view runs: DRF views without authentication replace request.user
+            username = request.user.username
+            started = time.perf_counter()
+            response, data = profiling.profile_call(
+                mode, self.get_response, request, interval_ms=settings.PROFILING_SAMPLE_INTERVAL_MS
+            )
+            match = getattr(request, 'resolver_match', None)
+            profile_id = profiling.save_profile(mode, data, {
+                'method': request.method,
+                'path': request.get_full_path(),
+                'view': match.view_name if match else None,
+                'status': response.status_code,
+                'duration_ms': round((time.perf_counter() - started) * 1000, 2),
+                'user': username,
+                'created_at': timezone.now().isoformat(),
+            })
+            response['X-Profile-Id'] = profile_id
+            return response
+        finally:
+            if self.continuous:
+                profiling.continuous_sampler.end()
+
+
+class MemoryProfilingMiddleware:
+    """
+    Start tracemalloc (MEMORY_TRACING_ENABLED) and the background memory sampler
+    (MEMORY_SAMPLER_INTERVAL_SECONDS) in each worker process on its first request.
+    Removes itself when neither is configured.
+    """
+
+    def __init__(self, get_response):
+        self.tracing = getattr(settings, 'MEMORY_TRACING_ENABLED', False)
+        self.sampling = getattr(settings, 'MEMORY_SAMPLER_INTERVAL_SECONDS', 0) > 0
+        if not (self.tracing or self.sampling):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.started_pid = None
+
+    def __call__(self, request):
+        if self.started_pid != os.getpid():
+            if self.tracing:
+                memory_profiler.start()
+            if self.sampling:
+                memory_sampler.ensure_started()
+            self.started_pid = os.getpid()
+        return self.get_response(request)
+
+
+class TracingMiddleware:
+    """
+    Root span of a traced request (see helpers.tracing). First in MIDDLEWARE so
+    the span covers the other middleware too; sampling follows TRACE_SAMPLE_RATE
+    (or a trusted incoming traceparent header). Traced responses carry X-Trace-Id.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'TRACING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'TRACE_SAMPLE_RATE', 0.0)
+        self.trust_parent = getattr(settings, 'TRACE_TRUST_PARENT_SAMPLING', False)
+
+    def __call__(self, request):
+        traceparent = request.headers.get(tracing.TRACEPARENT_HEADER)
+        with tracing.start_trace(request.method, traceparent, self.sample_rate, self.trust_parent) as root:
+            if root is None:
+                return self.get_response(request)
+
+            root.set(**{'http.method': request.method, 'http.target': request.get_full_path(), 'pid': os.getpid()})
+            response = self.get_response(request)
+            match = getattr(request, 'resolver_match', None)
+            root.name = f'{request.method} {match.view_name if match else request.path}'
+            root.set(**{'http.status_code': response.status_code})
+            if response.status_code >= 500:
+                root.status = 'error'
+            response['X-Trace-Id'] = root.trace.trace_id
+            return response
+
+
+class TracingViewMiddleware:
+    """
+    Span around the view itself, separating it from middleware and rendering.
+    Must be last in MIDDLEWARE: it calls the view from process_view, so any
+    process_view hook after it would be skipped.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'TRACING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if tracing.current_span() is None:
+            return None
+        match = request.resolver_match
+        with tracing.start_span(f'view {match.view_name if match else view_func.__name__}'):
+            return view_func(request, *view_args, **view_kwargs)
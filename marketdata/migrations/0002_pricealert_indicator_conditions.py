@@ -0,0 +1,23 @@
+# Generated by Django 5.0.4 on 2026-10-19 03:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketdata', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pricealert',
+            name='period',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='pricealert',
+            name='condition',
+            field=models.CharField(choices=[('above', 'Above'), ('below', 'Below'), ('pct_above', 'Up by % over N candles'), ('pct_below', 'Down by % over N candles'), ('ma_cross_above', 'Crosses above N-candle MA'), ('ma_cross_below', 'Crosses below N-candle MA'), ('rsi_above', 'RSI(N) above'), ('rsi_below', 'RSI(N) below')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.4 on 2026-10-19 03:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketdata', '0002_pricealert_indicator_conditions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='watchlistitem',
+            index=models.Index(fields=['symbol', 'user'], name='watchlist_symbol_user_idx'),
+        ),
+    ]
@@ -25,11 +25,31 @@ class Price(models.Model):
 
 
 class PriceAlert(models.Model):
+    # Static price thresholds
+    PRICE_CONDITIONS = ('above', 'below')
+    # Indicator conditions: `price` holds the threshold (percent or RSI level)
+    # and `period` the number of candles the indicator is computed over
+    INDICATOR_CONDITIONS = ('pct_above', 'pct_below', 'ma_cross_above', 'ma_cross_below', 'rsi_above', 'rsi_below')
+    # Longest indicator period accepted; RSI loads a multiple of it per symbol
+    MAX_PERIOD = 365
+
+    CONDITION_CHOICES = [
+        ('above', 'Above'),
+        ('below', 'Below'),
+        ('pct_above', 'Up by % over N candles'),
+        ('pct_below', 'Down by % over N candles'),
+        ('ma_cross_above', 'Crosses above N-candle MA'),
+        ('ma_cross_below', 'Crosses below N-candle MA'),
+        ('rsi_above', 'RSI(N) above'),
+        ('rsi_below', 'RSI(N) below'),
+    ]
+
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='price_alerts')
     crypto = models.CharField(max_length=100)
     symbol = models.CharField(max_length=20)
-    condition = models.CharField(max_length=10, choices=[('above', 'Above'), ('below', 'Below')])
+    condition = models.CharField(max_length=20, choices=CONDITION_CHOICES)
     price = models.DecimalField(max_digits=20, decimal_places=2)
+    period = models.PositiveIntegerField(null=True, blank=True)
     active = models.BooleanField(default=True)
     is_triggered = models.BooleanField(default=False)
     last_triggered_at = models.DateTimeField(null=True, blank=True)
@@ -63,6 +83,10 @@ class WatchlistItem(models.Model):
 
     class Meta:
         unique_together = ("user", "symbol")
+        indexes = [
+            # Reverse lookup "who watches X" without scanning the table
+            models.Index(fields=["symbol", "user"], name="watchlist_symbol_user_idx"),
+        ]
 
     def __str__(self):
         return f"{self.user.username} -> {self.symbol}"
@@ -16,9 +16,23 @@ class PriceSerializer(serializers.ModelSerializer):
 class PriceAlertSerializer(serializers.ModelSerializer):
     class Meta:
         model = PriceAlert
-        fields = ['id', 'crypto', 'symbol', 'condition', 'price', 'active', 'created_at', 'updated_at']
+        fields = ['id', 'crypto', 'symbol', 'condition', 'price', 'period', 'active', 'created_at', 'updated_at']
         read_only_fields = ['id', 'created_at', 'updated_at']
 
+    def validate(self, attrs):
+        condition = attrs.get('condition', getattr(self.instance, 'condition', None))
+        period = attrs.get('period', getattr(self.instance, 'period', None))
+
+        if condition in PriceAlert.INDICATOR_CONDITIONS and not period:
+            raise serializers.ValidationError({'period': f"Period is required for '{condition}' alerts."})
+        if period is not None and period > PriceAlert.MAX_PERIOD:
+            raise serializers.ValidationError({'period': f'Period must be at most {PriceAlert.MAX_PERIOD}.'})
+        if condition in ('rsi_above', 'rsi_below'):
+            level = attrs.get('price', getattr(self.instance, 'price', None))
+            if level is not None and not 0 <= level <= 100:
+                raise serializers.ValidationError({'price': 'RSI level must be between 0 and 100.'})
+        return attrs
+
 
 class SupportedCoinSerializer(serializers.ModelSerializer):
     class Meta:
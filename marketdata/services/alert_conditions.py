@@ -0,0 +1,170 @@
+import logging
+from itertools import accumulate
+from typing import Dict, List, Optional, Tuple
+
+from marketdata.models import Price, PriceAlert
+
+logger = logging.getLogger(__name__)
+
+# Extra candles loaded for RSI so Wilder's smoothing has settled
+RSI_WARMUP_FACTOR = 3
+
+
+class CandleIndicators:
+    """
+    Indicator values for one symbol's recent closes.
+
+    Every alert on a symbol shares the same instance: the close series, prefix
+    sums and gain/loss arrays are built once, and each (indicator, period) is
+    memoized, so thousands of alerts on one symbol cost one computation each.
+    Closes are in chronological order (oldest first).
+    """
+
+    def __init__(self, closes: List[float]):
+        self.closes = closes
+        self._prefix: Optional[List[float]] = None
+        self._gains_losses: Optional[Tuple[List[float], List[float]]] = None
+        self._cache: Dict[Tuple[str, int], Optional[float]] = {}
+
+    @classmethod
+    def for_symbol(cls, symbol: str, lookback: int) -> "CandleIndicators":
+        """Load the latest `lookback` closes for a symbol in a single query"""
+        rows = Price.objects.filter(symbol=symbol).order_by('-ts_readable').values_list(
+            'close', 'adj_close'
+        )[:lookback]
+        closes = [close if close is not None else adj_close for close, adj_close in rows]
+        closes = [value for value in reversed(closes) if value is not None]
+        return cls(closes)
+
+    @property
+    def last(self) -> Optional[float]:
+        return self.closes[-1] if self.closes else None
+
+    def _memo(self, key: Tuple[str, int], compute) -> Optional[float]:
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def _prefix_sums(self) -> List[float]:
+        if self._prefix is None:
+            self._prefix = [0.0] + list(accumulate(self.closes))
+        return self._prefix
+
+    def sma(self, period: int, offset: int = 0) -> Optional[float]:
+        """Simple moving average ending `offset` candles before the latest"""
+
+        def compute():
+            end = len(self.closes) - offset
+            if period < 1 or end - period < 0:
+                return None
+            prefix = self._prefix_sums()
+            return (prefix[end] - prefix[end - period]) / period
+
+        return self._memo((f'sma{offset}', period), compute)
+
+    def pct_change(self, period: int) -> Optional[float]:
+        """Percent change of the close over the last `period` candles"""
+
+        def compute():
+            if period < 1 or len(self.closes) <= period:
+                return None
+            base = self.closes[-1 - period]
+            if not base:
+                return None
+            return (self.closes[-1] - base) / base * 100
+
+        return self._memo(('pct', period), compute)
+
+    def rsi(self, period: int) -> Optional[float]:
+        """
+        Wilder's RSI over `period` candles.
+
+        Smoothing starts `period * RSI_WARMUP_FACTOR` candles back whatever
+        the number of closes loaded for the symbol, so an alert's value only
+        depends on its own period and not on the other alerts sharing it.
+        """
+
+        def compute():
+            if period < 1 or len(self.closes) <= period:
+                return None
+            if self._gains_losses is None:
+                deltas = [b - a for a, b in zip(self.closes, self.closes[1:])]
+                self._gains_losses = (
+                    [max(d, 0.0) for d in deltas],
+                    [max(-d, 0.0) for d in deltas],
+                )
+            window = period * RSI_WARMUP_FACTOR
+            gains, losses = (values[-window:] for values in self._gains_losses)
+            avg_gain = sum(gains[:period]) / period
+            avg_loss = sum(losses[:period]) / period
+            for gain, loss in zip(gains[period:], losses[period:]):
+                avg_gain = (avg_gain * (period - 1) + gain) / period
+                avg_loss = (avg_loss * (period - 1) + loss) / period
+            if avg_loss == 0:
+                return 100.0
+            return 100 - 100 / (1 + avg_gain / avg_loss)
+
+        return self._memo(('rsi', period), compute)
+
+
+def required_lookback(alert: PriceAlert) -> int:
+    """Number of candles an alert needs to be evaluated"""
+    period = alert.period or 1
+    if alert.condition in ('ma_cross_above', 'ma_cross_below'):
+        return period + 1
+    if alert.condition in ('rsi_above', 'rsi_below'):
+        return period * RSI_WARMUP_FACTOR + 1
+    if alert.condition in ('pct_above', 'pct_below'):
+        return period + 1
+    return 1
+
+
+def evaluate_alert(alert: PriceAlert, indicators: CandleIndicators) -> Tuple[bool, Optional[float]]:
+    """
+    Evaluate an alert against a symbol's indicators.
+
+    Returns (condition_met, observed_value). The observed value is the price
+    for price alerts and the indicator value (percent change, MA or RSI) for
+    indicator alerts; it is None when there is not enough data.
+    """
+    condition = alert.condition
+    threshold = float(alert.price)
+    period = alert.period or 1
+    current = indicators.last
+
+    if current is None:
+        return False, None
+
+    if condition == 'above':
+        return current >= threshold, current
+    if condition == 'below':
+        return current <= threshold, current
+
+    if condition in ('pct_above', 'pct_below'):
+        change = indicators.pct_change(period)
+        if change is None:
+            return False, None
+        if condition == 'pct_above':
+            return change >= threshold, change
+        return change <= -abs(threshold), change
+
+    if condition in ('ma_cross_above', 'ma_cross_below'):
+        ma_now = indicators.sma(period)
+        ma_prev = indicators.sma(period, offset=1)
+        if ma_now is None or ma_prev is None or len(indicators.closes) < 2:
+            return False, None
+        previous = indicators.closes[-2]
+        if condition == 'ma_cross_above':
+            return previous <= ma_prev and current > ma_now, ma_now
+        return previous >= ma_prev and current < ma_now, ma_now
+
+    if condition in ('rsi_above', 'rsi_below'):
+        rsi = indicators.rsi(period)
+        if rsi is None:
+            return False, None
+        if condition == 'rsi_above':
+            return rsi >= threshold, rsi
+        return rsi <= threshold, rsi
+
+    logger.warning(f"Unknown alert condition '{condition}' for alert {alert.id}")
+    return False, None
@@ -1,9 +1,15 @@
 import logging
 from typing import List, Dict, Any, Optional
 
+from django.db import transaction
 from django.db.models import Max, Min, Sum, OuterRef, Subquery
+from django.db.models.query import RawQuerySet
+
+from django.utils import timezone
 
 from helpers.abstract import AbstractService
+from helpers.constants import MAX_BULK_ITEMS
+from helpers.request_timing import span
 from marketdata.exceptions.market_data_exceptions import (
     SymbolNotFoundError, PriceDataNotFoundError, AlertNotFoundError,
     AlertValidationError, MarketDataProcessingError
@@ -14,6 +20,9 @@ from marketdata.serializers import SupportedCoinSerializer
 
 logger = logging.getLogger(__name__)
 
+# SQLite allows at most 500 terms in a compound SELECT
+DASHBOARD_SYMBOLS_PER_QUERY = 100
+
 
 class MarketDataService(AbstractService):
     """Service class for handling market data business logic"""
@@ -49,11 +58,11 @@ class MarketDataService(AbstractService):
         try:
             if base:
                 logger.debug(f"Fetching ticker data for specific symbol: {base}")
-                latest_prices = Price.objects.filter(
+                latest_prices = list(Price.objects.filter(
                     symbol=base.upper()
-                ).order_by('-ts_readable')[:1]
+                ).order_by('-ts_readable')[:1])
 
-                if not latest_prices.exists():
+                if not latest_prices:
                     logger.warning(f"Symbol {base.upper()} not found in database")
                     raise SymbolNotFoundError(f"Symbol {base.upper()} not found")
             else:
@@ -120,15 +129,60 @@ class MarketDataService(AbstractService):
             logger.warning(f"Failed to process ticker for symbol {getattr(price, 'symbol', 'unknown')}: {str(e)}")
             return None
 
+    def get_watchlist_dashboard(self, symbols: List[str], points: int = 30) -> Dict[str, Any]:
+        """Get latest ticker and a close-price sparkline for each symbol (one query per 100 symbols)"""
+        try:
+            logger.debug(f"Fetching dashboard for {len(symbols)} symbols with {points} points")
+
+            tickers: Dict[str, Optional[Dict[str, Any]]] = {}
+            sparklines: Dict[str, List[float]] = {symbol: [] for symbol in symbols}
+            for start in range(0, len(symbols), DASHBOARD_SYMBOLS_PER_QUERY):
+                for price in self._latest_prices(symbols[start:start + DASHBOARD_SYMBOLS_PER_QUERY], points):
+                    if price.symbol not in tickers:
+                        tickers[price.symbol] = self._process_price_to_ticker(price)
+                    close = price.close if price.close is not None else price.adj_close
+                    if close is not None:
+                        sparklines[price.symbol].append(close)
+
+            results = [
+                {
+                    "symbol": symbol,
+                    "ticker": tickers.get(symbol),
+                    "sparkline": list(reversed(sparklines[symbol])),
+                }
+                for symbol in symbols
+            ]
+
+            logger.info(f"Generated watchlist dashboard for {len(results)} symbols")
+            return {"count": len(results), "results": results}
+        except Exception as e:
+            logger.error(f"Failed to build watchlist dashboard: {str(e)}")
+            raise MarketDataProcessingError(f"Failed to build watchlist dashboard: {str(e)}")
+
+    def _latest_prices(self, symbols: List[str], points: int) -> RawQuerySet:
+        """
+        The last `points` rows of each symbol, newest first, as one UNION ALL of
+        per-symbol LIMIT queries. Each one reads just its rows off the end of the
+        (symbol, ts_readable) index, whatever the length of the symbol's history.
+        Django won't put LIMIT in the parts of a compound query on SQLite, so the
+        parts are compiled separately and combined here.
+        """
+        parts, params = [], []
+        for symbol in symbols:
+            sql, part_params = Price.objects.filter(symbol=symbol).order_by('-ts_readable')[:points].query.sql_with_params()
+            parts.append(f"SELECT * FROM ({sql})")
+            params.extend(part_params)
+        return Price.objects.raw(" UNION ALL ".join(parts) + ' ORDER BY "symbol", "ts_readable" DESC', params)
+
     def get_candle_series(self, symbol: str, limit: int = 90) -> Dict[str, Any]:
         """Get candlestick data for a symbol"""
         try:
             symbol = symbol.upper()
             logger.debug(f"Fetching candle data for {symbol} with limit {limit}")
 
-            prices = Price.objects.filter(symbol=symbol).order_by('-ts_readable')[:limit]
+            prices = list(Price.objects.filter(symbol=symbol).order_by('-ts_readable')[:limit])
 
-            if not prices.exists():
+            if not prices:
                 logger.warning(f"No candle data found for symbol {symbol}")
                 raise SymbolNotFoundError(f"No data found for symbol {symbol}")
 
@@ -223,10 +277,11 @@ class MarketDataService(AbstractService):
         """Get all price alerts for a user"""
         try:
             logger.debug(f"Fetching alerts for user {user.username}")
-            alerts = PriceAlert.objects.filter(user=user)
-            serializer = PriceAlertSerializer(alerts, many=True)
-            logger.info(f"Retrieved {alerts.count()} alerts for user {user.username}")
-            return serializer.data
+            alerts = list(PriceAlert.objects.filter(user=user))
+            with span("serialize"):
+                data = PriceAlertSerializer(alerts, many=True).data
+            logger.info(f"Retrieved {len(alerts)} alerts for user {user.username}")
+            return data
         except Exception as e:
             logger.error(f"Failed to fetch alerts for user {user.username}: {str(e)}")
             raise MarketDataProcessingError(f"Failed to fetch alerts: {str(e)}")
@@ -297,6 +352,126 @@ class MarketDataService(AbstractService):
             logger.error(f"Failed to delete alert {alert_id} for user {user.username}: {str(e)}")
             raise MarketDataProcessingError(f"Failed to delete alert: {str(e)}")
 
+    def _validate_bulk_payload(self, items: Any) -> List[Any]:
+        """Ensure a bulk payload is a list within the size limit"""
+        if not isinstance(items, list):
+            raise AlertValidationError("Expected a list of items")
+        if len(items) > MAX_BULK_ITEMS:
+            raise AlertValidationError(f"At most {MAX_BULK_ITEMS} items can be sent in one request")
+        return items
+
+    def bulk_create_alerts(self, user, items: Any) -> List[Dict[str, Any]]:
+        """Create many price alerts in one transaction, with a result per item"""
+        items = self._validate_bulk_payload(items)
+        try:
+            logger.debug(f"Bulk creating {len(items)} alerts for user {user.username}")
+            results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+            pending: List[PriceAlert] = []
+            pending_indexes: List[int] = []
+
+            for index, item in enumerate(items):
+                serializer = PriceAlertSerializer(data=item)
+                if serializer.is_valid():
+                    pending.append(PriceAlert(user=user, **serializer.validated_data))
+                    pending_indexes.append(index)
+                else:
+                    results[index] = {"index": index, "ok": False, "errors": serializer.errors}
+
+            # No unique constraint on alerts, so ignore_conflicts would only cost us the returned ids
+            with transaction.atomic():
+                created = PriceAlert.objects.bulk_create(pending, batch_size=500)
+
+            for index, alert in zip(pending_indexes, created):
+                results[index] = {"index": index, "ok": True, "alert": PriceAlertSerializer(alert).data}
+
+            logger.info(f"Bulk created {len(created)} of {len(items)} alerts for user {user.username}")
+            return results
+        except Exception as e:
+            logger.error(f"Failed to bulk create alerts for user {user.username}: {str(e)}")
+            raise MarketDataProcessingError(f"Failed to create alerts: {str(e)}")
+
+    def bulk_update_alerts(self, user, items: Any) -> List[Dict[str, Any]]:
+        """Update many price alerts in one transaction, with a result per item"""
+        items = self._validate_bulk_payload(items)
+        try:
+            logger.debug(f"Bulk updating {len(items)} alerts for user {user.username}")
+            alert_ids = [self._parse_alert_id(item.get("id")) for item in items if isinstance(item, dict)]
+            alerts = PriceAlert.objects.filter(user=user, pk__in=[i for i in alert_ids if i is not None])
+            alerts_by_id = {alert.pk: alert for alert in alerts}
+
+            results: List[Dict[str, Any]] = []
+            changed: Dict[int, PriceAlert] = {}
+            fields = set()
+
+            for index, item in enumerate(items):
+                alert_id = self._parse_alert_id(item.get("id")) if isinstance(item, dict) else None
+                alert = alerts_by_id.get(alert_id)
+                if alert is None:
+                    results.append({"index": index, "ok": False, "errors": f"Alert with ID {alert_id} not found"})
+                    continue
+
+                serializer = PriceAlertSerializer(alert, data=item, partial=True)
+                if not serializer.is_valid():
+                    results.append({"index": index, "ok": False, "errors": serializer.errors})
+                    continue
+
+                for field, value in serializer.validated_data.items():
+                    setattr(alert, field, value)
+                    fields.add(field)
+                changed[alert.pk] = alert
+                results.append({"index": index, "ok": True, "id": alert.pk})
+
+            if changed:
+                now = timezone.now()
+                for alert in changed.values():
+                    alert.updated_at = now
+                with transaction.atomic():
+                    PriceAlert.objects.bulk_update(list(changed.values()), sorted(fields | {"updated_at"}), batch_size=500)
+
+            for result in results:
+                if result["ok"]:
+                    result["alert"] = PriceAlertSerializer(changed[result.pop("id")]).data
+
+            logger.info(f"Bulk updated {len(changed)} alerts for user {user.username}")
+            return results
+        except AlertValidationError:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to bulk update alerts for user {user.username}: {str(e)}")
+            raise MarketDataProcessingError(f"Failed to update alerts: {str(e)}")
+
+    def bulk_delete_alerts(self, user, alert_ids: Any) -> List[Dict[str, Any]]:
+        """Delete many price alerts in one transaction, with a result per item"""
+        alert_ids = self._validate_bulk_payload(alert_ids)
+        try:
+            logger.debug(f"Bulk deleting {len(alert_ids)} alerts for user {user.username}")
+            parsed = [self._parse_alert_id(alert_id) for alert_id in alert_ids]
+
+            with transaction.atomic():
+                alerts = PriceAlert.objects.filter(user=user, pk__in=[i for i in parsed if i is not None])
+                existing = set(alerts.values_list("pk", flat=True))
+                alerts.delete()
+
+            results = []
+            for index, alert_id in enumerate(parsed):
+                if alert_id in existing:
+                    results.append({"index": index, "ok": True, "id": alert_id})
+                    existing.discard(alert_id)
+                else:
+                    results.append({"index": index, "ok": False, "errors": f"Alert with ID {alert_id} not found"})
+
+            logger.info(f"Bulk deleted alerts for user {user.username}")
+            return results
+        except Exception as e:
+            logger.error(f"Failed to bulk delete alerts for user {user.username}: {str(e)}")
+            raise MarketDataProcessingError(f"Failed to delete alerts: {str(e)}")
+
+    def _parse_alert_id(self, value: Any) -> Optional[int]:
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
     def _get_alert_or_raise(self, alert_id: int, user) -> PriceAlert:
         """Get alert by ID and user, raise exception if not found"""
         try:
@@ -1,10 +1,16 @@
 import logging
-from typing import List, Dict, Any
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, FrozenSet, Iterator, Optional, Tuple
 
 from django.contrib.auth.models import User
-from django.db import DatabaseError
+from django.db import DatabaseError, transaction
 
 from helpers.abstract import AbstractService
+from helpers.env_variables import WATCHERS_CACHE_TTL_SECONDS, WATCHERS_CACHE_MAX_SYMBOLS
+from helpers.event_bus import get_event_bus, Handler
+from helpers.metrics import CACHE_REQUESTS
 from marketdata.exceptions.watchlist_exceptions import (
     SymbolRequiredError, SubscriptionError, UnsubscriptionError,
     WatchlistOperationError
@@ -14,9 +20,75 @@ from marketdata.models import WatchlistItem
 logger = logging.getLogger(__name__)
 
 
+class WatchersCache:
+    """
+    In-memory symbol -> watcher user-id set, kept as a bounded LRU.
+
+    Entries expire after a TTL so changes made by other processes are picked
+    up; changes made through this process invalidate the entry immediately.
+
+    Every invalidation bumps a generation counter. A filler takes generation()
+    before it queries and passes it to set(), which drops the fill if anything
+    was invalidated in the meantime (its rows may predate the change).
+    """
+
+    def __init__(self, ttl_seconds: int = WATCHERS_CACHE_TTL_SECONDS, max_symbols: int = WATCHERS_CACHE_MAX_SYMBOLS):
+        self.ttl_seconds = ttl_seconds
+        self.max_symbols = max_symbols
+        self._entries: "OrderedDict[str, Tuple[float, FrozenSet[int]]]" = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, symbol: str) -> Optional[FrozenSet[int]]:
+        with self._lock:
+            entry = self._entries.get(symbol)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl_seconds:
+                del self._entries[symbol]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(symbol)
+
+        CACHE_REQUESTS.labels('watchers', 'hit' if entry else 'miss').inc()
+        return entry[1] if entry else None
+
+    def generation(self) -> int:
+        return self._generation
+
+    def set(self, symbol: str, user_ids: FrozenSet[int], generation: int) -> None:
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[symbol] = (time.monotonic(), user_ids)
+            self._entries.move_to_end(symbol)
+            while len(self._entries) > self.max_symbols:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, symbol: str) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(symbol, None)
+
+
 class WatchlistService(AbstractService):
     """Simple watchlist service implementing observer pattern"""
 
+    EVENT_PREFIX = "watchlist."
+
+    def __init__(self):
+        self.event_bus = get_event_bus()
+        self.watchers_cache = WatchersCache()
+
+    def add_observer(self, action: str, handler: Handler) -> None:
+        """Register an observer for a watchlist action ('subscribed' or 'unsubscribed')"""
+        self.event_bus.subscribe(self.EVENT_PREFIX + action, handler)
+
+    def remove_observer(self, action: str, handler: Handler) -> None:
+        """Remove a previously registered observer"""
+        self.event_bus.unsubscribe(self.EVENT_PREFIX + action, handler)
+
     def subscribe(self, user: User, symbol: str) -> Dict[str, Any]:
         """Subscribe user to a symbol (add to watchlist)"""
         if not symbol or not symbol.strip():
@@ -28,6 +100,7 @@ class WatchlistService(AbstractService):
             item, created = WatchlistItem.objects.get_or_create(user=user, symbol=symbol)
 
             if created:
+                self.watchers_cache.invalidate(symbol)
                 self.notify(user, symbol, 'subscribed')
 
             return {"ok": True, "symbol": symbol, "created": created}
@@ -50,6 +123,7 @@ class WatchlistService(AbstractService):
             deleted_count, _ = WatchlistItem.objects.filter(user=user, symbol=symbol).delete()
 
             if deleted_count > 0:
+                self.watchers_cache.invalidate(symbol)
                 self.notify(user, symbol, 'unsubscribed')
 
             return {"ok": True, "symbol": symbol, "deleted": deleted_count}
@@ -61,6 +135,66 @@ class WatchlistService(AbstractService):
             logger.error(f"Unexpected error during unsubscription: {str(e)}")
             raise WatchlistOperationError(f"Unexpected error while unsubscribing from {symbol}")
 
+    def bulk_subscribe(self, user: User, symbols: List[str]) -> List[Dict[str, Any]]:
+        """Subscribe user to many symbols in one transaction, with a result per item"""
+        cleaned = [symbol.upper().strip() if isinstance(symbol, str) else "" for symbol in symbols]
+        wanted = {symbol for symbol in cleaned if symbol}
+
+        try:
+            with transaction.atomic():
+                existing = set(
+                    WatchlistItem.objects.filter(user=user, symbol__in=wanted).values_list("symbol", flat=True)
+                )
+                new_symbols = sorted(wanted - existing)
+                WatchlistItem.objects.bulk_create(
+                    [WatchlistItem(user=user, symbol=symbol) for symbol in new_symbols],
+                    ignore_conflicts=True,
+                )
+        except DatabaseError as e:
+            logger.error(f"Database error during bulk subscription: {str(e)}")
+            raise SubscriptionError("Failed to subscribe to symbols: database error")
+
+        for symbol in new_symbols:
+            self.watchers_cache.invalidate(symbol)
+            self.notify(user, symbol, 'subscribed')
+
+        results = []
+        created = set(new_symbols)
+        for index, symbol in enumerate(cleaned):
+            if not symbol:
+                results.append({"index": index, "ok": False, "error": "Symbol is required and cannot be empty"})
+            else:
+                results.append({"index": index, "ok": True, "symbol": symbol, "created": symbol in created})
+                created.discard(symbol)
+        return results
+
+    def bulk_unsubscribe(self, user: User, symbols: List[str]) -> List[Dict[str, Any]]:
+        """Unsubscribe user from many symbols in one transaction, with a result per item"""
+        cleaned = [symbol.upper().strip() if isinstance(symbol, str) else "" for symbol in symbols]
+        wanted = {symbol for symbol in cleaned if symbol}
+
+        try:
+            with transaction.atomic():
+                items = WatchlistItem.objects.filter(user=user, symbol__in=wanted)
+                removed = set(items.values_list("symbol", flat=True))
+                items.delete()
+        except DatabaseError as e:
+            logger.error(f"Database error during bulk unsubscription: {str(e)}")
+            raise UnsubscriptionError("Failed to unsubscribe from symbols: database error")
+
+        for symbol in removed:
+            self.watchers_cache.invalidate(symbol)
+            self.notify(user, symbol, 'unsubscribed')
+
+        results = []
+        for index, symbol in enumerate(cleaned):
+            if not symbol:
+                results.append({"index": index, "ok": False, "error": "Symbol is required and cannot be empty"})
+            else:
+                results.append({"index": index, "ok": True, "symbol": symbol, "deleted": int(symbol in removed)})
+                removed.discard(symbol)
+        return results
+
     def list_subscribed_symbols(self, user: User) -> List[str]:
         """Get list of symbols user is subscribed to"""
         try:
@@ -71,9 +205,63 @@ class WatchlistService(AbstractService):
             logger.error(f"Unexpected error while fetching watchlist: {str(e)}")
             raise WatchlistOperationError("Unexpected error while retrieving watchlist")
 
+    def get_watcher_ids(self, symbol: str) -> FrozenSet[int]:
+        """Get ids of all users watching a symbol (cached)"""
+        symbol = symbol.upper().strip()
+        user_ids = self.watchers_cache.get(symbol)
+        if user_ids is None:
+            generation = self.watchers_cache.generation()
+            user_ids = frozenset(user_id for batch in self._iter_watcher_batches_from_db(symbol) for user_id in batch)
+            self.watchers_cache.set(symbol, user_ids, generation)
+        return user_ids
+
+    def iter_watchers(self, symbol: str, batch_size: int = 1000) -> Iterator[List[int]]:
+        """
+        Yield user ids watching a symbol in batches of at most `batch_size`.
+
+        Served from the cache when warm. Otherwise the ids are streamed from the
+        (symbol, user) index with keyset pagination, and the cache is filled once
+        the iteration has completed, unless the watchers changed meanwhile.
+        """
+        symbol = symbol.upper().strip()
+        try:
+            cached = self.watchers_cache.get(symbol)
+            if cached is not None:
+                user_ids = sorted(cached)
+                for start in range(0, len(user_ids), batch_size):
+                    yield user_ids[start:start + batch_size]
+                return
+
+            generation = self.watchers_cache.generation()
+            seen: List[int] = []
+            for batch in self._iter_watcher_batches_from_db(symbol, batch_size):
+                seen.extend(batch)
+                yield batch
+            self.watchers_cache.set(symbol, frozenset(seen), generation)
+
+        except DatabaseError as e:
+            logger.error(f"Database error while fetching watchers of {symbol}: {str(e)}")
+            raise WatchlistOperationError(f"Failed to retrieve watchers of {symbol}")
+
+    def _iter_watcher_batches_from_db(self, symbol: str, batch_size: int = 1000) -> Iterator[List[int]]:
+        last_user_id = 0
+        while True:
+            batch = list(
+                WatchlistItem.objects.filter(symbol=symbol, user_id__gt=last_user_id)
+                .order_by("user_id")
+                .values_list("user_id", flat=True)[:batch_size]
+            )
+            if not batch:
+                return
+            yield batch
+            if len(batch) < batch_size:
+                return
+            last_user_id = batch[-1]
+
     def notify(self, user: User, symbol: str, action: str) -> None:
-        """Notify about watchlist changes"""
-        raise NotImplementedError("Notification functionality not yet implemented")
+        """Notify observers about a watchlist change once it is committed"""
+        payload = {"user_id": user.id, "symbol": symbol, "action": action}
+        transaction.on_commit(lambda: self.event_bus.publish(self.EVENT_PREFIX + action, payload))
 
 
 service = WatchlistService()
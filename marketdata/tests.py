@@ -1,2 +1,325 @@
-from django.test import TestCase
+import contextlib
+import io
+from datetime import timedelta
+from unittest import mock
 
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from helpers.constants import MAX_BULK_ITEMS
+from helpers.synthetic_data import START_DATE, generate_prices, symbol_names
+from helpers.testing import EndpointCase, QueryBudgetMixin, QueryRecorder, VMStepCounter, TEST_PASSWORD
+from marketdata.management.commands import check_alerts
+from marketdata.models import PriceAlert
+from marketdata.serializers import PriceAlertSerializer
+from marketdata.services.alert_conditions import CandleIndicators, evaluate_alert
+from marketdata.services.market_data_service import get_marketdata_service
+from marketdata.urls import urlpatterns
+
+
+class MarketDataQueryBudgetTests(QueryBudgetMixin, TestCase):
+    urlpatterns = urlpatterns
+    cases = [
+        EndpointCase("exchanges", "GET", "/api/exchanges/", max_queries=1, max_scans=1, authenticated=False),
+        EndpointCase("tickers", "GET", "/api/tickers/", max_queries=1, max_scans=1, authenticated=False),
+        EndpointCase("tickers", "GET", "/api/tickers/?base=btc", max_queries=1, authenticated=False),
+        EndpointCase("candles", "GET", "/api/candles/BTC/", max_queries=1, authenticated=False),
+        EndpointCase("supported-coins", "GET", "/api/supported-coins/", max_queries=1, max_scans=1, authenticated=False),
+        EndpointCase("summary", "GET", "/api/summary/", max_queries=4, max_scans=4, max_unbounded_reads=3,
+                     authenticated=False),
+
+        EndpointCase("alert_list_create", "GET", "/api/alerts/", max_queries=3),
+        EndpointCase("alert_list_create", "POST", "/api/alerts/", max_queries=3, status=201,
+                     data={"crypto": "Bitcoin", "symbol": "BTC", "condition": "below", "price": 5}),
+        EndpointCase("alert_bulk", "POST", "/api/alerts/bulk/", max_queries=5,
+                     data={"alerts": [{"crypto": "Ether", "symbol": "ETH", "condition": "above", "price": p}
+                                      for p in range(1, 21)]}),
+        EndpointCase("alert_detail", "GET", "/api/alerts/{alert_id}/", max_queries=3),
+        EndpointCase("alert_detail", "PUT", "/api/alerts/{alert_id}/", max_queries=4,
+                     data={"price": 2}),
+        EndpointCase("alert_detail", "DELETE", "/api/alerts/{alert_id}/", max_queries=4, status=204),
+
+        EndpointCase("technical_analysis", "GET", "/api/technical-analysis/BTC/", max_queries=0,
+                     authenticated=False, status=503),
+        EndpointCase("sentiment_onchain_analysis", "POST", "/api/analysis/BTC/", max_queries=2,
+                     data={}, status=503),
+        EndpointCase("lstm_prediction", "GET", "/api/predict/lstm/BTC/", max_queries=0,
+                     authenticated=False, status=503),
+
+        EndpointCase("watchlist_list", "GET", "/api/watchlist/", max_queries=3),
+        EndpointCase("watchlist_dashboard", "GET", "/api/watchlist/dashboard/", max_queries=4),
+        EndpointCase("watchlist_add", "POST", "/api/watchlist/add/", max_queries=6,
+                     data={"symbol": "DOGE"}),
+        EndpointCase("watchlist_remove", "POST", "/api/watchlist/remove/", max_queries=3,
+                     data={"symbol": "BTC"}),
+        EndpointCase("watchlist_bulk_add", "POST", "/api/watchlist/bulk-add/", max_queries=6,
+                     data={"symbols": [f"COIN{i}" for i in range(20)]}),
+        EndpointCase("watchlist_bulk_remove", "POST", "/api/watchlist/bulk-remove/", max_queries=6,
+                     data={"symbols": ["ETH", "SOL"]}),
+    ]
+
+
+class WatchlistDashboardTests(TestCase):
+    SYMBOLS = 5
+    DAYS = 80_000
+
+    @classmethod
+    def setUpTestData(cls):
+        generate_prices(symbols=cls.SYMBOLS, days=cls.DAYS)
+        cls.symbols = symbol_names(cls.SYMBOLS)
+
+    def test_reads_only_the_requested_rows(self):
+        service = get_marketdata_service()
+        with QueryRecorder() as recorder, VMStepCounter() as counter:
+            data = service.get_watchlist_dashboard(self.symbols, points=30)
+
+        self.assertEqual(len(recorder.queries), 1, recorder.report())
+        self.assertEqual(recorder.scan_count, 0, recorder.report())
+        self.assertEqual(recorder.unbounded_read_count, 0, recorder.report())
+        # ROW_NUMBER() over each symbol's whole history costs tens of millions of steps here
+        self.assertLess(counter.steps, 100_000, f"{counter.steps} SQLite VM steps")
+
+        for symbol, result in zip(self.symbols, data["results"]):
+            self.assertEqual(result["symbol"], symbol)
+            self.assertEqual(len(result["sparkline"]), 30)
+            self.assertEqual(result["ticker"]["captured_at"],
+                             (START_DATE + timedelta(days=self.DAYS - 1)).isoformat())
+            self.assertEqual(result["sparkline"][-1], result["ticker"]["last"])
+
+
+class InlineExecutor:
+    """Stands in for ProcessPoolExecutor: runs each shard in this process (the test database is in memory)"""
+
+    def __init__(self, max_workers, initializer=None):
+        self.calls = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def map(self, fn, *iterables):
+        for args in zip(*iterables):
+            self.calls.append(args)
+            yield fn(*args)
+
+
+class CheckAlertsTests(TestCase):
+    SYMBOLS = 12
+
+    @classmethod
+    def setUpTestData(cls):
+        generate_prices(symbols=cls.SYMBOLS, days=40)
+        cls.symbols = symbol_names(cls.SYMBOLS)
+        cls.user = User.objects.create_user("alerts", "alerts@example.com", TEST_PASSWORD)
+        # Prices are always above zero, so every alert fires
+        cls.alerts = [
+            PriceAlert.objects.create(user=cls.user, crypto=symbol, symbol=symbol, condition="above", price=0)
+            for symbol in cls.symbols
+        ]
+
+    def setUp(self):
+        patcher = mock.patch.object(check_alerts, "send_alert_email", return_value=True)
+        self.send = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_command(self, *args) -> str:
+        output = io.StringIO()
+        call_command("check_alerts", *args, stdout=output)
+        return output.getvalue()
+
+    def test_claim_is_exclusive_until_released(self):
+        command = check_alerts.Command()
+        alert = self.alerts[0]
+        now = timezone.now()
+
+        self.assertTrue(command.claim_alert(alert, now))
+        # A second worker holding a stale copy of the alert can't claim it again
+        self.assertFalse(command.claim_alert(alert, now + timedelta(seconds=1)))
+
+        command.release_alert(alert, now)
+        alert.refresh_from_db()
+        self.assertIsNone(alert.last_sent_at)
+        self.assertTrue(command.claim_alert(alert, now))
+
+    def test_sends_each_alert_once(self):
+        self.run_command()
+        self.assertEqual(self.send.call_count, self.SYMBOLS)
+
+        # Still within the cooldown: nothing is sent again
+        output = self.run_command()
+        self.assertEqual(self.send.call_count, self.SYMBOLS)
+        self.assertIn("0 checked, 0 triggered", output)
+
+    def test_cooldown(self):
+        recent, expired = self.alerts[:2]
+        PriceAlert.objects.filter(pk=recent.pk).update(last_sent_at=timezone.now() - timedelta(hours=23))
+        PriceAlert.objects.filter(pk=expired.pk).update(last_sent_at=timezone.now() - timedelta(hours=25))
+
+        self.run_command()
+        sent = {call.kwargs["symbol"] for call in self.send.call_args_list}
+        self.assertNotIn(recent.symbol, sent)
+        self.assertIn(expired.symbol, sent)
+        self.assertEqual(len(sent), self.SYMBOLS - 1)
+
+    def test_failed_send_releases_the_claim(self):
+        self.send.return_value = False
+        output = self.run_command()
+
+        self.assertIn(f"{self.SYMBOLS} checked, 0 triggered", output)
+        self.assertFalse(PriceAlert.objects.filter(last_sent_at__isnull=False).exists())
+
+    def test_shards_partition_the_alerts(self):
+        shard_count = 4
+        symbols_by_shard = []
+        for index in range(shard_count):
+            self.send.reset_mock()
+            self.run_command("--shard", f"{index}/{shard_count}")
+            symbols = {call.kwargs["symbol"] for call in self.send.call_args_list}
+            self.assertTrue(all(check_alerts.symbol_shard(symbol, shard_count) == index for symbol in symbols))
+            symbols_by_shard.append(symbols)
+
+        self.assertEqual(sum(len(symbols) for symbols in symbols_by_shard), self.SYMBOLS)
+        self.assertEqual(set().union(*symbols_by_shard), set(self.symbols))
+
+    def test_workers_counts_are_summed(self):
+        executors = []
+
+        def executor(**kwargs):
+            executors.append(InlineExecutor(**kwargs))
+            return executors[-1]
+
+        # Shards print through their own Command, to stdout
+        with mock.patch.object(check_alerts, "ProcessPoolExecutor", side_effect=executor), \
+                contextlib.redirect_stdout(io.StringIO()):
+            output = self.run_command("--workers", "3")
+
+        self.assertEqual(executors[0].calls, [(0, 3), (1, 3), (2, 3)])
+        self.assertIn(f"{self.SYMBOLS} checked, {self.SYMBOLS} triggered", output)
+        self.assertEqual(self.send.call_count, self.SYMBOLS)
+
+    def test_invalid_shard(self):
+        for value in ("4/4", "x", "1/0"):
+            with self.subTest(shard=value), self.assertRaises(CommandError):
+                self.run_command("--shard", value)
+
+
+class AlertConditionTests(SimpleTestCase):
+    def alert(self, condition, price, period):
+        return PriceAlert(id=1, condition=condition, price=price, period=period)
+
+    def test_sma(self):
+        indicators = CandleIndicators([float(close) for close in range(1, 11)])
+        self.assertEqual(indicators.sma(3), 9)
+        self.assertEqual(indicators.sma(3, offset=1), 8)
+        self.assertEqual(indicators.sma(10), 5.5)
+        self.assertIsNone(indicators.sma(11))
+
+    def test_pct_change(self):
+        indicators = CandleIndicators([100.0, 110.0, 121.0])
+        self.assertAlmostEqual(indicators.pct_change(1), 10)
+        self.assertAlmostEqual(indicators.pct_change(2), 21)
+        self.assertIsNone(indicators.pct_change(3))
+        self.assertIsNone(CandleIndicators([0.0, 1.0]).pct_change(1))
+
+    def test_rsi(self):
+        # Deltas +1 -1 +2 -1 +2 -1: Wilder's smoothing ends with equal average gain and loss
+        closes = [10.0, 11.0, 10.0, 12.0, 11.0, 13.0, 12.0]
+        self.assertAlmostEqual(CandleIndicators(closes).rsi(2), 50)
+        self.assertEqual(CandleIndicators([1.0, 2.0, 3.0]).rsi(2), 100)
+        self.assertIsNone(CandleIndicators([1.0, 2.0]).rsi(2))
+
+    def test_rsi_only_uses_its_own_window(self):
+        closes = [10.0, 11.0, 10.0, 12.0, 11.0, 13.0, 12.0]
+        # Closes loaded for a longer-period alert on the same symbol don't change RSI(2)
+        longer = CandleIndicators([500.0, 100.0, 900.0] + closes)
+        self.assertAlmostEqual(longer.rsi(2), CandleIndicators(closes).rsi(2))
+
+    def test_evaluate_alert(self):
+        indicators = CandleIndicators([5.0, 5.0, 5.0, 5.0, 10.0])
+        self.assertEqual(evaluate_alert(self.alert("above", 10, None), indicators), (True, 10.0))
+        self.assertEqual(evaluate_alert(self.alert("below", 9, None), indicators), (False, 10.0))
+        self.assertEqual(evaluate_alert(self.alert("pct_above", 100, 1), indicators), (True, 100.0))
+        self.assertEqual(evaluate_alert(self.alert("pct_below", 10, 1), indicators), (False, 100.0))
+
+        met, ma = evaluate_alert(self.alert("ma_cross_above", 0, 3), indicators)
+        self.assertTrue(met)
+        self.assertAlmostEqual(ma, 20 / 3)
+        self.assertFalse(evaluate_alert(self.alert("ma_cross_below", 0, 3), indicators)[0])
+
+        self.assertEqual(evaluate_alert(self.alert("rsi_above", 70, 2), indicators), (True, 100.0))
+        self.assertEqual(evaluate_alert(self.alert("rsi_below", 30, 10), indicators), (False, None))
+
+    def test_period_is_bounded(self):
+        data = {"crypto": "Bitcoin", "symbol": "BTC", "condition": "rsi_above", "price": 70}
+        self.assertTrue(PriceAlertSerializer(data={**data, "period": PriceAlert.MAX_PERIOD}).is_valid())
+        serializer = PriceAlertSerializer(data={**data, "period": PriceAlert.MAX_PERIOD + 1})
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("period", serializer.errors)
+        serializer = PriceAlertSerializer(data={**data, "period": None})
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("period", serializer.errors)
+
+
+class BulkEndpointTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("bulk", "bulk@example.com", TEST_PASSWORD)
+        cls.alert = PriceAlert.objects.create(user=cls.user, crypto="Bitcoin", symbol="BTC", condition="above", price=1)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_login(self.user)
+
+    def send(self, method, path, data):
+        return getattr(self.client, method)(path, data, format="json", secure=True)
+
+    def test_non_object_bodies_are_rejected(self):
+        for method, path in (("post", "/api/alerts/bulk/"), ("put", "/api/alerts/bulk/"),
+                             ("delete", "/api/alerts/bulk/"), ("post", "/api/watchlist/bulk-add/"),
+                             ("post", "/api/watchlist/bulk-remove/")):
+            with self.subTest(endpoint=f"{method} {path}"):
+                self.assertEqual(self.send(method, path, [{"symbol": "BTC"}]).status_code, 400)
+                self.assertEqual(self.send(method, path, {"alerts": "BTC", "ids": 1, "symbols": "BTC"}).status_code,
+                                 400)
+
+    def test_item_cap(self):
+        too_many = MAX_BULK_ITEMS + 1
+        response = self.send("post", "/api/alerts/bulk/", {"alerts": [{}] * too_many})
+        self.assertEqual(response.status_code, 400)
+        response = self.send("delete", "/api/alerts/bulk/", {"ids": list(range(too_many))})
+        self.assertEqual(response.status_code, 400)
+        response = self.send("post", "/api/watchlist/bulk-add/", {"symbols": ["BTC"] * too_many})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(PriceAlert.objects.exclude(pk=self.alert.pk).exists())
+
+    def test_alert_partial_failures(self):
+        valid = {"crypto": "Ether", "symbol": "ETH", "condition": "below", "price": 5}
+        results = self.send("post", "/api/alerts/bulk/", {"alerts": [valid, {"symbol": "ETH"}, valid]}).json()["results"]
+        self.assertEqual([(result["index"], result["ok"]) for result in results], [(0, True), (1, False), (2, True)])
+        self.assertIn("condition", results[1]["errors"])
+        self.assertEqual(PriceAlert.objects.filter(user=self.user, symbol="ETH").count(), 2)
+
+        results = self.send("put", "/api/alerts/bulk/", {"alerts": [
+            {"id": self.alert.pk, "price": 7}, {"id": 0, "price": 1}, {"id": self.alert.pk, "condition": "nope"},
+        ]}).json()["results"]
+        self.assertEqual([result["ok"] for result in results], [True, False, False])
+        self.alert.refresh_from_db()
+        self.assertEqual(self.alert.price, 7)
+
+        results = self.send("delete", "/api/alerts/bulk/", {"ids": [self.alert.pk, "x", self.alert.pk]}).json()["results"]
+        self.assertEqual([result["ok"] for result in results], [True, False, False])
+        self.assertFalse(PriceAlert.objects.filter(pk=self.alert.pk).exists())
+
+    def test_watchlist_partial_failures(self):
+        results = self.send("post", "/api/watchlist/bulk-add/", {"symbols": ["btc", "", 3, "BTC"]}).json()["results"]
+        self.assertEqual([(result["ok"], result.get("created")) for result in results],
+                         [(True, True), (False, None), (False, None), (True, False)])
+
+        results = self.send("post", "/api/watchlist/bulk-remove/", {"symbols": ["BTC", "ETH", None]}).json()["results"]
+        self.assertEqual([(result["ok"], result.get("deleted")) for result in results],
+                         [(True, 1), (True, 0), (False, None)])
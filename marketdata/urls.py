@@ -4,10 +4,11 @@ from marketdata.views.sentiment_analysis_views import SentimentOnChainAnalysisVi
 from marketdata.views.technical_analysis_views import TechnicalAnalysisView
 
 from marketdata.views.market_data_views import SupportedCoinListView, CandleSeriesView, TickerListView, \
-    ExchangeListView, DataSummaryView, PriceAlertListCreateView, PriceAlertDetailView
+    ExchangeListView, DataSummaryView, PriceAlertListCreateView, PriceAlertDetailView, PriceAlertBulkView
 
 from marketdata.views.lstm_views import LSTMPredictionView
-from marketdata.views.watchlist_views import WatchlistListView, WatchlistAddView, WatchlistRemoveView
+from marketdata.views.watchlist_views import WatchlistListView, WatchlistAddView, WatchlistRemoveView, \
+    WatchlistDashboardView, WatchlistBulkAddView, WatchlistBulkRemoveView
 
 app_name = "marketdata"
 
@@ -20,6 +21,7 @@ urlpatterns = [
     path("summary/", DataSummaryView.as_view(), name="summary"),
 
     path("alerts/", PriceAlertListCreateView.as_view(), name="alert_list_create"),
+    path("alerts/bulk/", PriceAlertBulkView.as_view(), name="alert_bulk"),
     path("alerts/<int:pk>/", PriceAlertDetailView.as_view(), name="alert_detail"),
 
     path("technical-analysis/<str:symbol>/", TechnicalAnalysisView.as_view(), name="technical_analysis"),
@@ -28,7 +30,10 @@ urlpatterns = [
     path("predict/lstm/<str:symbol>/", LSTMPredictionView.as_view(), name="lstm_prediction"),
 
     path("watchlist/", WatchlistListView.as_view(), name="watchlist_list"),
+    path("watchlist/dashboard/", WatchlistDashboardView.as_view(), name="watchlist_dashboard"),
     path("watchlist/add/", WatchlistAddView.as_view(), name="watchlist_add"),
     path("watchlist/remove/", WatchlistRemoveView.as_view(), name="watchlist_remove"),
+    path("watchlist/bulk-add/", WatchlistBulkAddView.as_view(), name="watchlist_bulk_add"),
+    path("watchlist/bulk-remove/", WatchlistBulkRemoveView.as_view(), name="watchlist_bulk_remove"),
 
 ]
@@ -2,29 +2,54 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 import requests
-from helpers.env_variables import LSTM_SERVICE_URL
+from rest_framework.exceptions import ParseError
+from helpers import upstream
+from helpers.admission import AdmissionControlMixin
+from helpers.deadlines import DeadlineExceeded
 
-class LSTMPredictionView(APIView):
+DEFAULT_LOOKBACK = 30
+DEFAULT_EPOCHS = 5
+
+
+def training_params(params):
+    """(lookback, epochs) of a prediction request, defaulted; ParseError unless positive integers"""
+    if not hasattr(params, 'get'):
+        raise ParseError('Expected a JSON object')
+    try:
+        lookback = int(params.get('lookback', DEFAULT_LOOKBACK))
+        epochs = int(params.get('epochs', DEFAULT_EPOCHS))
+    except (TypeError, ValueError):
+        raise ParseError('lookback and epochs must be integers')
+    if lookback < 1 or epochs < 1:
+        raise ParseError('lookback and epochs must be positive')
+    return lookback, epochs
+
+
+class LSTMPredictionView(AdmissionControlMixin, APIView):
     authentication_classes = []
     permission_classes = []
+    admission_scope = "prediction"
+
+    def get_admission_cost(self, request):
+        # Training time grows with both the window and the number of passes over it
+        lookback, epochs = training_params(request.query_params if request.method == 'GET' else request.data)
+        return lookback * epochs
 
     def get(self, request, symbol):
         """Handle GET requests from the frontend template"""
-        service_url = f"{LSTM_SERVICE_URL}/predict"
 
         # Extract parameters from query string
-        lookback = request.query_params.get('lookback', 30)
-        epochs = request.query_params.get('epochs', 5)
+        lookback, epochs = training_params(request.query_params)
         
         payload = {
             "crypto": symbol,
-            "lookback": int(lookback),
-            "epochs": int(epochs)
+            "lookback": lookback,
+            "epochs": epochs
         }
         
         try:
             # Proxy to microservice
-            response = requests.post(service_url, json=payload, timeout=120)
+            response = upstream.post("lstm", "/predict", json=payload)
             
             if response.status_code == 200:
                 return Response(response.json(), status=status.HTTP_200_OK)
@@ -33,6 +58,8 @@ class LSTMPredictionView(APIView):
                     {"error": f"Microservice error: {response.text}"}, 
                     status=response.status_code
                 )
+        except DeadlineExceeded as e:
+            return Response({"error": str(e.detail)}, status=status.HTTP_504_GATEWAY_TIMEOUT)
         except requests.exceptions.ConnectionError:
             return Response(
                 {"error": "LSTM Service is unavailable"}, 
@@ -45,14 +72,12 @@ class LSTMPredictionView(APIView):
             )
 
     def post(self, request, symbol=None):
-        service_url = f"{LSTM_SERVICE_URL}/predict"
-
         data = request.data.copy()
         if symbol and "crypto" not in data:
             data["crypto"] = symbol
             
         try:
-            response = requests.post(service_url, json=data)
+            response = upstream.post("lstm", "/predict", json=data)
             
             if response.status_code == 200:
                 return Response(response.json(), status=status.HTTP_200_OK)
@@ -61,6 +86,8 @@ class LSTMPredictionView(APIView):
                     {"error": f"Microservice error: {response.text}"}, 
                     status=response.status_code
                 )
+        except DeadlineExceeded as e:
+            return Response({"error": str(e.detail)}, status=status.HTTP_504_GATEWAY_TIMEOUT)
         except requests.exceptions.ConnectionError:
             return Response(
                 {"error": "LSTM Service is unavailable"}, 
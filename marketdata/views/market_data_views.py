@@ -6,6 +6,7 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from marketdata.exceptions.market_data_exceptions import AlertValidationError
 from marketdata.models import SupportedCoin
 from marketdata.serializers import SupportedCoinSerializer
 from marketdata.services.market_data_service import get_marketdata_service
@@ -118,6 +119,33 @@ class PriceAlertDetailView(APIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+def _get_bulk_items(request, key):
+    if not isinstance(request.data, dict):
+        raise AlertValidationError(f"Expected an object with an '{key}' list")
+    return request.data.get(key)
+
+
+class PriceAlertBulkView(APIView):
+    """Create, update and delete many price alerts in one request"""
+    permission_classes = [IsAuthenticated]
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.marketdata_service = get_marketdata_service()
+
+    def post(self, request):
+        results = self.marketdata_service.bulk_create_alerts(request.user, _get_bulk_items(request, "alerts"))
+        return Response({"results": results})
+
+    def put(self, request):
+        results = self.marketdata_service.bulk_update_alerts(request.user, _get_bulk_items(request, "alerts"))
+        return Response({"results": results})
+
+    def delete(self, request):
+        results = self.marketdata_service.bulk_delete_alerts(request.user, _get_bulk_items(request, "ids"))
+        return Response({"results": results})
+
+
 class SupportedCoinListView(generics.ListAPIView):
     """List supported coins"""
     serializer_class = SupportedCoinSerializer
@@ -1,8 +1,8 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-import requests
-from helpers.env_variables import SENTIMENT_ANALYSIS_SERVICE_URL
+from helpers import upstream
+from helpers.deadlines import DeadlineExceeded
 
 
 class SentimentOnChainAnalysisView(APIView):
@@ -12,10 +12,9 @@ class SentimentOnChainAnalysisView(APIView):
 
     def post(self, request, symbol):
         symbol = symbol.upper()
-        SERVICE_URL = f"{SENTIMENT_ANALYSIS_SERVICE_URL}/analyze"
 
         try:
-            response = requests.post(SERVICE_URL, json={"symbol": symbol}, timeout=60)
+            response = upstream.post("sentiment", "/analyze", idempotent=True, json={"symbol": symbol})
 
             if response.status_code == 200:
                 return Response(response.json())
@@ -24,6 +23,8 @@ class SentimentOnChainAnalysisView(APIView):
                     {"error": f"Sentiment service error: {response.text}"},
                     status=response.status_code
                 )
+        except DeadlineExceeded as e:
+            return Response({"error": str(e.detail)}, status=status.HTTP_504_GATEWAY_TIMEOUT)
         except Exception as e:
             return Response(
                 {"error": str(e)},
@@ -2,18 +2,22 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework import status
 import requests
-from helpers.env_variables import TECHNICAL_ANALYSIS_SERVICE_URL
+from helpers import upstream
+from helpers.admission import AdmissionControlMixin
+from helpers.deadlines import DeadlineExceeded
 
-class TechnicalAnalysisView(APIView):
+class TechnicalAnalysisView(AdmissionControlMixin, APIView):
     authentication_classes = []
     permission_classes = []
+    admission_scope = "analysis"
+
+    def get_admission_cost(self, request):
+        # One microservice analysis per timeframe: all three, or the one asked for
+        return 3 if request.GET.get('all', 'false').lower() == 'true' else 1
     
     def get(self, request, symbol):
         timeframe = request.GET.get('timeframe', '1d')
         all_timeframes = request.GET.get('all', 'false').lower() == 'true'
-        
-        # Microservice URL
-        SERVICE_URL = f"{TECHNICAL_ANALYSIS_SERVICE_URL}/analyze"
 
         try:
             if all_timeframes:
@@ -24,11 +28,18 @@ class TechnicalAnalysisView(APIView):
                 results = {}
                 for tf in timeframes:
                      try:
-                        resp = requests.post(SERVICE_URL, json={"symbol": symbol.upper(), "timeframe": tf})
+                        resp = upstream.post("technical_analysis", "/analyze", idempotent=True,
+                                             json={"symbol": symbol.upper(), "timeframe": tf})
                         if resp.status_code == 200:
                             results[tf] = resp.json()
                         else:
                              results[tf] = {'error': f'Microservice error: {resp.text}'}
+                     except DeadlineExceeded:
+                         # Out of time: answer with the timeframes we have rather than none
+                         results[tf] = {'error': 'Deadline exceeded'}
+                         for skipped in timeframes[timeframes.index(tf) + 1:]:
+                             results[skipped] = {'error': 'Deadline exceeded'}
+                         break
                      except:
                          results[tf] = {'error': 'Service unavailable'}
                 return Response(results, status=status.HTTP_200_OK)
@@ -45,7 +56,7 @@ class TechnicalAnalysisView(APIView):
                     "symbol": symbol.upper(),
                     "timeframe": timeframe
                 }
-                response = requests.post(SERVICE_URL, json=payload)
+                response = upstream.post("technical_analysis", "/analyze", idempotent=True, json=payload)
                 
                 if response.status_code == 200:
                     return Response(response.json(), status=status.HTTP_200_OK)
@@ -60,6 +71,8 @@ class TechnicalAnalysisView(APIView):
                         status=response.status_code
                     )
 
+        except DeadlineExceeded as e:
+            return Response({"error": str(e.detail)}, status=status.HTTP_504_GATEWAY_TIMEOUT)
         except requests.exceptions.ConnectionError:
             return Response(
                 {"error": "Technical Analysis Service is unavailable"}, 
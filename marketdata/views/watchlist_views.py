@@ -4,6 +4,9 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 
+from helpers.constants import MAX_BULK_ITEMS
+from marketdata.exceptions.watchlist_exceptions import WatchlistValidationError
+from marketdata.services.market_data_service import get_marketdata_service
 from marketdata.services.watchlist_service import get_watchlist_service
 
 
@@ -20,6 +23,27 @@ class WatchlistListView(APIView):
         return Response({"symbols": symbols})
 
 
+class WatchlistDashboardView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.watchlist_service = get_watchlist_service()
+        self.marketdata_service = get_marketdata_service()
+
+    def get(self, request):
+        """Get latest ticker and sparkline for every watched symbol"""
+        points = self.marketdata_service.clamp_limit(
+            request.query_params.get("points"),
+            default=30,
+            max_value=365
+        )
+
+        symbols = self.watchlist_service.list_subscribed_symbols(request.user)
+        data = self.marketdata_service.get_watchlist_dashboard(symbols, points=points)
+        return Response(data)
+
+
 class WatchlistAddView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -49,3 +73,40 @@ class WatchlistRemoveView(APIView):
         result = self.watchlist_service.unsubscribe(request.user, symbol)
         return Response(result)
 
+
+
+def _get_bulk_symbols(request):
+    if not isinstance(request.data, dict):
+        raise WatchlistValidationError("Expected an object with a 'symbols' list")
+    symbols = request.data.get("symbols")
+    if not isinstance(symbols, list):
+        raise WatchlistValidationError("Expected a list of symbols")
+    if len(symbols) > MAX_BULK_ITEMS:
+        raise WatchlistValidationError(f"At most {MAX_BULK_ITEMS} symbols can be sent in one request")
+    return symbols
+
+
+class WatchlistBulkAddView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.watchlist_service = get_watchlist_service()
+
+    def post(self, request):
+        """Add many symbols to the user's watchlist"""
+        results = self.watchlist_service.bulk_subscribe(request.user, _get_bulk_symbols(request))
+        return Response({"results": results})
+
+
+class WatchlistBulkRemoveView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.watchlist_service = get_watchlist_service()
+
+    def post(self, request):
+        """Remove many symbols from the user's watchlist"""
+        results = self.watchlist_service.bulk_unsubscribe(request.user, _get_bulk_symbols(request))
+        return Response({"results": results})
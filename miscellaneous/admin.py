@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from miscellaneous.models import ErrorLog
+from miscellaneous.models import ErrorGroup, ErrorLog, SlowQuery
 
 
 @admin.register(ErrorLog)
@@ -8,7 +8,7 @@ class ErrorLogAdmin(admin.ModelAdmin):
     list_display = ['timestamp', 'type', 'endpoint', 'status', 'user', 'message_preview']
     list_filter = ['type', 'status', 'timestamp']
     search_fields = ['type', 'endpoint', 'message', 'user__username']
-    readonly_fields = ['timestamp']
+    readonly_fields = ['timestamp', 'full_stack_trace']
     ordering = ['-timestamp']
     list_per_page = 25
 
@@ -20,7 +20,7 @@ class ErrorLogAdmin(admin.ModelAdmin):
             'fields': ('user', 'timestamp')
         }),
         ('Stack Trace', {
-            'fields': ('stack_trace',),
+            'fields': ('full_stack_trace',),
             'classes': ('collapse',)
         }),
     )
@@ -33,3 +33,53 @@ class ErrorLogAdmin(admin.ModelAdmin):
 
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('user')
+
+
+@admin.register(ErrorGroup)
+class ErrorGroupAdmin(admin.ModelAdmin):
+    list_display = ['last_seen', 'type', 'endpoint', 'status', 'count', 'first_seen', 'last_user']
+    list_filter = ['type', 'status', 'last_seen']
+    search_fields = ['type', 'endpoint', 'message']
+    readonly_fields = ['fingerprint', 'count', 'first_seen', 'last_seen', 'last_user']
+    ordering = ['-last_seen']
+    list_per_page = 25
+
+    fieldsets = (
+        ('Error Details', {
+            'fields': ('fingerprint', 'type', 'endpoint', 'status', 'message')
+        }),
+        ('Occurrences', {
+            'fields': ('count', 'first_seen', 'last_seen', 'last_user')
+        }),
+        ('Last Stack Trace', {
+            'fields': ('last_stack_trace',),
+            'classes': ('collapse',)
+        }),
+    )
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('last_user')
+
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ['caller', 'count', 'cancelled_count', 'total_seconds', 'max_seconds', 'prices_full_scan',
+                    'last_seen']
+    list_filter = ['prices_full_scan', 'last_seen']
+    search_fields = ['sql', 'caller']
+    readonly_fields = ['fingerprint', 'count', 'cancelled_count', 'total_seconds', 'max_seconds', 'first_seen',
+                       'last_seen']
+    ordering = ['-total_seconds']
+    list_per_page = 25
+
+    fieldsets = (
+        ('Query', {
+            'fields': ('fingerprint', 'sql', 'caller', 'example_sql', 'example_params')
+        }),
+        ('Plan', {
+            'fields': ('plan', 'scanned_tables', 'prices_full_scan')
+        }),
+        ('Timings', {
+            'fields': ('count', 'total_seconds', 'max_seconds', 'first_seen', 'last_seen')
+        }),
+    )
@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class MiscellaneousConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'miscellaneous'
+
+    def ready(self):
+        from helpers import deadlines, slow_queries, tracing
+        connection_created.connect(slow_queries.install, dispatch_uid="slow_query_log")
+        connection_created.connect(deadlines.install, dispatch_uid="query_deadlines")
+        connection_created.connect(tracing.install, dispatch_uid="tracing")
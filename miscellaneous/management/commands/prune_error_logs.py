@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from helpers.env_variables import ERROR_LOG_RETENTION_DAYS
+from miscellaneous.services.error_log_service import get_error_log_service
+
+
+class Command(BaseCommand):
+    help = 'Delete raw error occurrences older than the retention period'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=ERROR_LOG_RETENTION_DAYS,
+            help=f'Retention in days (default {ERROR_LOG_RETENTION_DAYS})',
+        )
+        parser.add_argument(
+            '--groups',
+            action='store_true',
+            help='Also delete error groups not seen within the retention period',
+        )
+
+    def handle(self, *args, **options):
+        result = get_error_log_service().prune(retention_days=options['days'], prune_groups=options['groups'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Pruned {result["occurrences"]} error occurrences and {result["groups"]} groups'
+        ))
@@ -0,0 +1,88 @@
+# Generated by Django 5.0.4 on 2026-10-19 03:46
+
+import hashlib
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_error_groups(apps, schema_editor):
+    """Build one ErrorGroup per (type, endpoint, status, message) from existing logs"""
+    ErrorLog = apps.get_model('miscellaneous', 'ErrorLog')
+    ErrorGroup = apps.get_model('miscellaneous', 'ErrorGroup')
+
+    groups = {}
+    for log in ErrorLog.objects.order_by('timestamp', 'id').iterator():
+        raw = '\x1f'.join([log.type, log.endpoint or '', str(log.status or ''), log.message])
+        fingerprint = hashlib.sha256(raw.encode('utf-8')).hexdigest()
+        group = groups.get(fingerprint)
+        if group is None:
+            group = groups[fingerprint] = ErrorGroup(
+                fingerprint=fingerprint, type=log.type, endpoint=log.endpoint, status=log.status,
+                message=log.message, count=0, first_seen=log.timestamp, last_seen=log.timestamp,
+            )
+            group.log_ids = []
+        group.count += 1
+        group.last_seen = log.timestamp
+        group.last_stack_trace = log.stack_trace
+        group.last_user_id = log.user_id
+        group.log_ids.append(log.id)
+
+    for group in groups.values():
+        group.save()
+        for start in range(0, len(group.log_ids), 500):
+            ErrorLog.objects.filter(id__in=group.log_ids[start:start + 500]).update(group=group)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miscellaneous', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='errorlog',
+            name='stack_trace_compressed',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='ErrorGroup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=64, unique=True)),
+                ('type', models.CharField(max_length=50)),
+                ('endpoint', models.CharField(blank=True, max_length=255, null=True)),
+                ('status', models.IntegerField(blank=True, null=True)),
+                ('message', models.TextField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('first_seen', models.DateTimeField()),
+                ('last_seen', models.DateTimeField()),
+                ('last_stack_trace', models.TextField(blank=True, null=True)),
+                ('last_user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-last_seen', '-id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='errorlog',
+            name='group',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='occurrences', to='miscellaneous.errorgroup'),
+        ),
+        migrations.AddIndex(
+            model_name='errorlog',
+            index=models.Index(fields=['timestamp'], name='errorlog_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='errorgroup',
+            index=models.Index(fields=['last_seen', 'id'], name='errorgroup_last_seen_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='errorgroup',
+            index=models.Index(fields=['type', 'last_seen'], name='errorgroup_type_last_seen_idx'),
+        ),
+        migrations.RunPython(backfill_error_groups, migrations.RunPython.noop),
+    ]
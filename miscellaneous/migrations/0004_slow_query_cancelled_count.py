@@ -0,0 +1,18 @@
+# Generated by Django 5.0.4 on 2026-10-19 04:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miscellaneous', '0003_slow_query'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='slowquery',
+            name='cancelled_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
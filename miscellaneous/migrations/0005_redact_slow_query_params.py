@@ -0,0 +1,20 @@
+# Generated by Django 5.0.4 on 2026-10-19 09:10
+
+from django.db import migrations
+
+
+def redact_example_params(apps, schema_editor):
+    # Parameters were stored verbatim before SLOW_QUERY_LOG_PARAMS existed; they may hold session keys or hashes
+    SlowQuery = apps.get_model('miscellaneous', 'SlowQuery')
+    SlowQuery.objects.exclude(example_params__in=['', '<executemany>']).update(example_params='<redacted>')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miscellaneous', '0004_slow_query_cancelled_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(redact_example_params, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.4 on 2026-10-19 05:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('miscellaneous', '0005_redact_slow_query_params'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='errorlog',
+            index=models.Index(fields=['group', 'timestamp'], name='errorlog_group_timestamp_idx'),
+        ),
+    ]
@@ -1,13 +1,54 @@
+import zlib
+
 from django.contrib.auth.models import User
 from django.db import models
 
 
+class ErrorGroup(models.Model):
+    """Aggregate of all ErrorLog occurrences sharing a fingerprint"""
+    fingerprint = models.CharField(max_length=64, unique=True)
+    type = models.CharField(max_length=50)
+    endpoint = models.CharField(max_length=255, blank=True, null=True)
+    status = models.IntegerField(blank=True, null=True)
+    message = models.TextField()
+    count = models.PositiveIntegerField(default=0)
+    first_seen = models.DateTimeField()
+    last_seen = models.DateTimeField()
+    last_stack_trace = models.TextField(blank=True, null=True)
+    last_user = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+
+    class Meta:
+        ordering = ["-last_seen", "-id"]
+        indexes = [
+            models.Index(fields=["last_seen", "id"], name="errorgroup_last_seen_idx"),
+            models.Index(fields=["type", "last_seen"], name="errorgroup_type_last_seen_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.type} - {self.endpoint or 'N/A'} ({self.count})"
+
+
 class ErrorLog(models.Model):
     type = models.CharField(max_length=50)
     endpoint = models.CharField(max_length=255, blank=True, null=True)
     status = models.IntegerField(blank=True, null=True)
     message = models.TextField()
     stack_trace = models.TextField(blank=True, null=True)
+    # New occurrences keep their stack trace zlib-compressed here instead of in stack_trace
+    stack_trace_compressed = models.BinaryField(blank=True, null=True)
+    group = models.ForeignKey(
+        ErrorGroup,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="occurrences",
+    )
     user = models.ForeignKey(
         User,
         # settings.AUTH_USER_MODEL,
@@ -20,6 +61,49 @@ class ErrorLog(models.Model):
 
     class Meta:
         ordering = ["-timestamp"]
+        indexes = [
+            models.Index(fields=["timestamp"], name="errorlog_timestamp_idx"),
+            # A group's occurrences in a time window, read without touching the table
+            models.Index(fields=["group", "timestamp"], name="errorlog_group_timestamp_idx"),
+        ]
 
     def __str__(self):
         return f"[{self.timestamp}] {self.type} - {self.endpoint or 'N/A'}"
+
+    @property
+    def full_stack_trace(self):
+        """Stack trace, whether stored compressed or as plain text"""
+        if self.stack_trace_compressed:
+            return zlib.decompress(bytes(self.stack_trace_compressed)).decode("utf-8")
+        return self.stack_trace
+
+
+class SlowQuery(models.Model):
+    """Aggregate of all slow executions of one SQL fingerprint (see helpers.slow_queries)"""
+    fingerprint = models.CharField(max_length=64, unique=True)
+    sql = models.TextField()
+    example_sql = models.TextField()
+    example_params = models.TextField(blank=True)
+    caller = models.CharField(max_length=255)
+    plan = models.TextField(blank=True)
+    scanned_tables = models.CharField(max_length=255, blank=True)
+    # The plan reads the whole prices table instead of searching one of its indexes
+    prices_full_scan = models.BooleanField(default=False)
+    count = models.PositiveIntegerField(default=0)
+    total_seconds = models.FloatField(default=0)
+    max_seconds = models.FloatField(default=0)
+    # Executions aborted at the request's deadline (see helpers.deadlines); counted in count too
+    cancelled_count = models.PositiveIntegerField(default=0)
+    first_seen = models.DateTimeField()
+    last_seen = models.DateTimeField()
+
+    class Meta:
+        ordering = ["-total_seconds"]
+        verbose_name_plural = "slow queries"
+
+    def __str__(self):
+        return f"{self.caller} ({self.count}x, max {self.max_seconds * 1000:.0f}ms)"
+
+    @property
+    def mean_seconds(self):
+        return self.total_seconds / self.count if self.count else 0.0
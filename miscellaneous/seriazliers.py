@@ -10,3 +10,8 @@ class ErrorLogSerializer(serializers.ModelSerializer):
         model = ErrorLog
         fields = ['id', 'type', 'endpoint', 'status', 'message', 'stack_trace', 'user', 'username', 'timestamp']
         read_only_fields = ['id', 'timestamp', 'username']
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data['stack_trace'] = instance.full_stack_trace
+        return data
@@ -0,0 +1,206 @@
+import base64
+import hashlib
+import logging
+import zlib
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Min, OuterRef, Q, Subquery
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from helpers.abstract import AbstractService
+from helpers.env_variables import ERROR_LOG_RETENTION_DAYS
+from helpers.metrics import CLIENT_ERRORS_REPORTED
+from miscellaneous.models import ErrorGroup, ErrorLog
+
+logger = logging.getLogger(__name__)
+
+
+def compute_fingerprint(error_type: str, endpoint: Optional[str], status: Optional[int], message: str) -> str:
+    """Stable hash identifying an error group"""
+    raw = "\x1f".join([error_type, endpoint or "", str(status or ""), message])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+class ErrorLogService(AbstractService):
+    """Service class for recording and reading grouped error logs"""
+
+    def record_error(self, validated_data: Dict[str, Any]) -> ErrorLog:
+        """Store one occurrence (stack trace compressed) and fold it into its group"""
+        now = timezone.now()
+        user = validated_data.get("user")
+        stack_trace = validated_data.get("stack_trace")
+        fingerprint = compute_fingerprint(
+            validated_data["type"], validated_data.get("endpoint"),
+            validated_data.get("status"), validated_data["message"]
+        )
+
+        with transaction.atomic():
+            group_id = self._upsert_group(fingerprint, validated_data, user, stack_trace, now)
+            occurrence = ErrorLog.objects.create(
+                type=validated_data["type"],
+                endpoint=validated_data.get("endpoint"),
+                status=validated_data.get("status"),
+                message=validated_data["message"],
+                stack_trace_compressed=zlib.compress(stack_trace.encode("utf-8")) if stack_trace else None,
+                user=user,
+                group_id=group_id,
+            )
+
+        CLIENT_ERRORS_REPORTED.labels(validated_data["type"]).inc()
+        logger.debug(f"Recorded error occurrence {occurrence.id} in group {group_id}")
+        return occurrence
+
+    def _upsert_group(self, fingerprint: str, data: Dict[str, Any], user, stack_trace: Optional[str], now: datetime) -> int:
+        """Atomically bump the group's counters, creating it on first sight; returns its id"""
+        updates = dict(count=F("count") + 1, last_seen=now, last_stack_trace=stack_trace, last_user=user)
+
+        if ErrorGroup.objects.filter(fingerprint=fingerprint).update(**updates):
+            return ErrorGroup.objects.filter(fingerprint=fingerprint).values_list("id", flat=True).get()
+
+        try:
+            with transaction.atomic():
+                return ErrorGroup.objects.create(
+                    fingerprint=fingerprint,
+                    type=data["type"],
+                    endpoint=data.get("endpoint"),
+                    status=data.get("status"),
+                    message=data["message"],
+                    count=1,
+                    first_seen=now,
+                    last_seen=now,
+                    last_stack_trace=stack_trace,
+                    last_user=user,
+                ).id
+        except IntegrityError:
+            # Another request created the group in the meantime
+            ErrorGroup.objects.filter(fingerprint=fingerprint).update(**updates)
+            return ErrorGroup.objects.filter(fingerprint=fingerprint).values_list("id", flat=True).get()
+
+    def list_groups(self, error_type: Optional[str] = None, start_date: Optional[str] = None,
+                    end_date: Optional[str] = None, cursor: Optional[str] = None,
+                    limit: int = 100) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Get error groups seen within a time window, most recent first.
+
+        With a window, count, first_seen, timestamp, stack_trace and username
+        describe the group's occurrences inside it, not its lifetime. Keyset-paginated
+        on (last seen, id); returns (results, next_cursor). Raises InvalidCursorError
+        for a malformed cursor.
+        """
+        queryset = ErrorGroup.objects.select_related("last_user")
+
+        if error_type and error_type != "all":
+            queryset = queryset.filter(type=error_type)
+
+        start_dt = parse_datetime(start_date) if start_date else None
+        end_dt = parse_datetime(end_date) if end_date else None
+        in_window = Q()
+        if start_dt:
+            # A group's last occurrence is its newest, so this alone means it has one in the window
+            queryset = queryset.filter(last_seen__gte=start_dt)
+            in_window &= Q(timestamp__gte=start_dt)
+        last_field = "last_seen"
+        if end_dt:
+            queryset = queryset.filter(first_seen__lte=end_dt)
+            in_window &= Q(timestamp__lte=end_dt)
+            # The group may have occurred again since: find its last occurrence inside the window,
+            # one seek on (group, timestamp) per group
+            latest = ErrorLog.objects.filter(in_window, group=OuterRef("pk")).order_by("-timestamp", "-id")
+            queryset = queryset.annotate(
+                window_last_seen=Subquery(latest.values("timestamp")[:1]),
+                window_last_id=Subquery(latest.values("id")[:1]),
+            ).filter(window_last_seen__isnull=False)
+            last_field = "window_last_seen"
+
+        if cursor:
+            last_seen, last_id = self._decode_cursor(cursor)
+            queryset = queryset.filter(
+                Q(**{f"{last_field}__lt": last_seen}) | Q(**{last_field: last_seen, "id__lt": last_id})
+            )
+
+        groups = list(queryset.order_by(f"-{last_field}", "-id")[:limit + 1])
+        next_cursor = None
+        if len(groups) > limit:
+            last = groups[limit - 1]
+            next_cursor = self._encode_cursor(getattr(last, last_field), last.id)
+        groups = groups[:limit]
+
+        window_stats: Dict[int, Dict[str, Any]] = {}
+        last_occurrences: Dict[int, ErrorLog] = {}
+        if (start_dt or end_dt) and groups:
+            # Only the groups shown are counted, from the (group, timestamp) index
+            window_stats = {
+                row["group_id"]: row
+                for row in ErrorLog.objects.filter(in_window, group_id__in=[group.id for group in groups])
+                .values("group_id").annotate(count=Count("id"), first_seen=Min("timestamp")).order_by()
+            }
+        if end_dt:
+            outdated = [group.window_last_id for group in groups if group.window_last_seen != group.last_seen]
+            if outdated:
+                last_occurrences = ErrorLog.objects.select_related("user").in_bulk(outdated)
+
+        results = []
+        for group in groups:
+            stats = window_stats.get(group.id)
+            occurrence = last_occurrences.get(getattr(group, "window_last_id", None))
+            if occurrence is not None:
+                stack_trace, user = occurrence.full_stack_trace, occurrence.user
+            else:
+                stack_trace, user = group.last_stack_trace, group.last_user
+            results.append({
+                "id": group.id,
+                "type": group.type,
+                "endpoint": group.endpoint or "",
+                "status": group.status or "",
+                "message": group.message,
+                "stack_trace": stack_trace or "",
+                "username": user.username if user else None,
+                "timestamp": getattr(group, last_field),
+                "first_seen": stats["first_seen"] if stats else group.first_seen,
+                "count": stats["count"] if stats else group.count,
+            })
+        return results, next_cursor
+
+    def _encode_cursor(self, last_seen: datetime, group_id: int) -> str:
+        raw = f"{last_seen.isoformat()}|{group_id}"
+        return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+    def _decode_cursor(self, cursor: str) -> Tuple[datetime, int]:
+        try:
+            raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+            last_seen, last_id = raw.rsplit("|", 1)
+            parsed = datetime.fromisoformat(last_seen)
+            return parsed, int(last_id)
+        except (ValueError, UnicodeError) as e:
+            raise InvalidCursorError(f"Invalid cursor: {cursor}") from e
+
+    def prune(self, retention_days: int = ERROR_LOG_RETENTION_DAYS, prune_groups: bool = False) -> Dict[str, int]:
+        """Delete raw occurrences older than the retention (and optionally stale groups)"""
+        cutoff = timezone.now() - timedelta(days=retention_days)
+        deleted_logs, _ = ErrorLog.objects.filter(timestamp__lt=cutoff).delete()
+        deleted_groups = 0
+        if prune_groups:
+            _, deleted = ErrorGroup.objects.filter(last_seen__lt=cutoff).delete()
+            deleted_groups = deleted.get(ErrorGroup._meta.label, 0)
+        logger.info(f"Pruned {deleted_logs} error occurrences and {deleted_groups} groups older than {cutoff}")
+        return {"occurrences": deleted_logs, "groups": deleted_groups}
+
+
+service = ErrorLogService()
+
+
+def get_error_log_service() -> ErrorLogService:
+    """
+    Factory and Singleton method to get the ErrorLogService instance.
+
+    Returns:
+        ErrorLogService: The singleton instance of ErrorLogService
+    """
+    return service
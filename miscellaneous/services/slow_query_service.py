@@ -0,0 +1,127 @@
+import logging
+from typing import Any, Dict, List
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from helpers.abstract import AbstractService
+from miscellaneous.models import SlowQuery
+
+logger = logging.getLogger(__name__)
+
+ORDERINGS = {
+    "total": "-total_seconds",
+    "max": "-max_seconds",
+    "count": "-count",
+    "recent": "-last_seen",
+    "cancelled": "-cancelled_count",
+}
+
+
+class SlowQueryService(AbstractService):
+    """Service class for the per-fingerprint slow query statistics"""
+
+    def record_query(self, entry: Dict[str, Any], elapsed: float, cancelled: bool = False) -> None:
+        """
+        Fold one slow execution (an entry logged by helpers.slow_queries) into its
+        fingerprint's row; cancelled marks one aborted at its request's deadline.
+        """
+        now = timezone.now()
+        updates = dict(
+            count=F("count") + 1,
+            cancelled_count=F("cancelled_count") + int(cancelled),
+            total_seconds=F("total_seconds") + elapsed,
+            max_seconds=Greatest(F("max_seconds"), elapsed),
+            last_seen=now,
+            example_sql=entry["example_sql"],
+            example_params=entry["params"],
+        )
+        # A completed execution names its caller reliably; a cancelled one only sets it on a new row
+        if not cancelled:
+            updates["caller"] = entry["caller"][:255]
+        # The plan is only captured on a process's first sighting of the fingerprint
+        if entry["plan"] is not None:
+            updates.update(plan=entry["plan"], scanned_tables=",".join(entry["scanned_tables"])[:255],
+                           prices_full_scan=entry["prices_full_scan"])
+
+        if SlowQuery.objects.filter(fingerprint=entry["fingerprint"]).update(**updates):
+            return
+
+        try:
+            with transaction.atomic():
+                SlowQuery.objects.create(
+                    fingerprint=entry["fingerprint"],
+                    sql=entry["sql"],
+                    example_sql=entry["example_sql"],
+                    example_params=entry["params"],
+                    caller=entry["caller"][:255],
+                    plan=entry["plan"] or "",
+                    scanned_tables=",".join(entry["scanned_tables"])[:255],
+                    prices_full_scan=entry["prices_full_scan"],
+                    count=1,
+                    cancelled_count=int(cancelled),
+                    total_seconds=elapsed,
+                    max_seconds=elapsed,
+                    first_seen=now,
+                    last_seen=now,
+                )
+        except IntegrityError:
+            # Another process created the row in the meantime
+            SlowQuery.objects.filter(fingerprint=entry["fingerprint"]).update(**updates)
+
+    def list_queries(self, order: str = "total", flagged_only: bool = False, limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        Slow query fingerprints with their aggregate timings, worst first.
+
+        Raises ValueError for an unknown order.
+        """
+        if order not in ORDERINGS:
+            raise ValueError(f"order must be one of {', '.join(ORDERINGS)}")
+
+        queryset = SlowQuery.objects.all()
+        if order == "cancelled":
+            queryset = queryset.filter(cancelled_count__gt=0)
+        if flagged_only:
+            queryset = queryset.filter(prices_full_scan=True)
+
+        return [
+            {
+                "fingerprint": query.fingerprint,
+                "sql": query.sql,
+                "example_sql": query.example_sql,
+                "example_params": query.example_params,
+                "caller": query.caller,
+                "plan": query.plan.splitlines(),
+                "scanned_tables": query.scanned_tables.split(",") if query.scanned_tables else [],
+                "prices_full_scan": query.prices_full_scan,
+                "count": query.count,
+                "cancelled": query.cancelled_count,
+                "total_ms": round(query.total_seconds * 1000, 2),
+                "mean_ms": round(query.mean_seconds * 1000, 2),
+                "max_ms": round(query.max_seconds * 1000, 2),
+                "first_seen": query.first_seen,
+                "last_seen": query.last_seen,
+            }
+            for query in queryset.order_by(ORDERINGS[order], "id")[:limit]
+        ]
+
+    def reset(self) -> int:
+        """Forget all collected statistics; returns the number of fingerprints removed"""
+        deleted, _ = SlowQuery.objects.all().delete()
+        logger.info(f"Cleared {deleted} slow query fingerprints")
+        return deleted
+
+
+service = SlowQueryService()
+
+
+def get_slow_query_service() -> SlowQueryService:
+    """
+    Factory and Singleton method to get the SlowQueryService instance.
+
+    Returns:
+        SlowQueryService: The singleton instance of SlowQueryService
+    """
+    return service
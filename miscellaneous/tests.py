@@ -1,3 +1,164 @@
-from django.test import TestCase
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from helpers import profiling, tracing
+from helpers.memory_profiling import get_memory_profiler
+from helpers.testing import EndpointCase, QueryBudgetMixin
+from miscellaneous.services.error_log_service import get_error_log_service
+from miscellaneous.urls import urlpatterns
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+
+
+class MiscellaneousQueryBudgetTests(QueryBudgetMixin, TestCase):
+    urlpatterns = urlpatterns
+    cases = [
+        EndpointCase("index", "GET", "/api/", max_queries=0, authenticated=False),
+        # The in-memory test database counts as present, so this runs the real table listing
+        EndpointCase("health", "GET", "/api/health/", max_queries=1, authenticated=False),
+        # From 127.0.0.1, which METRICS_ALLOWED_IPS allows by default
+        EndpointCase("metrics", "GET", "/api/metrics/", max_queries=0, authenticated=False),
+        EndpointCase("error_log", "POST", "/api/errors/", max_queries=10, status=201,
+                     data={"type": "frontend", "message": "boom", "endpoint": "/x", "status": 500}),
+        EndpointCase("error_log", "GET", "/api/errors/", max_queries=3, max_scans=1),
+
+        # Staff endpoints: the permission check for a regular user, then the endpoint itself
+        EndpointCase("slow_queries", "GET", "/api/slow-queries/", max_queries=2, status=403),
+        EndpointCase("slow_queries", "GET", "/api/slow-queries/?order=max", max_queries=3, max_scans=1, staff=True),
+        EndpointCase("slow_queries", "GET", "/api/slow-queries/?order=nope", max_queries=2, staff=True, status=400),
+        EndpointCase("profiles", "GET", "/api/profiles/", max_queries=2, staff=True),
+        EndpointCase("flame_graph", "GET", "/api/profiles/flamegraph/", max_queries=2, staff=True),
+        EndpointCase("profile_detail", "GET", "/api/profiles/{profile_id}/?summary=true", max_queries=2, staff=True),
+        EndpointCase("profile_detail", "GET", "/api/profiles/missing/", max_queries=2, staff=True, status=404),
+        EndpointCase("memory", "GET", "/api/memory/?objects=false", max_queries=2, staff=True),
+        EndpointCase("memory_snapshot", "GET", "/api/memory/snapshots/{snapshot_id}/", max_queries=2, staff=True),
+        EndpointCase("memory_snapshot", "GET", "/api/memory/snapshots/0/", max_queries=2, staff=True, status=404),
+        EndpointCase("memory_diff", "GET", "/api/memory/diff/?from={snapshot_id}", max_queries=2, staff=True),
+        EndpointCase("traces", "GET", "/api/traces/", max_queries=2, staff=True),
+        EndpointCase("trace_detail", "GET", "/api/traces/{trace_id}/", max_queries=2, staff=True),
+        EndpointCase("trace_detail", "GET", "/api/traces/missing/", max_queries=2, staff=True, status=404),
+        EndpointCase("trace_waterfall", "GET", "/api/traces/{trace_id}/view/", max_queries=2, staff=True),
+    ]
+
+    def setUp(self):
+        super().setUp()
+        _, data = profiling.profile_call("cprofile", sorted, [3, 1, 2])
+        self.profile_id = profiling.save_profile("cprofile", data, {"method": "GET", "path": "/api/"})
+        self.addCleanup(profiling.delete_profile, self.profile_id)
+
+        trace = tracing.Trace(trace_id=TRACE_ID)
+        # Fixed span ids, so writing the trace again in the next test replaces it
+        root = tracing.Span(trace, "GET /api/", "server", None, span_id="00f067aa0ba902b7", duration_us=1500)
+        trace.spans += [tracing.Span(trace, "db", "client", root.span_id, span_id="00f067aa0ba902b8",
+                                     duration_us=300), root]
+        tracing.get_exporter().write([trace])
+
+        profiler = get_memory_profiler()
+        profiler.start(1)
+        self.addCleanup(profiler.stop)
+        self.snapshot_id = profiler.snapshot("budget").id
+
+    def path_params(self):
+        return {**super().path_params(), "profile_id": self.profile_id, "trace_id": TRACE_ID,
+                "snapshot_id": self.snapshot_id}
+
+    def test_staff_endpoints_return_the_stored_data(self):
+        client = APIClient()
+        client.force_login(self.staff_user)
+
+        traces = client.get("/api/traces/", secure=True).json()
+        self.assertEqual([(entry["trace_id"], entry["spans"]) for entry in traces], [(TRACE_ID, 2)])
+        spans = client.get(f"/api/traces/{TRACE_ID}/", secure=True).json()["spans"]
+        self.assertEqual([span["name"] for span in spans], ["GET /api/", "db"])
+
+        profiles = client.get("/api/profiles/", secure=True).json()
+        self.assertIn(self.profile_id, [profile["id"] for profile in profiles])
+        summary = client.get(f"/api/profiles/{self.profile_id}/?summary=true", secure=True)
+        self.assertIn(b"function calls", summary.content)
+
+        snapshot = client.get(f"/api/memory/snapshots/{self.snapshot_id}/", secure=True).json()
+        self.assertEqual((snapshot["id"], snapshot["label"]), (self.snapshot_id, "budget"))
+
+
+@override_settings(METRICS_ALLOWED_IPS=["10.0.0.5"], METRICS_TOKEN="scrape-secret")
+class MetricsAccessTests(TestCase):
+    def scrape(self, remote_addr, **headers):
+        return APIClient().get("/api/metrics/", secure=True, REMOTE_ADDR=remote_addr, **headers).status_code
+
+    def test_allowed_addresses_scrape_without_a_token(self):
+        self.assertEqual(self.scrape("10.0.0.5"), 200)
+
+    def test_other_addresses_need_the_token(self):
+        self.assertEqual(self.scrape("203.0.113.9"), 403)
+        self.assertEqual(self.scrape("203.0.113.9", HTTP_AUTHORIZATION="Bearer wrong"), 403)
+        # A forwarded address is the client's claim, not where the request came from
+        self.assertEqual(self.scrape("203.0.113.9", HTTP_X_FORWARDED_FOR="10.0.0.5"), 403)
+        self.assertEqual(self.scrape("203.0.113.9", HTTP_AUTHORIZATION="Bearer scrape-secret"), 200)
+
+    @override_settings(METRICS_TOKEN="")
+    def test_an_empty_token_admits_no_one(self):
+        self.assertEqual(self.scrape("203.0.113.9", HTTP_AUTHORIZATION="Bearer "), 403)
+
+
+class ErrorGroupWindowTests(TestCase):
+    START = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user("alice")
+        cls.bob = User.objects.create_user("bob")
+        # "boom" on days 0-4 (the last by bob, the others by alice), "bang" on days 1 and 3
+        cls.record("boom", 0, cls.alice)
+        cls.record("bang", 1, cls.alice)
+        cls.record("boom", 2, cls.alice)
+        cls.record("bang", 3, cls.alice)
+        cls.record("boom", 3, cls.alice)
+        cls.record("boom", 4, cls.bob)
+
+    @classmethod
+    def record(cls, message, day, user):
+        with mock.patch("django.utils.timezone.now", return_value=cls.START + timedelta(days=day)):
+            get_error_log_service().record_error({"type": "frontend", "message": message, "user": user,
+                                                  "stack_trace": f"{message} on day {day}"})
+
+    def day(self, day):
+        return (self.START + timedelta(days=day, hours=1)).isoformat()
+
+    def summary(self, results):
+        return [(group["message"], group["count"], group["first_seen"].day, group["timestamp"].day,
+                 group["stack_trace"], group["username"]) for group in results]
+
+    def test_without_a_window_groups_cover_their_lifetime(self):
+        results, cursor = get_error_log_service().list_groups()
+        self.assertIsNone(cursor)
+        self.assertEqual(self.summary(results), [("boom", 4, 1, 5, "boom on day 4", "bob"),
+                                                 ("bang", 2, 2, 4, "bang on day 3", "alice")])
+
+    def test_window_describes_the_occurrences_inside_it(self):
+        # Day 1 through day 2: "boom" occurred again afterwards, which must not show
+        with self.assertNumQueries(3):
+            results, cursor = get_error_log_service().list_groups(start_date=self.day(0), end_date=self.day(2))
+        self.assertIsNone(cursor)
+        self.assertEqual(self.summary(results), [("boom", 1, 3, 3, "boom on day 2", "alice"),
+                                                 ("bang", 1, 2, 2, "bang on day 1", "alice")])
+
+        results, _ = get_error_log_service().list_groups(start_date=self.day(2))
+        self.assertEqual(self.summary(results), [("boom", 2, 4, 5, "boom on day 4", "bob"),
+                                                 ("bang", 1, 4, 4, "bang on day 3", "alice")])
+
+        results, _ = get_error_log_service().list_groups(end_date=self.day(0))
+        self.assertEqual(self.summary(results), [("boom", 1, 1, 1, "boom on day 0", "alice")])
+
+    def test_windowed_pages(self):
+        service = get_error_log_service()
+        window = {"start_date": self.day(-1), "end_date": self.day(3)}
+        # Both were last seen at the same moment inside the window; the newer group comes first
+        first, cursor = service.list_groups(limit=1, **window)
+        self.assertEqual(self.summary(first), [("bang", 2, 2, 4, "bang on day 3", "alice")])
+        second, cursor = service.list_groups(limit=1, cursor=cursor, **window)
+        self.assertIsNone(cursor)
+        self.assertEqual(self.summary(second), [("boom", 3, 1, 4, "boom on day 3", "alice")])
@@ -1,9 +1,24 @@
 from django.urls import path
 
-from miscellaneous.views import ApiIndexView, HealthView, ErrorLogView
+from miscellaneous.views import (
+    ApiIndexView, HealthView, MetricsView, ErrorLogView, SlowQueryView,
+    ProfileListView, ProfileDetailView, FlameGraphView, MemoryView, MemorySnapshotView, MemoryDiffView,
+    TraceListView, TraceDetailView, TraceWaterfallView,
+)
 
 urlpatterns = [
     path("", ApiIndexView.as_view(), name="index"),
     path("health/", HealthView.as_view(), name="health"),
-    path("errors/", ErrorLogView.as_view(), name="error_log")
+    path("metrics/", MetricsView.as_view(), name="metrics"),
+    path("errors/", ErrorLogView.as_view(), name="error_log"),
+    path("slow-queries/", SlowQueryView.as_view(), name="slow_queries"),
+    path("profiles/", ProfileListView.as_view(), name="profiles"),
+    path("profiles/flamegraph/", FlameGraphView.as_view(), name="flame_graph"),
+    path("profiles/<str:profile_id>/", ProfileDetailView.as_view(), name="profile_detail"),
+    path("memory/", MemoryView.as_view(), name="memory"),
+    path("memory/snapshots/<int:snapshot_id>/", MemorySnapshotView.as_view(), name="memory_snapshot"),
+    path("memory/diff/", MemoryDiffView.as_view(), name="memory_diff"),
+    path("traces/", TraceListView.as_view(), name="traces"),
+    path("traces/<str:trace_id>/", TraceDetailView.as_view(), name="trace_detail"),
+    path("traces/<str:trace_id>/view/", TraceWaterfallView.as_view(), name="trace_waterfall"),
 ]
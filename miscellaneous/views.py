@@ -1,15 +1,29 @@
+import hmac
+import logging
 import os
+import re
 from pathlib import Path
 
 from django.conf import settings
 from django.db import connection
-from django.db.models import Count, Max
-from rest_framework import status
+from django.http import FileResponse, HttpResponse
+from django.shortcuts import render
+from rest_framework import permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from miscellaneous.models import ErrorLog
+from helpers import profiling, tracing
+from helpers.memory_profiling import (
+    GROUPINGS, SnapshotNotFoundError, TracingNotStartedError, get_memory_profiler,
+)
+from helpers.metrics import render_prometheus
+from helpers.write_queue import get_write_queue
+from marketdata.services.market_data_service import get_marketdata_service
 from miscellaneous.seriazliers import ErrorLogSerializer
+from miscellaneous.services.error_log_service import get_error_log_service, InvalidCursorError
+from miscellaneous.services.slow_query_service import get_slow_query_service
+
+logger = logging.getLogger(__name__)
 
 
 class ApiIndexView(APIView):
@@ -23,6 +37,7 @@ class ApiIndexView(APIView):
                 "status": "ok",
                 "endpoints": {
                     "health": f"{base}health/",
+                    "metrics": f"{base}metrics/",
                     "exchanges": f"{base}exchanges/",
                     "tickers": f"{base}tickers/",
                     "candles": f"{base}candles/<symbol>/",
@@ -39,8 +54,9 @@ class HealthView(APIView):
 
     def get(self, request):
 
-        db_path = settings.CRYPTO_DB_PATH
-        db_exists = os.path.exists(db_path) if db_path else False
+        db_path = connection.settings_dict["NAME"]
+        # An in-memory database (as under tests) exists as long as the connection does
+        db_exists = bool(db_path) and (connection.creation.is_in_memory_db(db_path) or os.path.exists(db_path))
 
         tables = []
         table_exists = False
@@ -70,81 +86,288 @@ class HealthView(APIView):
         return Response(payload)
 
 
+class IsMetricsScraper(permissions.BasePermission):
+    """Clients in METRICS_ALLOWED_IPS, or any client sending METRICS_TOKEN as a bearer token"""
+
+    def has_permission(self, request, view):
+        # REMOTE_ADDR rather than X-Forwarded-For, which the client controls
+        if request.META.get("REMOTE_ADDR", "") in settings.METRICS_ALLOWED_IPS:
+            return True
+        scheme, _, token = request.META.get("HTTP_AUTHORIZATION", "").partition(" ")
+        return bool(settings.METRICS_TOKEN) and scheme.lower() == "bearer" and hmac.compare_digest(
+            token.strip().encode(), settings.METRICS_TOKEN.encode()
+        )
+
+
+class MetricsView(APIView):
+    """Prometheus scrape endpoint, aggregated over all worker processes"""
+    authentication_classes: list = []
+    permission_classes = [IsMetricsScraper]
+
+    def get(self, request):
+        return HttpResponse(render_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 class ErrorLogView(APIView):
 
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.error_log_service = get_error_log_service()
+
     def post(self, request):
-        print(f"DEBUG: ErrorLogView POST received. User: {request.user}, Auth: {request.auth}")
-        print(f"DEBUG: Request data: {request.data}")
         data = request.data.copy()
         if request.user.is_authenticated:
             data['user'] = request.user.id
 
         serializer = ErrorLogSerializer(data=data)
         if serializer.is_valid():
-            serializer.save()
-            print("DEBUG: Error saved successfully")
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        print(f"DEBUG: Serializer errors: {serializer.errors}")
+            occurrence = get_write_queue().run(self.error_log_service.record_error, serializer.validated_data)
+            return Response(ErrorLogSerializer(occurrence).data, status=status.HTTP_201_CREATED)
+        logger.debug(f"Rejected error log: {serializer.errors}")
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def get(self, request):
+        """
+        Error groups, most recently seen first, one page at a time.
+
+        The body is still a plain list of groups, but it holds at most `limit`
+        (default 100, max 500) of them rather than every group. When more
+        remain, the X-Next-Cursor header carries the value to send back as
+        `cursor` for the next page; no header means this is the last page.
+        """
         if not request.user.is_authenticated:
             return Response({"error": "Unauthorized"}, status=status.HTTP_403_FORBIDDEN)
 
-        error_type = request.query_params.get('type')
-        start_date = request.query_params.get('start_date')
-        end_date = request.query_params.get('end_date')
+        limit = get_marketdata_service().clamp_limit(
+            request.query_params.get('limit'),
+            default=100,
+            max_value=500
+        )
+
+        try:
+            results, next_cursor = self.error_log_service.list_groups(
+                error_type=request.query_params.get('type'),
+                start_date=request.query_params.get('start_date'),
+                end_date=request.query_params.get('end_date'),
+                cursor=request.query_params.get('cursor'),
+                limit=limit,
+            )
+        except (InvalidCursorError, ValueError) as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        queryset = ErrorLog.objects.all()
+        response = Response(results)
+        if next_cursor:
+            response['X-Next-Cursor'] = next_cursor
+        return response
 
-        if error_type and error_type != 'all':
-            queryset = queryset.filter(type=error_type)
 
-        if start_date:
-            try:
-                from django.utils.dateparse import parse_datetime
-                start_dt = parse_datetime(start_date)
-                if start_dt:
-                    queryset = queryset.filter(timestamp__gte=start_dt)
-            except:
-                pass
-
-        if end_date:
-            try:
-                from django.utils.dateparse import parse_datetime
-                end_dt = parse_datetime(end_date)
-                if end_dt:
-                    queryset = queryset.filter(timestamp__lte=end_dt)
-            except:
-                pass
-
-        aggregated = queryset.values(
-            'type', 'endpoint', 'status', 'message'
-        ).annotate(
-            count=Count('id'),
-            last_occurrence=Max('timestamp'),
-            error_id=Max('id')
-        ).order_by('-last_occurrence')
-
-        results = []
-        for item in aggregated:
-            error = ErrorLog.objects.filter(
-                type=item['type'],
-                endpoint=item['endpoint'],
-                status=item['status'],
-                message=item['message']
-            ).order_by('-timestamp').first()
-
-            results.append({
-                'id': item['error_id'],
-                'type': item['type'],
-                'endpoint': item['endpoint'] or '',
-                'status': item['status'] or '',
-                'message': item['message'],
-                'stack_trace': error.stack_trace if error else '',
-                'username': error.user.username if error and error.user else None,
-                'timestamp': item['last_occurrence'],
-                'count': item['count']
-            })
+class SlowQueryView(APIView):
+    """Staff-only aggregate statistics from the slow query log (see helpers.slow_queries)"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.slow_query_service = get_slow_query_service()
 
+    def get(self, request):
+        limit = get_marketdata_service().clamp_limit(
+            request.query_params.get('limit'),
+            default=50,
+            max_value=500
+        )
+        try:
+            results = self.slow_query_service.list_queries(
+                order=request.query_params.get('order', 'total'),
+                flagged_only=request.query_params.get('flagged', 'false').lower() == 'true',
+                limit=limit,
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         return Response(results)
+
+    def delete(self, request):
+        deleted = get_write_queue().run(self.slow_query_service.reset)
+        return Response({"deleted": deleted})
+
+
+class ProfileListView(APIView):
+    """Staff-only list of stored request profiles, newest first (see helpers.profiling)"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(profiling.list_profiles())
+
+
+class ProfileDetailView(APIView):
+    """Download one stored profile (?summary=true for a pstats report of a cProfile profile), or delete it"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, profile_id):
+        profile = profiling.get_profile(profile_id)
+        if profile is None:
+            return Response({"error": "Profile not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        if request.query_params.get('summary', 'false').lower() == 'true' and profile["mode"] == "cprofile":
+            return HttpResponse(profiling.profile_summary(profile["path"]), content_type="text/plain; charset=utf-8")
+        return FileResponse(open(profile["path"], "rb"), as_attachment=True, filename=profile["path"].name)
+
+    def delete(self, request, profile_id):
+        if profiling.get_profile(profile_id) is None:
+            return Response({"error": "Profile not found"}, status=status.HTTP_404_NOT_FOUND)
+        profiling.delete_profile(profile_id)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class FlameGraphView(APIView):
+    """
+    Continuous profiling samples. Without ?endpoint= lists the sampled endpoints;
+    with it returns that endpoint's folded stacks for flamegraph.pl or speedscope.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        data = profiling.flame_graph_data()
+        endpoint = request.query_params.get('endpoint')
+        if not endpoint:
+            return Response(sorted(
+                ({"endpoint": name, "samples": sum(stacks.values())} for name, stacks in data.items()),
+                key=lambda entry: entry["samples"], reverse=True,
+            ))
+        if endpoint not in data:
+            return Response({"error": "No samples for this endpoint"}, status=status.HTTP_404_NOT_FOUND)
+        return HttpResponse(profiling.folded(data[endpoint]), content_type="text/plain; charset=utf-8")
+
+
+class MemoryView(APIView):
+    """
+    Staff-only memory status of the worker serving the request (see helpers.memory_profiling).
+
+    GET returns RSS, traced memory, stored snapshots, cache sizes and live object counts
+    (?objects=false skips the count, which walks every object). POST {"action": ...}
+    with "start" (optional "frames"), "stop" or "snapshot" (optional "label").
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.memory_profiler = get_memory_profiler()
+
+    def get(self, request):
+        include_objects = request.query_params.get('objects', 'true').lower() != 'false'
+        return Response(self.memory_profiler.status(include_objects=include_objects))
+
+    def post(self, request):
+        action = request.data.get('action')
+        if action == 'start':
+            frames = request.data.get('frames')
+            if frames is not None and (not isinstance(frames, int) or not 1 <= frames <= 100):
+                return Response({"error": "frames must be an integer between 1 and 100"},
+                                status=status.HTTP_400_BAD_REQUEST)
+            self.memory_profiler.start(frames)
+        elif action == 'stop':
+            self.memory_profiler.stop()
+        elif action == 'snapshot':
+            try:
+                snapshot = self.memory_profiler.snapshot(str(request.data.get('label', ''))[:100])
+            except TracingNotStartedError as e:
+                return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+            return Response(snapshot.describe(), status=status.HTTP_201_CREATED)
+        else:
+            return Response({"error": "action must be start, stop or snapshot"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.memory_profiler.status(include_objects=False))
+
+
+def _memory_report_params(request):
+    group_by = request.query_params.get('group_by', 'lineno')
+    if group_by not in GROUPINGS:
+        raise ValueError(f"group_by must be one of {', '.join(GROUPINGS)}")
+    limit = get_marketdata_service().clamp_limit(request.query_params.get('limit'), default=25, max_value=200)
+    return group_by, limit
+
+
+class MemorySnapshotView(APIView):
+    """Top allocation sites of a stored snapshot (?group_by=lineno|filename|module|traceback&limit=)"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, snapshot_id):
+        try:
+            group_by, limit = _memory_report_params(request)
+            stored = get_memory_profiler().get(snapshot_id)
+            sites = get_memory_profiler().top(snapshot_id, group_by=group_by, limit=limit)
+        except SnapshotNotFoundError as e:
+            return Response({"error": str(e)}, status=status.HTTP_404_NOT_FOUND)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({**stored.describe(), "pid": os.getpid(), "group_by": group_by, "sites": sites})
+
+
+class MemoryDiffView(APIView):
+    """Growth between two snapshots, ?from=<id>&to=<id> (to defaults to memory now), largest first"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        try:
+            group_by, limit = _memory_report_params(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            from_id = int(request.query_params.get('from', ''))
+            to_id = int(request.query_params['to']) if request.query_params.get('to') else None
+        except ValueError:
+            return Response({"error": "from and to must be snapshot ids"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            sites = get_memory_profiler().diff(from_id, to_id, group_by=group_by, limit=limit)
+        except SnapshotNotFoundError as e:
+            return Response({"error": str(e)}, status=status.HTTP_404_NOT_FOUND)
+        except TracingNotStartedError as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+        return Response({"pid": os.getpid(), "from": from_id, "to": to_id, "group_by": group_by, "sites": sites})
+
+
+def _trace_spans(trace_id):
+    """A stored trace's spans, or None for an unknown or malformed trace id"""
+    if not re.fullmatch(r"[0-9a-f]{32}", trace_id):
+        return None
+    return tracing.get_exporter().get_trace(trace_id) or None
+
+
+class TraceListView(APIView):
+    """Staff-only list of recent traces (root spans), ?min_ms= and ?name= to filter (see helpers.tracing)"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        limit = get_marketdata_service().clamp_limit(
+            request.query_params.get('limit'),
+            default=50,
+            max_value=500
+        )
+        try:
+            min_ms = float(request.query_params.get('min_ms', 0))
+        except ValueError:
+            return Response({"error": "min_ms must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(tracing.get_exporter().recent_traces(
+            limit=limit, min_duration_ms=min_ms, name=request.query_params.get('name'),
+        ))
+
+
+class TraceDetailView(APIView):
+    """Every span of one trace, in start order"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, trace_id):
+        spans = _trace_spans(trace_id)
+        if spans is None:
+            return Response({"error": "Trace not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"trace_id": trace_id, "spans": spans})
+
+
+class TraceWaterfallView(APIView):
+    """One trace drawn as an HTML waterfall"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, trace_id):
+        spans = _trace_spans(trace_id)
+        if spans is None:
+            return Response({"error": "Trace not found"}, status=status.HTTP_404_NOT_FOUND)
+        return render(request, "trace_waterfall.html", {"trace_id": trace_id, "spans": tracing.waterfall(spans)})
@@ -8,7 +8,20 @@ from helpers.env_variables import (
     DB_NAME, ALLOWED_HOSTS, EMAIL_HOST, EMAIL_PORT,
     EMAIL_USE_TLS, EMAIL_HOST_USER, EMAIL_HOST_PASSWORD, DEFAULT_FROM_EMAIL,
     CORS_ALLOWED_ORIGINS,
-    CSRF_TRUSTED_ORIGINS
+    CSRF_TRUSTED_ORIGINS,
+    SESSION_ENGINE, SESSION_ACTIVITY_GRANULARITY_SECONDS, SHARED_STORE_PATH,
+    SERVER_TIMING_SAMPLE_RATE, METRICS_DIR, METRICS_ALLOWED_IPS, METRICS_TOKEN,
+    SLOW_QUERY_LOG_ENABLED, SLOW_QUERY_THRESHOLD_MS, SLOW_QUERY_LOG_PARAMS,
+    PROFILING_ENABLED, PROFILING_CONTINUOUS, PROFILING_SAMPLE_INTERVAL_MS, PROFILING_CONTINUOUS_INTERVAL_MS,
+    PROFILING_FLUSH_SECONDS, PROFILING_MAX_PROFILES, PROFILES_DIR,
+    MEMORY_TRACING_ENABLED, MEMORY_TRACE_FRAMES, MEMORY_MAX_SNAPSHOTS, MEMORY_SAMPLER_INTERVAL_SECONDS,
+    TRACING_ENABLED, TRACE_SAMPLE_RATE, TRACE_TRUST_PARENT_SAMPLING, TRACES_PATH, TRACE_RETENTION_HOURS,
+    REQUEST_DEADLINE_DEFAULT_SECONDS, REQUEST_DEADLINE_ANALYSIS_SECONDS, REQUEST_DEADLINE_PREDICTION_SECONDS,
+    UPSTREAM_TIMEOUT_SECONDS, DB_PROGRESS_HANDLER_OPS,
+    UPSTREAM_EJECT_AFTER_FAILURES, UPSTREAM_EJECT_SECONDS, UPSTREAM_HEDGING_ENABLED, UPSTREAM_HEDGE_MIN_DELAY_MS,
+    ADMISSION_CONTROL_ENABLED, ADMISSION_PREDICTION_CLIENT_PER_MINUTE, ADMISSION_PREDICTION_GLOBAL_PER_MINUTE,
+    ADMISSION_ANALYSIS_CLIENT_PER_MINUTE, ADMISSION_ANALYSIS_GLOBAL_PER_MINUTE, ADMISSION_MAX_QUEUE_SECONDS,
+    ADMISSION_MAX_IN_FLIGHT, ADMISSION_MAX_QUEUED
 )
 
 BASE_DIR = Path(__file__).resolve().parent.parent  # backend
@@ -34,6 +47,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "marketdata.middleware.TracingMiddleware",
+    "marketdata.middleware.MetricsMiddleware",
+    "marketdata.middleware.RequestTimingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
@@ -43,6 +59,10 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "marketdata.middleware.SessionTimeoutMiddleware",
+    "marketdata.middleware.DeadlineMiddleware",
+    "marketdata.middleware.ProfilingMiddleware",
+    "marketdata.middleware.MemoryProfilingMiddleware",
+    "marketdata.middleware.TracingViewMiddleware",
 ]
 
 ROOT_URLCONF = "prototype_backend.urls"
@@ -77,11 +97,85 @@ DATABASES = {
     }
 }
 
+# Separate SQLite file for process-safe counters (login lockouts, rate limits)
+SHARED_STORE_PATH = BASE_DIR / SHARED_STORE_PATH
+
+# Per-process metric files summed by /api/metrics/ (clear on deploy)
+METRICS_DIR = BASE_DIR / METRICS_DIR
+# Scrapers allowed by client address, or by bearer token (empty disables the token)
+METRICS_ALLOWED_IPS = [ip.strip() for ip in METRICS_ALLOWED_IPS if ip.strip()]
+METRICS_TOKEN = METRICS_TOKEN
+
+# Points SHARED_STORE_PATH, METRICS_DIR, PROFILES_DIR and TRACES_PATH at a
+# temporary directory for the test run, so tests never share state with dev/prod
+TEST_RUNNER = "helpers.testing.IsolatedStateTestRunner"
+
+# Stored request profiles and continuous flame graph samples (see helpers.profiling)
+PROFILES_DIR = BASE_DIR / PROFILES_DIR
+PROFILING_ENABLED = PROFILING_ENABLED
+PROFILING_CONTINUOUS = PROFILING_CONTINUOUS
+PROFILING_SAMPLE_INTERVAL_MS = PROFILING_SAMPLE_INTERVAL_MS
+PROFILING_CONTINUOUS_INTERVAL_MS = PROFILING_CONTINUOUS_INTERVAL_MS
+PROFILING_FLUSH_SECONDS = PROFILING_FLUSH_SECONDS
+PROFILING_MAX_PROFILES = PROFILING_MAX_PROFILES
+
+# tracemalloc snapshots and the background memory sampler (see helpers.memory_profiling)
+MEMORY_TRACING_ENABLED = MEMORY_TRACING_ENABLED
+MEMORY_TRACE_FRAMES = MEMORY_TRACE_FRAMES
+MEMORY_MAX_SNAPSHOTS = MEMORY_MAX_SNAPSHOTS
+MEMORY_SAMPLER_INTERVAL_SECONDS = MEMORY_SAMPLER_INTERVAL_SECONDS
+
+# Request tracing and its local span store (see helpers.tracing)
+TRACING_ENABLED = TRACING_ENABLED
+TRACE_SAMPLE_RATE = TRACE_SAMPLE_RATE
+TRACE_TRUST_PARENT_SAMPLING = TRACE_TRUST_PARENT_SAMPLING
+TRACES_PATH = BASE_DIR / TRACES_PATH
+TRACE_RETENTION_HOURS = TRACE_RETENTION_HOURS
+
+# Time budget per route class (seconds, 0 = none), see helpers.deadlines.
+# Routes are matched by URL name; anything not listed is "default"
+REQUEST_DEADLINES = {
+    "default": REQUEST_DEADLINE_DEFAULT_SECONDS,
+    "analysis": REQUEST_DEADLINE_ANALYSIS_SECONDS,
+    "prediction": REQUEST_DEADLINE_PREDICTION_SECONDS,
+}
+REQUEST_DEADLINE_ROUTES = {
+    "technical_analysis": "analysis",
+    "sentiment_onchain_analysis": "analysis",
+    "lstm_prediction": "prediction",
+}
+UPSTREAM_TIMEOUT_SECONDS = UPSTREAM_TIMEOUT_SECONDS
+# A running query is aborted once its request's deadline passes; checked every this many SQLite VM instructions
+DB_PROGRESS_HANDLER_OPS = DB_PROGRESS_HANDLER_OPS
+
+# Microservice replicas: passive ejection of failing ones and hedged idempotent calls (see helpers.load_balancer)
+UPSTREAM_EJECT_AFTER_FAILURES = UPSTREAM_EJECT_AFTER_FAILURES
+UPSTREAM_EJECT_SECONDS = UPSTREAM_EJECT_SECONDS
+UPSTREAM_HEDGING_ENABLED = UPSTREAM_HEDGING_ENABLED
+UPSTREAM_HEDGE_MIN_DELAY_MS = UPSTREAM_HEDGE_MIN_DELAY_MS
+
+# Cost budgets of expensive endpoints per scope, in cost units per minute (see helpers.admission)
+ADMISSION_CONTROL_ENABLED = ADMISSION_CONTROL_ENABLED
+ADMISSION_BUDGETS = {
+    "prediction": {"client": ADMISSION_PREDICTION_CLIENT_PER_MINUTE, "global": ADMISSION_PREDICTION_GLOBAL_PER_MINUTE},
+    "analysis": {"client": ADMISSION_ANALYSIS_CLIENT_PER_MINUTE, "global": ADMISSION_ANALYSIS_GLOBAL_PER_MINUTE},
+}
+ADMISSION_MAX_QUEUE_SECONDS = ADMISSION_MAX_QUEUE_SECONDS
+ADMISSION_MAX_IN_FLIGHT = ADMISSION_MAX_IN_FLIGHT
+ADMISSION_MAX_QUEUED = ADMISSION_MAX_QUEUED
+
 # SQLite WAL mode settings (write-ahead logging - more resilient to Git operations)
 # These are set automatically via the apps.py connection_created signal
 # WAL mode creates separate .db-wal and .db-shm files that should be in .gitignore
 
 
+# Loads UserProfile together with the session user (used by avatar_url).
+# ModelBackend stays listed so sessions created before it keep resolving their user
+AUTHENTICATION_BACKENDS = [
+    "auth.backends.ProfileModelBackend",
+    "django.contrib.auth.backends.ModelBackend",
+]
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
@@ -111,6 +205,21 @@ CORS_ALLOWED_ORIGINS = CORS_ALLOWED_ORIGINS
 
 CORS_ALLOW_CREDENTIALS = True
 
+CORS_EXPOSE_HEADERS = [
+    'x-next-cursor',
+    'server-timing',
+    'x-profile-id',
+    'x-trace-id',
+]
+
+# Fraction of requests that get a Server-Timing header and a request_timing log line
+SERVER_TIMING_SAMPLE_RATE = SERVER_TIMING_SAMPLE_RATE
+
+# Queries at or over the threshold go to the "slow_queries" logger and /api/slow-queries/
+SLOW_QUERY_LOG_ENABLED = SLOW_QUERY_LOG_ENABLED
+SLOW_QUERY_THRESHOLD_MS = SLOW_QUERY_THRESHOLD_MS
+SLOW_QUERY_LOG_PARAMS = SLOW_QUERY_LOG_PARAMS
+
 CORS_ALLOW_HEADERS = [
     'accept',
     'accept-encoding',
@@ -121,13 +230,20 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'x-profile',
+    'traceparent',
+    'x-request-deadline-ms',
 ]
 
 CSRF_COOKIE_HTTPONLY = False
 # CSRF_COOKIE_SAMESITE = 'Lax'
 CSRF_TRUSTED_ORIGINS = CSRF_TRUSTED_ORIGINS
 
+SESSION_ENGINE = SESSION_ENGINE
 SESSION_COOKIE_AGE = 1800
+# SessionTimeoutMiddleware only rewrites last_activity (and so the session row)
+# when it is older than this, so read-only polling causes no session writes
+SESSION_ACTIVITY_GRANULARITY_SECONDS = SESSION_ACTIVITY_GRANULARITY_SECONDS
 SESSION_SAVE_EVERY_REQUEST = False
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False
 SESSION_COOKIE_HTTPONLY = True
@@ -141,7 +257,7 @@ SESSION_COOKIE_SECURE = True
 
 REST_FRAMEWORK = {
     "DEFAULT_RENDERER_CLASSES": [
-        "rest_framework.renderers.JSONRenderer",
+        "helpers.renderers.TimedJSONRenderer",
     ],
     "DEFAULT_PARSER_CLASSES": [
         "rest_framework.parsers.JSONParser",
@@ -150,6 +266,12 @@ REST_FRAMEWORK = {
         "rest_framework.authentication.SessionAuthentication",
     ],
     "EXCEPTION_HANDLER": "auth.exceptions.handlers.custom_auth_exception_handler",
+    # Used by helpers.throttling (views opt in with throttle_classes / throttle_scope)
+    "DEFAULT_THROTTLE_RATES": {
+        "anon": "600/min",
+        "user": "1200/min",
+        "auth": "30/min",
+    },
 }
 
 # Email Configuration